@@ -1,13 +1,15 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Callable
 import json
 from app.shared.model_service import model_service
+from app.shared.async_model_service import async_model_service
 
 class BaseAgent(ABC):
     def __init__(self, name: str, role: str):
         self.name = name
         self.role = role
         self.model_service = model_service
+        self.async_model_service = async_model_service
 
     @abstractmethod
     async def run(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
@@ -18,6 +20,13 @@ class BaseAgent(ABC):
         """Helper to call the LLM."""
         return self.model_service.generate_response(prompt, max_tokens)
 
+    async def _agenerate_response(self, prompt: str, max_tokens: int = 1000, use_cache: bool = False,
+                                  validate: Callable[[str], Any] = None) -> str:
+        """Awaitable LLM call for async agent workflows (use_cache for deterministic prompts only)."""
+        return await self.async_model_service.agenerate_response(
+            prompt, max_tokens, use_cache=use_cache, validate=validate
+        )
+
     def _parse_json(self, text: str) -> Dict[str, Any]:
         """Extract and parse JSON from LLM response."""
         try:
@@ -17,6 +17,13 @@ class CoordinatorAgent(BaseAgent):
             "research": research_agent
         }
 
+    def _route_key(self, raw: str) -> str:
+        """Agent named by an intent reply (raises if it names none we know)."""
+        agent_key = self._parse_json(raw).get("agent")
+        if agent_key not in self.agents:
+            raise ValueError(f"Unknown agent: {agent_key}")
+        return agent_key
+
     async def run(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
         """
         Determines which agent should handle the request and executes the workflow.
@@ -42,7 +49,10 @@ class CoordinatorAgent(BaseAgent):
         Return JSON: {{"agent": "agent_key", "reasoning": "..."}}
         """
         
-        intent_raw = self._generate_response(intent_prompt, max_tokens=100)
+        # Routing is a pure function of the input: cache it, but only replies naming a known agent
+        intent_raw = await self._agenerate_response(
+            intent_prompt, max_tokens=100, use_cache=True, validate=self._route_key
+        )
         intent_data = self._parse_json(intent_raw)
         
         agent_key = intent_data.get("agent", "intelligence")
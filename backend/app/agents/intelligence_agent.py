@@ -27,11 +27,9 @@ class IntelligenceAgent(BaseAgent):
              )
 
         # Standard AI generation (reasoning enabled)
-        return self.model_service.generate_with_reasoning(
+        return await self.async_model_service.agenerate_with_reasoning(
             query=query,
-            course_id=input_data.get("course_id") or context.get("course_id"),
-            session_id=input_data.get("session_id"),
-            allow_web_scrape=input_data.get("allow_web_scrape", False)
+            course_id=input_data.get("course_id") or context.get("course_id")
         )
 
 intelligence_agent = IntelligenceAgent()
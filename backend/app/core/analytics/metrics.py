@@ -33,6 +33,7 @@ class AnalyticsCollector:
             "mastery_updates": [],
             "grading_results": [],
             "response_times": [],
+            "semantic_cache": {"lookups": 0, "hits": 0, "saved_tokens": 0},
             "daily_stats": {}
         }
     
@@ -141,6 +142,18 @@ class AnalyticsCollector:
         
         self._save_metrics()
     
+    def log_semantic_cache(self, hit: bool, saved_tokens: int = 0, course_id: str = None):
+        """Log a semantic response cache lookup (saved_tokens = LLM tokens avoided by a hit)."""
+        stats = self.metrics.setdefault("semantic_cache", {"lookups": 0, "hits": 0, "saved_tokens": 0})
+        stats["lookups"] += 1
+        if hit:
+            stats["hits"] += 1
+            stats["saved_tokens"] += saved_tokens
+            by_course = stats.setdefault("by_course", {})
+            by_course[str(course_id or "global")] = by_course.get(str(course_id or "global"), 0) + 1
+        
+        self._save_metrics()
+    
     # ============================================
     # MASTERY TRACKING
     # ============================================
@@ -194,6 +207,7 @@ class AnalyticsCollector:
             "avg_confidence": self._avg([q.get("confidence", 0) for q in self.metrics["queries"][-100:]]),
             "avg_response_time_ms": self._avg(self.metrics["response_times"][-100:]),
             "rag_hit_rate": self._rag_hit_rate(),
+            "semantic_cache": self.get_semantic_cache_stats(),
             "daily_stats": self.metrics.get("daily_stats", {})
         }
     
@@ -208,6 +222,18 @@ class AnalyticsCollector:
             "by_course": self._group_by_course(recent)
         }
     
+    def get_semantic_cache_stats(self) -> Dict[str, Any]:
+        """Semantic response cache hit rate and LLM tokens saved."""
+        stats = self.metrics.get("semantic_cache", {})
+        lookups = stats.get("lookups", 0)
+        return {
+            "lookups": lookups,
+            "hits": stats.get("hits", 0),
+            "hit_rate": round(stats.get("hits", 0) / lookups, 3) if lookups else 0,
+            "saved_tokens": stats.get("saved_tokens", 0),
+            "by_course": stats.get("by_course", {})
+        }
+    
     def get_mastery_trends(self, user_id: str = None) -> Dict[str, Any]:
         """Get mastery improvement trends."""
         updates = self.metrics["mastery_updates"]
@@ -2,12 +2,13 @@
 Core Database Module
 Professional SQLAchemy schema for EduNexus AI.
 """
-from sqlalchemy import Column, Integer, String, Float, Text, ForeignKey, Boolean, DateTime, Table
+from sqlalchemy import Column, Integer, String, Float, Text, ForeignKey, Boolean, DateTime, Table, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, sessionmaker
 from sqlalchemy import create_engine
 import datetime
 import os
+from contextlib import contextmanager
 from dotenv import load_dotenv
 
 # Load .env file if it exists
@@ -200,12 +201,42 @@ class AISession(Base):
     state = Column(String(50), nullable=True)
     mastery = Column(Float, default=0.0)
     hints_used = Column(Integer, default=0)
-    messages_json = Column(Text)
+    messages_json = Column(Text, nullable=True)            # legacy blob; messages now live in ai_messages
+    message_count = Column(Integer, default=0)             # next AIMessage.seq
+    history_summary = Column(Text, nullable=True)          # rolling summary of older messages
+    summarized_messages = Column(Integer, default=0)       # leading messages covered by history_summary
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     last_activity = Column(DateTime, default=datetime.datetime.utcnow)
     
     user = relationship("User", back_populates="ai_sessions")
 
+class AIMessage(Base):
+    __tablename__ = 'ai_messages'
+    id = Column(Integer, primary_key=True)
+    session_id = Column(String(50), ForeignKey('ai_sessions.session_id'), nullable=False)
+    seq = Column(Integer, nullable=False)                  # 0-based position within the session
+    role = Column(String(20))
+    content = Column(Text)
+    web_scraped = Column(Boolean, default=False)
+    timestamp = Column(DateTime, default=datetime.datetime.utcnow)
+
+    __table_args__ = (
+        Index('ix_ai_messages_session_seq', 'session_id', 'seq', unique=True),
+    )
+
+class LearnerProfile(Base):
+    """Materialized get_user_memory aggregates, maintained incrementally by the AI tutor."""
+    __tablename__ = 'learner_profiles'
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), unique=True, index=True)
+    topics_json = Column(Text, default="[]")              # topic_ids with a StudentPerformance row
+    mastery_total = Column(Float, default=0.0)             # sum of StudentPerformance.mastery
+    chat_sessions = Column(Integer, default=0)
+    interactive_sessions = Column(Integer, default=0)
+    hints_used = Column(Integer, default=0)
+    mistakes_json = Column(Text, default="[]")             # most recent unique mistakes
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
 # ============================================
 # UTILITIES & LOGS
 # ============================================
@@ -309,8 +340,13 @@ if DATABASE_URL.startswith("mysql://"):
 
 # SQLite needs check_same_thread: False for FastAPI
 connect_args = {}
+pool_args = {
+    "pool_size": 5,          # Standard pool size
+    "max_overflow": 10       # Allow some growth
+}
 if DATABASE_URL.startswith("sqlite"):
     connect_args = {"check_same_thread": False}
+    pool_args = {}           # SQLite uses NullPool/SingletonThreadPool, which take no sizing
 elif "mysql" in DATABASE_URL:
     # Production SSL Configuration for remote MySQL (TiDB Cloud)
     ssl_ca = os.getenv("DB_SSL_CA")
@@ -344,8 +380,7 @@ engine = create_engine(
     connect_args=connect_args,
     pool_pre_ping=True,      # Automatically reconnect if connection is lost
     pool_recycle=300,        # Recycle connections every 5 minutes (prevents TiDB idle timeout)
-    pool_size=5,             # Standard pool size
-    max_overflow=10          # Allow some growth
+    **pool_args
 )
 Base.metadata.create_all(engine)
 
@@ -358,4 +393,27 @@ def get_db():
     finally:
         db.close()
 
+@contextmanager
+def unit_of_work():
+    """
+    Request-scoped session: services given this session only flush, and
+    everything is committed once when the block exits (rolled back on error).
+    """
+    db = SessionLocal()
+    try:
+        yield db
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def commit_or_flush(db, owned: bool):
+    """Commit a session the service opened itself; only flush one borrowed from a unit of work."""
+    if owned:
+        db.commit()
+    else:
+        db.flush()
+
 db_session = SessionLocal()
@@ -0,0 +1,415 @@
+"""
+ANN Index
+Approximate nearest-neighbour search for the non-Chroma vector fallback.
+
+Backends:
+- ExactIndex: brute-force dot product (used for small collections)
+- IVFFlatIndex: pure-NumPy inverted file (spherical k-means + flat lists)
+- HNSWIndex: hnswlib graph, used when hnswlib is installed
+
+All indexes address rows by their global row id in the SegmentStore, so
+each persists the store generation (and row count) it was built against
+and is discarded on load when the store has since renumbered its rows.
+"""
+import os
+import json
+import math
+from typing import Optional, Tuple
+
+import numpy as np
+
+from .segment_store import SegmentStore
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the k highest scores, best first (argpartition + small sort)."""
+    if k <= 0 or not len(scores):
+        return np.zeros(0, dtype=np.int64)
+    if k < len(scores):
+        part = np.argpartition(-scores, k - 1)[:k]
+    else:
+        part = np.arange(len(scores))
+    return part[np.argsort(-scores[part], kind="stable")]
+
+
+class ExactIndex:
+    """Brute-force search. Always correct, O(n) per query."""
+
+    name = "exact"
+
+    def __init__(self, root_dir: str = None):
+        self.root_dir = root_dir
+
+    def sync(self, store: SegmentStore):
+        pass
+
+    def add(self, store: SegmentStore, start_row: int):
+        pass
+
+    def save(self, force: bool = False):
+        pass
+
+    def reset(self):
+        pass
+
+    def ready(self, store: SegmentStore) -> bool:
+        return True
+
+    def search(self, store: SegmentStore, query: np.ndarray, k: int,
+               candidates: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        if candidates is None:
+            scores = store.similarity(query)
+            order = top_k(scores, k)
+            return order, scores[order]
+
+        scores = store.gather(candidates) @ np.asarray(query, dtype=np.float32).reshape(-1)
+        order = top_k(scores, k)
+        return candidates[order], scores[order]
+
+    def stats(self) -> dict:
+        return {"backend": self.name}
+
+
+class IVFFlatIndex(ExactIndex):
+    """
+    Inverted-file index: rows are bucketed by nearest centroid and a query
+    only scores the rows of its `nprobe` closest buckets.
+    """
+
+    name = "ivf"
+
+    def __init__(self, root_dir: str, nprobe: int = 8, min_train_rows: int = 2048,
+                 kmeans_iters: int = 10):
+        """
+        Args:
+            root_dir: Directory to persist centroids/assignments in
+            nprobe: Buckets scanned per query (higher = better recall, slower)
+            min_train_rows: Rows required before centroids are trained
+            kmeans_iters: Lloyd iterations when (re)training
+        """
+        super().__init__(root_dir)
+        self.path = os.path.join(root_dir, "ivf.npz")
+        self.nprobe = nprobe
+        self.min_train_rows = min_train_rows
+        self.kmeans_iters = kmeans_iters
+
+        self.centroids: Optional[np.ndarray] = None
+        self.assign = np.zeros(0, dtype=np.int32)
+        self.trained_rows = 0
+        self.unsaved_rows = 0
+        self.generation: Optional[int] = None  # store generation the assignments refer to
+
+        # Lazily rebuilt bucket layout: rows sorted by bucket + bucket bounds
+        self._order: Optional[np.ndarray] = None
+        self._bounds: Optional[np.ndarray] = None
+
+        self._load()
+
+    # ---------- persistence ----------
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            data = np.load(self.path)
+            self.centroids = data["centroids"]
+            self.assign = data["assign"].astype(np.int32)
+            self.trained_rows = int(data["trained_rows"])
+            # Files from before generations were recorded are treated as stale
+            self.generation = int(data["generation"]) if "generation" in data.files else None
+            if "rows" in data.files and int(data["rows"]) != len(self.assign):
+                raise ValueError("row count does not match the assignments")
+        except Exception as e:
+            print(f"[ANN] Could not load IVF index ({e}). It will be rebuilt.")
+            self.reset()
+
+    def save(self, force: bool = False):
+        if self.centroids is None:
+            return
+        if not force and self.unsaved_rows < max(1000, len(self.assign) // 10):
+            return
+        tmp_path = self.path + ".tmp.npz"
+        np.savez(tmp_path, centroids=self.centroids, assign=self.assign,
+                 trained_rows=np.int64(self.trained_rows), rows=np.int64(len(self.assign)),
+                 generation=np.int64(-1 if self.generation is None else self.generation))
+        os.replace(tmp_path, self.path)
+        self.unsaved_rows = 0
+
+    def reset(self):
+        self.centroids = None
+        self.assign = np.zeros(0, dtype=np.int32)
+        self.trained_rows = 0
+        self.generation = None
+        self._order = self._bounds = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    # ---------- build ----------
+
+    def _nearest(self, vectors: np.ndarray) -> np.ndarray:
+        out = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), 65536):
+            block = np.asarray(vectors[start:start + 65536], dtype=np.float32)
+            out[start:start + len(block)] = np.argmax(block @ self.centroids.T, axis=1)
+        return out
+
+    def _train(self, store: SegmentStore):
+        n = store.count()
+        if n == 0:
+            return
+        nlist = max(8, int(math.sqrt(n)))
+        rng = np.random.default_rng(0)
+        sample_rows = np.sort(rng.choice(n, size=min(n, nlist * 64), replace=False))
+        sample = store.gather(sample_rows)
+        nlist = min(nlist, len(sample))  # tiny stores (RAG_ANN_MIN_ROWS lowered) have fewer rows than lists
+
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(self.kmeans_iters):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            counts = np.bincount(labels, minlength=nlist)
+            filled = counts > 0
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            sums = centroids.copy()   # empty buckets keep their old centroid
+            sums[filled] = np.add.reduceat(sample[np.argsort(labels, kind="stable")], starts[filled], axis=0)
+            sums[filled] /= np.linalg.norm(sums[filled], axis=1, keepdims=True)
+            centroids = sums
+
+        self.centroids = centroids.astype(np.float32)
+        self.assign = self._nearest(store.vectors())
+        self.trained_rows = n
+        self.unsaved_rows = n
+        self.generation = store.generation
+        self._order = self._bounds = None
+        print(f"[ANN] Trained IVF index: {nlist} lists over {n} rows")
+
+    def sync(self, store: SegmentStore):
+        """Bring the index up to date with the store (after restart or compaction)."""
+        n = store.count()
+        if self.centroids is not None and (self.generation != store.generation or len(self.assign) > n):
+            # Built before rows were renumbered (e.g. a crash between compaction and save)
+            print(f"[ANN] IVF index is from store generation {self.generation}, "
+                  f"store is at {store.generation}. Rebuilding.")
+            self.reset()
+        if self.centroids is not None and len(self.assign) < n:
+            self.add(store, len(self.assign))
+        elif self.centroids is None and n >= self.min_train_rows:
+            self._train(store)
+
+    def add(self, store: SegmentStore, start_row: int):
+        """Assign rows [start_row, count) to buckets; retrain when the store has grown 4x."""
+        n = store.count()
+        if self.centroids is None:
+            if n >= self.min_train_rows:
+                self._train(store)
+            return
+        if n >= self.trained_rows * 4:
+            self._train(store)
+            return
+
+        new_rows = np.arange(start_row, n)
+        self.assign = np.concatenate([self.assign[:start_row], self._nearest(store.gather(new_rows))])
+        self.unsaved_rows += len(new_rows)
+        self.generation = store.generation
+        self._order = self._bounds = None
+
+    # ---------- query ----------
+
+    def ready(self, store: SegmentStore) -> bool:
+        return self.centroids is not None and len(self.assign) == store.count()
+
+    def _layout(self):
+        if self._order is None:
+            self._order = np.argsort(self.assign, kind="stable")
+            self._bounds = np.searchsorted(self.assign[self._order], np.arange(len(self.centroids) + 1))
+        return self._order, self._bounds
+
+    def search(self, store: SegmentStore, query: np.ndarray, k: int,
+               candidates: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        order, bounds = self._layout()
+
+        probe = top_k(self.centroids @ query, min(self.nprobe, len(self.centroids)))
+        rows = np.concatenate([order[bounds[c]:bounds[c + 1]] for c in probe])
+        if candidates is not None:
+            rows = rows[np.isin(rows, candidates, assume_unique=True)]
+
+        # Too few rows in the probed buckets: widen to exact search
+        if len(rows) < k:
+            return super().search(store, query, k, candidates)
+
+        rows = np.sort(rows)
+        scores = store.gather(rows) @ query
+        best = top_k(scores, k)
+        return rows[best], scores[best]
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.name,
+            "trained": self.centroids is not None,
+            "lists": 0 if self.centroids is None else len(self.centroids),
+            "nprobe": self.nprobe,
+            "indexed_rows": len(self.assign)
+        }
+
+
+class HNSWIndex(ExactIndex):
+    """hnswlib graph index (inner-product space)."""
+
+    name = "hnsw"
+
+    def __init__(self, root_dir: str, ef: int = 64, m: int = 16, ef_construction: int = 200):
+        """
+        Args:
+            root_dir: Directory to persist the graph in
+            ef: Query-time candidate list size (higher = better recall, slower)
+            m: Graph degree
+            ef_construction: Build-time candidate list size
+        """
+        import hnswlib  # ImportError lets the factory fall back to IVF
+        super().__init__(root_dir)
+        self.hnswlib = hnswlib
+        self.path = os.path.join(root_dir, "hnsw.bin")
+        self.meta_path = os.path.join(root_dir, "hnsw.json")  # {"generation", "rows"} of the saved graph
+        self.ef = ef
+        self.m = m
+        self.ef_construction = ef_construction
+        self.index = None
+        self.indexed_rows = 0
+        self.unsaved_rows = 0
+        self.generation: Optional[int] = None
+
+    def _saved_generation(self) -> Optional[int]:
+        try:
+            with open(self.meta_path, 'r') as f:
+                meta = json.load(f)
+            return meta["generation"] if meta["rows"] == self.indexed_rows else None
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _create(self, dimension: int, capacity: int):
+        self.index = self.hnswlib.Index(space="ip", dim=dimension)
+        self.index.init_index(max_elements=max(capacity, 1024), ef_construction=self.ef_construction, M=self.m)
+        self.index.set_ef(self.ef)
+        self.indexed_rows = 0
+
+    def sync(self, store: SegmentStore):
+        n = store.count()
+        if self.index is None and store.dimension and os.path.exists(self.path):
+            try:
+                self.index = self.hnswlib.Index(space="ip", dim=store.dimension)
+                self.index.load_index(self.path, max_elements=max(n, 1024))
+                self.index.set_ef(self.ef)
+                self.indexed_rows = self.index.get_current_count()
+                self.generation = self._saved_generation()
+            except Exception as e:
+                print(f"[ANN] Could not load HNSW index ({e}). It will be rebuilt.")
+                self.index = None
+        if self.index is not None and (self.generation != store.generation or self.indexed_rows > n):
+            # Built before rows were renumbered (e.g. a crash between compaction and save)
+            print(f"[ANN] HNSW index is from store generation {self.generation}, "
+                  f"store is at {store.generation}. Rebuilding.")
+            self.reset()
+        if n > self.indexed_rows:
+            self.add(store, self.indexed_rows)
+
+    def add(self, store: SegmentStore, start_row: int):
+        n = store.count()
+        if n <= start_row:
+            return
+        if self.index is None:
+            self._create(store.dimension, n * 2)
+            start_row = 0
+        if n > self.index.get_max_elements():
+            self.index.resize_index(n * 2)
+
+        for start in range(start_row, n, 65536):
+            rows = np.arange(start, min(start + 65536, n))
+            self.index.add_items(store.gather(rows), rows)
+        self.unsaved_rows += n - start_row
+        self.indexed_rows = n
+        self.generation = store.generation
+
+    def save(self, force: bool = False):
+        if self.index is None:
+            return
+        if not force and self.unsaved_rows < max(1000, self.indexed_rows // 10):
+            return
+        self.index.save_index(self.path)
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"generation": self.generation, "rows": self.indexed_rows}, f)
+        os.replace(tmp_path, self.meta_path)
+        self.unsaved_rows = 0
+
+    def reset(self):
+        self.index = None
+        self.indexed_rows = 0
+        self.generation = None
+        for path in (self.path, self.meta_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def ready(self, store: SegmentStore) -> bool:
+        return self.index is not None and self.indexed_rows == store.count()
+
+    def search(self, store: SegmentStore, query: np.ndarray, k: int,
+               candidates: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        query = np.asarray(query, dtype=np.float32).reshape(1, -1)
+        k = min(k, self.indexed_rows)
+        if candidates is None:
+            labels, distances = self.index.knn_query(query, k=k)
+            # hnswlib "ip" distance is 1 - dot
+            return labels[0].astype(np.int64), (1.0 - distances[0]).astype(np.float32)
+
+        allowed = np.zeros(self.indexed_rows, dtype=bool)
+        allowed[candidates] = True
+        try:
+            labels, distances = self._filtered_query(query, min(k, len(candidates)),
+                                                     lambda label: bool(allowed[label]))
+        except TypeError:
+            # hnswlib < 0.7 has no filter support: over-fetch, then filter
+            labels, distances = self.index.knn_query(query, k=min(self.indexed_rows, k * 10))
+        labels, distances = labels[0].astype(np.int64), distances[0]
+        keep = allowed[labels]
+        return labels[keep][:k], (1.0 - distances[keep][:k]).astype(np.float32)
+
+    def _filtered_query(self, query: np.ndarray, k: int, allowed) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Filtered knn_query, shrinking k when the graph cannot reach k allowed rows.
+
+        hnswlib raises RuntimeError instead of returning fewer results.
+        """
+        while True:
+            try:
+                return self.index.knn_query(query, k=k, filter=allowed)
+            except RuntimeError:
+                if k <= 1:
+                    return np.zeros((1, 0), dtype=np.int64), np.zeros((1, 0), dtype=np.float32)
+                k //= 2
+
+    def stats(self) -> dict:
+        return {"backend": self.name, "ef": self.ef, "indexed_rows": self.indexed_rows}
+
+
+def build_ann_index(root_dir: str):
+    """
+    Create the configured ANN index.
+
+    Environment:
+        RAG_ANN_BACKEND: auto | hnsw | ivf | exact (auto = hnsw if installed, else ivf)
+        RAG_ANN_RECALL:  recall/latency knob; IVF nprobe and HNSW ef/8 (default 8)
+        RAG_ANN_MIN_ROWS: collections smaller than this use exact search (default 5000)
+    """
+    backend = os.environ.get("RAG_ANN_BACKEND", "auto").lower()
+    recall = max(1, int(os.environ.get("RAG_ANN_RECALL", "8")))
+    min_rows = int(os.environ.get("RAG_ANN_MIN_ROWS", "5000"))
+
+    if backend == "exact":
+        return ExactIndex(root_dir)
+    if backend in ("auto", "hnsw"):
+        try:
+            return HNSWIndex(root_dir, ef=recall * 8)
+        except ImportError:
+            if backend == "hnsw":
+                print("[ANN] hnswlib not installed. Falling back to IVF index.")
+    return IVFFlatIndex(root_dir, nprobe=recall, min_train_rows=min_rows)
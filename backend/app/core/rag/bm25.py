@@ -0,0 +1,289 @@
+"""
+BM25 Index
+In-process lexical inverted index over chunk text, keyed by document id.
+
+Persisted as a single compact .npz: vocabulary + CSR-style postings
+(uint32 slots, uint16 term frequencies) + per-slot lengths and ids.
+"""
+import os
+import re
+import json
+import math
+from array import array
+from collections import Counter
+from threading import Lock
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+from .metadata_index import MetadataIndex, INDEXED_FIELDS
+from .ann_index import top_k
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be but by can do for from has have how i if in into is it its "
+    "of on or so than that the their then there these this to was what when where which "
+    "who why will with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased alphanumeric terms without stopwords."""
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    def __init__(self, path: str, k1: float = 1.2, b: float = 0.75, max_deleted_ratio: float = 0.25):
+        """
+        Initialize BM25 index.
+
+        Args:
+            path: .npz file the index is persisted to
+            k1: Term-frequency saturation
+            b: Document-length normalisation
+            max_deleted_ratio: Deleted share of slots that triggers compaction
+        """
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.max_deleted_ratio = max_deleted_ratio
+        self.lock = Lock()
+        self._reset()
+        self._load()
+
+    def _reset(self):
+        self.ids: List[str] = []                          # slot -> document id
+        self.slots: Dict[str, int] = {}                   # live document id -> slot
+        self.lengths = array("I")                         # slot -> term count
+        self.alive = array("B")                           # slot -> 1 while live
+        self.postings: Dict[str, Tuple[array, array]] = {}  # term -> (slots, tfs)
+        self.meta: List[Dict[str, Any]] = []              # slot -> {"metadata": indexed fields}
+        self.metadata_index = MetadataIndex()
+        self.total_length = 0
+        self.unsaved = 0
+        self._arrays: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+    # ============================================
+    # PERSISTENCE
+    # ============================================
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            data = np.load(self.path)
+            ids = data["ids"].tolist()
+            lengths = data["lengths"].astype(np.uint32)
+            alive = data["alive"].astype(np.uint8)
+            terms = data["terms"].tolist()
+            offsets = data["offsets"]
+            post_slots = data["post_slots"].astype(np.uint32)
+            post_tfs = data["post_tfs"].astype(np.uint16)
+            meta = json.loads(str(data["meta"]))
+        except Exception as e:
+            print(f"[BM25] Could not load lexical index ({e}). It will be rebuilt.")
+            self._reset()
+            return
+
+        self.ids = ids
+        self.lengths = array("I", lengths.tobytes())
+        self.alive = array("B", alive.tobytes())
+        self.slots = {doc_id: slot for slot, doc_id in enumerate(ids) if alive[slot]}
+        self.total_length = int(lengths[alive.astype(bool)].sum())
+        for i, term in enumerate(terms):
+            start, end = offsets[i], offsets[i + 1]
+            self.postings[term] = (array("I", post_slots[start:end].tobytes()),
+                                   array("H", post_tfs[start:end].tobytes()))
+        self.meta = [{"metadata": m} for m in meta]
+        self.metadata_index.rebuild(self.meta)
+
+    def save(self, force: bool = False):
+        """Write the index (batched: only once enough changes have accumulated)."""
+        with self.lock:
+            if not self.unsaved or (not force and self.unsaved < max(500, len(self.slots) // 10)):
+                return
+            terms = list(self.postings.keys())
+            sizes = [len(self.postings[t][0]) for t in terms]
+            offsets = np.concatenate([[0], np.cumsum(sizes, dtype=np.int64)])
+            post_slots = np.frombuffer(b"".join(self.postings[t][0].tobytes() for t in terms), dtype=np.uint32)
+            post_tfs = np.frombuffer(b"".join(self.postings[t][1].tobytes() for t in terms), dtype=np.uint16)
+
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + ".tmp.npz"
+            np.savez(
+                tmp_path,
+                ids=np.array(self.ids, dtype=str),
+                lengths=np.frombuffer(self.lengths.tobytes(), dtype=np.uint32),
+                alive=np.frombuffer(self.alive.tobytes(), dtype=np.uint8),
+                terms=np.array(terms, dtype=str),
+                offsets=offsets,
+                post_slots=post_slots,
+                post_tfs=post_tfs,
+                meta=np.array(json.dumps([m["metadata"] for m in self.meta]))
+            )
+            os.replace(tmp_path, self.path)
+            self.unsaved = 0
+
+    # ============================================
+    # WRITE
+    # ============================================
+
+    def add(self, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]] = None):
+        """Index documents; an id that is already present is replaced."""
+        metadatas = metadatas or [{} for _ in texts]
+        self.delete([doc_id for doc_id in ids if doc_id in self.slots])
+
+        with self.lock:
+            start_slot = len(self.ids)
+            new_meta = []
+            for doc_id, text, metadata in zip(ids, texts, metadatas):
+                slot = len(self.ids)
+                terms = tokenize(text)
+                for term, tf in Counter(terms).items():
+                    postings = self.postings.get(term)
+                    if postings is None:
+                        postings = self.postings[term] = (array("I"), array("H"))
+                    postings[0].append(slot)
+                    postings[1].append(min(tf, 65535))
+                    self._arrays.pop(term, None)
+
+                self.ids.append(doc_id)
+                self.slots[doc_id] = slot
+                self.lengths.append(len(terms))
+                self.alive.append(1)
+                self.total_length += len(terms)
+                new_meta.append({"metadata": {f: metadata[f] for f in INDEXED_FIELDS if metadata.get(f) is not None}})
+
+            self.meta.extend(new_meta)
+            self.metadata_index.add(new_meta, start_slot)
+            self.unsaved += len(ids)
+
+    def delete(self, ids: List[str]) -> int:
+        """Tombstone documents; compacts once too many slots are dead."""
+        with self.lock:
+            removed = 0
+            for doc_id in ids:
+                slot = self.slots.pop(doc_id, None)
+                if slot is None:
+                    continue
+                self.alive[slot] = 0
+                self.total_length -= self.lengths[slot]
+                removed += 1
+            if removed:
+                self.unsaved += removed
+                if len(self.ids) - len(self.slots) > self.max_deleted_ratio * len(self.ids):
+                    self._compact_locked()
+            return removed
+
+    def _compact_locked(self):
+        """Drop dead slots and renumber postings."""
+        alive = np.frombuffer(self.alive.tobytes(), dtype=np.uint8).astype(bool)
+        remap = np.cumsum(alive) - 1
+
+        postings = {}
+        for term, (slots, tfs) in self.postings.items():
+            slots_np = np.frombuffer(slots.tobytes(), dtype=np.uint32)
+            keep = alive[slots_np]
+            if keep.any():
+                postings[term] = (array("I", remap[slots_np[keep]].astype(np.uint32).tobytes()),
+                                  array("H", np.frombuffer(tfs.tobytes(), dtype=np.uint16)[keep].tobytes()))
+
+        live = np.flatnonzero(alive)
+        self.ids = [self.ids[i] for i in live]
+        self.slots = {doc_id: slot for slot, doc_id in enumerate(self.ids)}
+        self.lengths = array("I", np.frombuffer(self.lengths.tobytes(), dtype=np.uint32)[live].tobytes())
+        self.alive = array("B", bytes([1]) * len(self.ids))
+        self.meta = [self.meta[i] for i in live]
+        self.metadata_index.rebuild(self.meta)
+        self.postings = postings
+        self._arrays = {}
+        self.unsaved += 1
+
+    def rebuild(self, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]]):
+        """Recreate the index from the full document set."""
+        with self.lock:
+            self._reset()
+        self.add(ids, texts, metadatas)
+        self.save(force=True)
+
+    def clear(self):
+        with self.lock:
+            self._reset()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    # ============================================
+    # QUERY
+    # ============================================
+
+    def count(self) -> int:
+        return len(self.slots)
+
+    def _term_arrays(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        if term not in self.postings:
+            return None
+        if term not in self._arrays:
+            slots, tfs = self.postings[term]
+            self._arrays[term] = (np.frombuffer(slots.tobytes(), dtype=np.uint32).astype(np.int64),
+                                  np.frombuffer(tfs.tobytes(), dtype=np.uint16).astype(np.float32))
+        return self._arrays[term]
+
+    def search(self, query: str, k: int, where: Dict[str, Any] = None) -> List[Tuple[str, float]]:
+        """
+        Top-k documents by BM25 score.
+
+        Only the postings of the query terms are touched, so latency scales
+        with how common the query terms are, not with collection size.
+
+        Args:
+            query: Query text
+            k: Number of results
+            where: Optional equality filter on indexed metadata fields
+
+        Returns:
+            List of (document id, score), best first
+        """
+        with self.lock:
+            n_live = len(self.slots)
+            if not n_live:
+                return []
+            avgdl = max(self.total_length / n_live, 1e-6)
+            # Zero-copy views; released before the arrays can be appended to again
+            lengths = np.frombuffer(self.lengths, dtype=np.uint32)
+            alive = np.frombuffer(self.alive, dtype=np.uint8)
+
+            hit_slots, hit_scores = [], []
+            for term in set(tokenize(query)):
+                arrays = self._term_arrays(term)
+                if arrays is None:
+                    continue
+                slots, tfs = arrays
+                idf = math.log(1.0 + (n_live - len(slots) + 0.5) / (len(slots) + 0.5))
+                norm = self.k1 * (1.0 - self.b + self.b * lengths[slots] / avgdl)
+                hit_slots.append(slots)
+                hit_scores.append(idf * tfs * (self.k1 + 1.0) / (tfs + norm))
+            if not hit_slots:
+                return []
+
+            slots = np.concatenate(hit_slots)
+            scores = np.concatenate(hit_scores)
+            if len(hit_slots) > 1:
+                slots, inverse = np.unique(slots, return_inverse=True)
+                scores = np.bincount(inverse, weights=scores).astype(np.float32)
+
+            keep = alive[slots].astype(bool)
+            if where:
+                keep &= np.isin(slots, self.metadata_index.candidates(where, self.meta))
+            slots, scores = slots[keep], scores[keep]
+
+            best = top_k(scores, k)
+            hits = [(self.ids[slots[i]], float(scores[i])) for i in best]
+            del lengths, alive
+            return hits
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "documents": len(self.slots),
+            "terms": len(self.postings),
+            "deleted_slots": len(self.ids) - len(self.slots)
+        }
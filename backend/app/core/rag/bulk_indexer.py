@@ -0,0 +1,204 @@
+"""
+Bulk Indexer
+Streaming catalog re-indexing: chunk lazily, embed in concurrent batches
+with retry/backoff, write to the vector store in large batches and
+checkpoint completed courses so an interrupted run can resume.
+"""
+import os
+import json
+import time
+import random
+import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from threading import BoundedSemaphore
+from typing import List, Dict, Any, Iterable, Optional
+
+import numpy as np
+
+from .chunker import chunker, store_metadata
+from .retriever import retriever
+from .embedder import embedder
+from .vector_store import vector_store, DATA_DIR
+from .index_manifest import index_manifest
+from .semantic_cache import semantic_cache
+
+CHECKPOINT_FILE = os.path.join(DATA_DIR, "bulk_index_checkpoint.json")
+
+
+class BulkIndexer:
+    def __init__(self, batch_size: int = 64, concurrency: int = 4,
+                 write_batch_size: int = 1024, max_retries: int = 4,
+                 backoff_seconds: float = 1.0, checkpoint_path: str = CHECKPOINT_FILE):
+        """
+        Initialize bulk indexer.
+
+        Args:
+            batch_size: Chunks per embedding provider call
+            concurrency: Embedding batches in flight at once
+            write_batch_size: Minimum rows per vector store write
+            max_retries: Retries per failed embedding batch
+            backoff_seconds: Base delay for exponential backoff (with jitter)
+            checkpoint_path: JSON file recording completed courses
+        """
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.write_batch_size = write_batch_size
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.checkpoint_path = checkpoint_path
+
+    # ============================================
+    # CHECKPOINT
+    # ============================================
+
+    def _load_checkpoint(self) -> Dict[str, Any]:
+        if os.path.exists(self.checkpoint_path):
+            try:
+                with open(self.checkpoint_path, 'r') as f:
+                    return json.load(f)
+            except:
+                pass
+        return {"completed": [], "chunks_indexed": 0}
+
+    def _save_checkpoint(self, checkpoint: Dict[str, Any]):
+        checkpoint["updated_at"] = datetime.datetime.now().isoformat()
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def clear_checkpoint(self):
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+    # ============================================
+    # EMBEDDING
+    # ============================================
+
+    def _embed_with_retry(self, batch: List[Dict[str, Any]]) -> np.ndarray:
+        """Embed one batch, retrying with exponential backoff and full jitter."""
+        texts = [c["text"] for c in batch]
+        hashes = [c["content_hash"] for c in batch]
+        for attempt in range(self.max_retries + 1):
+            try:
+                return embedder.embed_documents(texts, hashes, strict=True)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = random.uniform(0, self.backoff_seconds * (2 ** attempt))
+                print(f"[INDEX] Embedding batch failed ({e}). Retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+
+    # ============================================
+    # PIPELINE
+    # ============================================
+
+    def index_courses(self, courses: Iterable[Dict[str, Any]], resume: bool = True) -> Dict[str, Any]:
+        """
+        Re-index a stream of courses.
+
+        Each course is diffed against the index manifest first, so only new
+        or edited chunks are embedded and stale chunks are deleted.
+        Courses are only checkpointed once all of their chunks have been
+        written, and writes happen at course boundaries, so a crash never
+        leaves a checkpointed course half-indexed.
+
+        Args:
+            courses: Iterable of course dicts (may be a lazy generator)
+            resume: Skip courses completed by a previous, interrupted run
+
+        Returns:
+            Run report with counts and throughput (chunks/s)
+        """
+        checkpoint = self._load_checkpoint() if resume else {"completed": [], "chunks_indexed": 0}
+        completed = set(checkpoint["completed"])
+        start_time = time.time()
+
+        slots = BoundedSemaphore(self.concurrency * 2)  # bounds queued + running batches
+        pending: deque = deque()                         # (course_id, plan, [(chunks, Future)])
+        buffer = {"texts": [], "metadatas": [], "ids": [], "embeddings": [], "deletes": [], "courses": []}
+        report = {"courses_indexed": 0, "courses_skipped": 0, "courses_unchanged": 0,
+                  "chunks_indexed": 0, "chunks_deleted": 0}
+
+        def submit(executor: ThreadPoolExecutor, batch: List[Dict[str, Any]]) -> Future:
+            slots.acquire()
+            future = executor.submit(self._embed_with_retry, batch)
+            future.add_done_callback(lambda _: slots.release())
+            return future
+
+        def drain(block: bool):
+            # Move finished courses (in submission order) into the write buffer
+            while pending and (block or all(f.done() for _, f in pending[0][2])):
+                course_id, plan, batches = pending.popleft()
+                for batch, future in batches:
+                    buffer["texts"].extend(c["text"] for c in batch)
+                    buffer["metadatas"].extend(store_metadata(c) for c in batch)
+                    buffer["ids"].extend(c["id"] for c in batch)
+                    buffer["embeddings"].append(future.result())
+                buffer["deletes"].extend(plan["delete"])
+                buffer["courses"].append((course_id, plan["ids"]))
+                if len(buffer["texts"]) >= self.write_batch_size:
+                    flush()
+
+        def flush():
+            vector_store.delete(buffer["deletes"])
+            if buffer["texts"]:
+                vector_store.upsert(buffer["texts"], buffer["metadatas"], buffer["ids"],
+                                    embeddings=np.vstack(buffer["embeddings"]))
+            for course_id, chunk_ids in buffer["courses"]:
+                index_manifest.set(course_id, chunk_ids)
+                semantic_cache.invalidate_course(course_id)
+                completed.add(course_id)
+            report["chunks_indexed"] += len(buffer["texts"])
+            report["chunks_deleted"] += len(buffer["deletes"])
+            report["courses_indexed"] += len(buffer["courses"])
+            checkpoint["completed"] = sorted(completed)
+            checkpoint["chunks_indexed"] = checkpoint.get("chunks_indexed", 0) + len(buffer["texts"])
+            self._save_checkpoint(checkpoint)
+
+            elapsed = max(time.time() - start_time, 1e-6)
+            print(f"[INDEX] {report['chunks_indexed']} chunks / {report['courses_indexed']} courses "
+                  f"({report['chunks_indexed'] / elapsed:.1f} chunks/s)")
+            for key in buffer:
+                buffer[key] = []
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for course in courses:
+                course_id = str(course.get("id", "unknown"))
+                if course_id in completed:
+                    report["courses_skipped"] += 1
+                    continue
+
+                plan = retriever.diff_course(course_id, list(chunker.iter_course_content(course)))
+                if not plan["add"] and not plan["delete"] and index_manifest.get(course_id) is not None:
+                    report["courses_unchanged"] += 1
+                    continue
+
+                batches = []
+                for start in range(0, len(plan["add"]), self.batch_size):
+                    batch = plan["add"][start:start + self.batch_size]
+                    batches.append((batch, submit(executor, batch)))
+
+                pending.append((course_id, plan, batches))
+                drain(block=False)
+
+            drain(block=True)
+            flush()
+        vector_store.persist()
+
+        elapsed = time.time() - start_time
+        self.clear_checkpoint()
+        return {
+            **report,
+            "elapsed_seconds": round(elapsed, 2),
+            "chunks_per_second": round(report["chunks_indexed"] / elapsed, 1) if elapsed > 0 else 0.0,
+            "indexed_course_ids": sorted(completed)
+        }
+
+
+# Singleton instance
+bulk_indexer = BulkIndexer(
+    batch_size=int(os.environ.get("RAG_EMBED_BATCH_SIZE", "64")),
+    concurrency=int(os.environ.get("RAG_EMBED_CONCURRENCY", "4"))
+)
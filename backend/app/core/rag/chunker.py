@@ -1,23 +1,66 @@
 """
 Text Chunker
 Splits content into 300-600 token chunks for RAG retrieval.
+
+Engines:
+- exact: tokenizes every paragraph/sentence separately (original behaviour)
+- fast: tokenizes each document once and splits on token offsets
+- estimate: no tokenizer; calibrated chars-per-token ratio, vectorized counts
 """
+import os
 import re
-from typing import List, Dict, Any
+import math
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+import numpy as np
 import tiktoken
 
+from .embedding_cache import content_hash
+
+
+def chunk_id(metadata: Dict[str, Any], index: int, text_hash: str) -> str:
+    """
+    Deterministic chunk id: (course, module, topic, chunk index, content hash).
+    Unchanged chunks keep their id across re-indexing runs and restarts.
+    """
+    metadata = metadata or {}
+    scope = ":".join(str(metadata.get(key, "-")) for key in ("course_id", "module_id", "topic_id"))
+    return f"{scope}:{metadata.get('content_type', 'text')}:{index}:{text_hash[:16]}"
+
+
+def store_metadata(chunk: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Metadata persisted with a chunk in the vector store: the chunk's own
+    metadata plus its content hash, position and tokenizer count (reused
+    by the context packer instead of re-tokenizing at query time).
+    """
+    return {
+        **chunk.get("metadata", {}),
+        "content_hash": chunk["content_hash"],
+        "chunk_index": chunk["index"],
+        "tokens": chunk["tokens"]
+    }
+
+
+ENGINES = ("exact", "fast", "estimate")
+
 
 class Chunker:
-    def __init__(self, chunk_size: int = 400, chunk_overlap: int = 50):
+    def __init__(self, chunk_size: int = 400, chunk_overlap: int = 50,
+                 engine: str = "fast", chars_per_token: float = 4.0):
         """
         Initialize chunker.
         
         Args:
             chunk_size: Target tokens per chunk (300-600 range)
             chunk_overlap: Token overlap between chunks
+            engine: "exact", "fast" or "estimate" (see module docstring)
+            chars_per_token: Ratio used by the estimate engine (see calibrate)
         """
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.engine = engine if engine in ENGINES else "fast"
+        self.chars_per_token = chars_per_token
+        self._token_bytes: Optional[np.ndarray] = None
         try:
             self.tokenizer = tiktoken.get_encoding("cl100k_base")
         except:
@@ -30,6 +73,23 @@ class Chunker:
         # Fallback: approximate 4 chars per token
         return len(text) // 4
     
+    def calibrate(self, samples: List[str]) -> float:
+        """
+        Fit the estimate engine's chars-per-token ratio on representative text.
+        
+        Args:
+            samples: Texts from the corpus being indexed
+        
+        Returns:
+            The calibrated ratio (unchanged if no tokenizer is available)
+        """
+        if not self.tokenizer or not samples:
+            return self.chars_per_token
+        tokens = sum(len(t) for t in self.tokenizer.encode_ordinary_batch(samples))
+        if tokens:
+            self.chars_per_token = sum(len(s) for s in samples) / tokens
+        return self.chars_per_token
+    
     def chunk_text(self, text: str, metadata: Dict[str, Any] = None) -> List[Dict[str, Any]]:
         """
         Split text into chunks with metadata.
@@ -44,9 +104,20 @@ class Chunker:
         if not text or not text.strip():
             return []
         
-        # Clean text
-        text = re.sub(r'\s+', ' ', text).strip()
+        if self.engine == "exact":
+            # Clean text
+            text = re.sub(r'\s+', ' ', text).strip()
+            return self._chunk_exact(text, metadata)
         
+        # Same whitespace collapse as the exact engine, several times faster than re.sub
+        return self._chunk_spans(" ".join(text.split()), metadata)
+    
+    # ============================================
+    # EXACT ENGINE
+    # ============================================
+    
+    def _chunk_exact(self, text: str, metadata: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Tokenize each paragraph and sentence separately."""
         # Split by paragraphs first
         paragraphs = re.split(r'\n\n+', text)
         
@@ -87,12 +158,125 @@ class Chunker:
         
         return chunks
     
-    def _create_chunk(self, text: str, metadata: Dict[str, Any], index: int) -> Dict[str, Any]:
-        """Create a chunk dictionary."""
+    # ============================================
+    # FAST / ESTIMATE ENGINES
+    # ============================================
+    
+    def _token_byte_lengths(self) -> np.ndarray:
+        """Byte length of every vocabulary token (built once per process)."""
+        if self._token_bytes is None:
+            lengths = np.zeros(self.tokenizer.n_vocab, dtype=np.int64)
+            for token in range(self.tokenizer.n_vocab):
+                try:
+                    lengths[token] = len(self.tokenizer.decode_single_token_bytes(token))
+                except KeyError:
+                    pass
+            self._token_bytes = lengths
+        return self._token_bytes
+    
+    def _token_ends(self, text: str) -> np.ndarray:
+        """Character offset at which each token ends; the document is encoded once."""
+        tokens = np.asarray(self.tokenizer.encode_ordinary(text), dtype=np.int64)
+        byte_ends = np.cumsum(self._token_byte_lengths()[tokens])
+        if text.isascii():
+            return byte_ends
+        # Map byte offsets to character offsets (tokens ending mid-character round up)
+        raw = np.frombuffer(text.encode("utf-8"), dtype=np.uint8)
+        char_starts = np.flatnonzero((raw & 0xC0) != 0x80)
+        return np.searchsorted(char_starts, byte_ends)
+    
+    def _sentence_spans(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Start/end character offsets of each sentence.
+        
+        Whitespace is already collapsed, so the exact engine's sentence regex
+        reduces to ".!?" followed by one space; scan for it with NumPy.
+        """
+        chars = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+        punct = (chars[:-1] == ord(".")) | (chars[:-1] == ord("!")) | (chars[:-1] == ord("?"))
+        breaks = np.flatnonzero(punct & (chars[1:] == ord(" "))) + 1   # offset of the space
+        starts = np.concatenate([[0], breaks + 1]).astype(np.int64)
+        ends = np.concatenate([breaks, [len(chars)]]).astype(np.int64)
+        return starts, ends
+    
+    def _chunk_spans(self, text: str, metadata: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Pack sentences into chunks using one token-position lookup per
+        sentence boundary instead of re-tokenizing every piece.
+        """
+        starts, ends = self._sentence_spans(text)
+        
+        if self.engine == "fast" and self.tokenizer:
+            token_ends = self._token_ends(text)
+            # Token position of a char offset = number of tokens ending at or before it
+            position = lambda offsets: np.searchsorted(token_ends, offsets, side="right")
+        else:
+            token_ends = None
+            position = lambda offsets: offsets / self.chars_per_token
+        
+        token_starts = position(starts).tolist()
+        token_stops = position(ends).tolist()
+        starts, ends = starts.tolist(), ends.tolist()
+        
+        chunks: List[Dict[str, Any]] = []
+        
+        def emit(start: int, end: int, tokens: float):
+            chunks.append(self._create_chunk(text[start:end], metadata, len(chunks), math.ceil(tokens)))
+        
+        first = None  # first sentence of the chunk being built
+        for i in range(len(starts)):
+            if token_stops[i] - token_starts[i] > self.chunk_size:
+                # Oversized sentence: flush, then cut it on token boundaries
+                if first is not None:
+                    emit(starts[first], ends[i - 1], token_stops[i - 1] - token_starts[first])
+                    first = None
+                for piece in self._split_span(text, starts[i], ends[i], token_starts[i], token_stops[i], token_ends):
+                    emit(*piece)
+                continue
+            
+            if first is not None and token_stops[i] - token_starts[first] > self.chunk_size:
+                emit(starts[first], ends[i - 1], token_stops[i - 1] - token_starts[first])
+                first = None
+            if first is None:
+                first = i
+        
+        if first is not None:
+            emit(starts[first], ends[-1], token_stops[-1] - token_starts[first])
+        return chunks
+    
+    def _split_span(self, text: str, start: int, end: int, token_start: float, token_stop: float,
+                    token_ends: Optional[np.ndarray]):
+        """Yield (start, end, tokens) windows of at most chunk_size tokens."""
+        if token_ends is not None:
+            # Cut exactly on token boundaries
+            for token in range(token_start, token_stop, self.chunk_size):
+                stop = min(token + self.chunk_size, token_stop)
+                cut = end if stop == token_stop else int(token_ends[stop - 1])
+                yield start, cut, stop - token
+                start = cut
+            return
+        
+        # Estimated windows snap back to a word boundary
+        window = int(self.chunk_size * self.chars_per_token)
+        while end - start > window:
+            cut = text.rfind(" ", start + 1, start + window)
+            if cut <= start:
+                cut = start + window
+            yield start, cut, (cut - start) / self.chars_per_token
+            start = cut
+        yield start, end, (end - start) / self.chars_per_token
+    
+    def _create_chunk(self, text: str, metadata: Dict[str, Any], index: int,
+                      tokens: int = None) -> Dict[str, Any]:
+        """Create a chunk dictionary (token count is reused when already known)."""
+        text = text.strip()
+        text_hash = content_hash(text)
         chunk = {
-            "text": text.strip(),
-            "tokens": self.count_tokens(text),
-            "index": index
+            "id": chunk_id(metadata, index, text_hash),
+            "text": text,
+            "tokens": tokens if tokens is not None else self.count_tokens(text),
+            "index": index,
+            "content_hash": text_hash
         }
         if metadata:
             chunk["metadata"] = metadata
@@ -108,14 +292,24 @@ class Chunker:
         Returns:
             List of chunks with course/topic metadata
         """
-        all_chunks = []
+        return list(self.iter_course_content(course_data))
+    
+    def iter_course_content(self, course_data: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """
+        Lazily chunk course content, one description/topic at a time.
         
+        Args:
+            course_data: Course dictionary with modules and topics
+        
+        Yields:
+            Chunks with course/topic metadata
+        """
         course_id = course_data.get("id", "unknown")
         course_title = course_data.get("title", "Unknown Course")
         
         # Chunk course description
         if course_data.get("description"):
-            chunks = self.chunk_text(
+            yield from self.chunk_text(
                 course_data["description"],
                 metadata={
                     "course_id": course_id,
@@ -123,7 +317,6 @@ class Chunker:
                     "content_type": "description"
                 }
             )
-            all_chunks.extend(chunks)
         
         # Chunk modules and topics
         for module in course_data.get("modules", []):
@@ -134,13 +327,15 @@ class Chunker:
                 topic_id = topic.get("id", "unknown")
                 topic_title = topic.get("title", "Unknown Topic")
                 
-                # Create content from learning outcomes
+                # Create content from learning outcomes and the tutor-authored body
                 content = f"Topic: {topic_title}\n\n"
                 content += "Learning Outcomes:\n"
                 for outcome in topic.get("learning_outcomes", []):
                     content += f"- {outcome}\n"
+                if topic.get("content"):
+                    content += f"\n{topic['content']}"
                 
-                chunks = self.chunk_text(
+                yield from self.chunk_text(
                     content,
                     metadata={
                         "course_id": course_id,
@@ -152,10 +347,10 @@ class Chunker:
                         "content_type": "topic"
                     }
                 )
-                all_chunks.extend(chunks)
-        
-        return all_chunks
 
 
 # Singleton instance
-chunker = Chunker()
+chunker = Chunker(
+    engine=os.environ.get("RAG_CHUNKER_ENGINE", "fast"),
+    chars_per_token=float(os.environ.get("RAG_CHARS_PER_TOKEN", "4.0"))
+)
@@ -0,0 +1,151 @@
+"""
+Context Packer
+Packs retrieved chunks into a token budget for prompt injection:
+real tokenizer counts, knapsack-style fill, MinHash near-duplicate
+removal and merging of chunks from the same topic under one header.
+"""
+import zlib
+from typing import List, Dict, Any, Tuple
+
+import numpy as np
+
+from .chunker import chunker
+
+SEPARATOR = "\n\n---\n\n"
+MERSENNE_PRIME = (1 << 61) - 1
+
+
+class ContextPacker:
+    def __init__(self, dedupe_threshold: float = 0.8, num_perm: int = 64, shingle_size: int = 5):
+        """
+        Initialize context packer.
+
+        Args:
+            dedupe_threshold: Estimated Jaccard similarity above which a chunk is a near-duplicate
+            num_perm: MinHash permutations
+            shingle_size: Words per shingle
+        """
+        self.dedupe_threshold = dedupe_threshold
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(42)
+        # 32-bit coefficients keep a*x + b below 2**64 for 32-bit shingle hashes
+        self._a = rng.integers(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.separator_tokens = chunker.count_tokens(SEPARATOR)
+
+    # ============================================
+    # TOKENS
+    # ============================================
+
+    def _tokens(self, result: Dict[str, Any]) -> int:
+        """Tokenizer count stored at chunk time; counted now only for legacy entries."""
+        tokens = result.get("metadata", {}).get("tokens")
+        if tokens is None:
+            tokens = chunker.count_tokens(result["text"])
+        return int(tokens)
+
+    # ============================================
+    # DEDUPLICATION
+    # ============================================
+
+    def _signature(self, text: str) -> np.ndarray:
+        words = text.lower().split()
+        n = self.shingle_size
+        shingles = {" ".join(words[i:i + n]) for i in range(max(1, len(words) - n + 1))}
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+        permuted = (hashes[:, None] * self._a[None, :] + self._b[None, :]) % np.uint64(MERSENNE_PRIME)
+        return permuted.min(axis=0)
+
+    def dedupe(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Drop chunks that are near-duplicates of a better-ranked chunk."""
+        kept, signatures = [], []
+        for result in results:
+            signature = self._signature(result["text"])
+            if any(np.mean(signature == other) >= self.dedupe_threshold for other in signatures):
+                continue
+            kept.append(result)
+            signatures.append(signature)
+        return kept
+
+    # ============================================
+    # PACKING
+    # ============================================
+
+    @staticmethod
+    def _label(metadata: Dict[str, Any]) -> str:
+        return metadata.get("topic_title") or metadata.get("course_title") or ""
+
+    @staticmethod
+    def _group_key(result: Dict[str, Any]) -> Tuple:
+        metadata = result.get("metadata", {})
+        if metadata.get("topic_id") is None and metadata.get("content_type") is None:
+            return ("chunk", result.get("id") or result["text"])
+        return (metadata.get("course_id"), metadata.get("module_id"),
+                metadata.get("topic_id"), metadata.get("content_type"))
+
+    def pack(self, results: List[Dict[str, Any]], max_tokens: int) -> Tuple[str, List[str]]:
+        """
+        Build the context string.
+
+        Chunks are taken in relevance order; a chunk that does not fit is
+        skipped (not a stop), so smaller lower-ranked chunks can still fill
+        the remaining budget. A topic's source header is paid for once.
+
+        Args:
+            results: Retrieved chunks, best first
+            max_tokens: Token budget for the whole context string
+
+        Returns:
+            (context, source labels in context order)
+        """
+        results = self.dedupe(results)
+
+        groups: Dict[Tuple, List[Dict[str, Any]]] = {}
+        used = 0
+        for result in results:
+            key = self._group_key(result)
+            cost = self._tokens(result)
+            if key not in groups:
+                label = self._label(result.get("metadata", {}))
+                header = chunker.count_tokens(f"[Source: {label}]\n") if label else 1
+                cost += header + (self.separator_tokens if groups else 0)
+            else:
+                cost += 1  # joining whitespace
+            if used + cost > max_tokens:
+                continue
+            groups.setdefault(key, []).append(result)
+            used += cost
+
+        context, sources = self._render(groups)
+
+        # The sum of per-chunk counts can drift from the joined text by a few
+        # tokens at boundaries; trim from the last group until it fits
+        while context and chunker.count_tokens(context) > max_tokens:
+            last_key = list(groups.keys())[-1]
+            groups[last_key].pop()
+            if not groups[last_key]:
+                del groups[last_key]
+            context, sources = self._render(groups)
+        return context, sources
+
+    def _render(self, groups: Dict[Tuple, List[Dict[str, Any]]]) -> Tuple[str, List[str]]:
+        parts, sources = [], []
+        for chunks in groups.values():
+            # Merge the topic's chunks in document order; gaps are marked
+            positions = [c.get("metadata", {}).get("chunk_index") for c in chunks]
+            ordered = sorted(zip(positions, chunks), key=lambda p: p[0] if p[0] is not None else 0)
+            text = ordered[0][1]["text"]
+            for (prev_pos, _), (pos, current) in zip(ordered, ordered[1:]):
+                adjacent = pos is not None and prev_pos is not None and pos == prev_pos + 1
+                text += (" " if adjacent else " ... ") + current["text"]
+            ordered = [c for _, c in ordered]
+
+            label = self._label(ordered[0].get("metadata", {}))
+            source = f"[Source: {label}]" if label else ""
+            parts.append(f"{source}\n{text}")
+            sources.append(label or "Unknown")
+        return SEPARATOR.join(parts), sources
+
+
+# Singleton instance
+context_packer = ContextPacker()
@@ -3,15 +3,86 @@ Text Embedder
 Generates embeddings using OpenAI (text-embedding-3-small) or sentence-transformers (BGE-Small).
 """
 import os
-from typing import List, Union
+import time
+import hashlib
+from collections import OrderedDict
+from threading import Lock
+from typing import List, Union, Optional, Dict, Any
 import numpy as np
 
+from .embedding_cache import embedding_cache, content_hash
+
+OPENAI_EMBED_MODEL = "text-embedding-3-small"
+FALLBACK_EMBED_MODEL = "random-fallback"
+
+
+class EmbeddingCache:
+    """Bounded, thread-safe LRU cache of embeddings with a per-entry TTL."""
+
+    def __init__(self, max_size: int = 2048, ttl_seconds: float = 3600):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.entries: "OrderedDict[tuple, tuple]" = OrderedDict()  # key -> (expires_at, vector)
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model: str, text: str) -> tuple:
+        normalized = " ".join(text.split())
+        return (model, hashlib.sha1(normalized.encode("utf-8")).hexdigest())
+
+    def get(self, model: str, text: str) -> Optional[np.ndarray]:
+        key = self.make_key(model, text)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry:
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, model: str, text: str, vector: np.ndarray):
+        key = self.make_key(model, text)
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl_seconds, vector)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds
+        }
+
+
 class Embedder:
     def __init__(self, model_name: str = "BAAI/bge-small-en-v1.5"):
         self.model_name = model_name
         self.model = None
         self.openai_client = None
         self.dimension = 384  # Default BGE dimension, will update if OpenAI used
+        self.active_model: Optional[str] = None  # Backend that produced the last embeddings
+        # A failed local model is retried after this many seconds instead of never
+        self.local_retry_seconds = float(os.environ.get("EMBED_LOCAL_RETRY", "300"))
+        self.local_failed_at = float("-inf")
+        self.cache = EmbeddingCache(
+            max_size=int(os.environ.get("EMBED_CACHE_SIZE", "2048")),
+            ttl_seconds=float(os.environ.get("EMBED_CACHE_TTL", "3600"))
+        )
 
     def get_openai_client(self):
         """Lazy load OpenAI client."""
@@ -28,33 +99,144 @@ class Embedder:
                 print(f"[EMBED] Failed to init OpenAI: {e}")
         return None
 
-    def embed(self, texts: Union[str, List[str]]) -> np.ndarray:
+    def embed(self, texts: Union[str, List[str]], use_cache: bool = True,
+              strict: bool = False) -> np.ndarray:
+        """
+        Embed one or more texts.
+        
+        Args:
+            texts: Text or list of texts
+            use_cache: Serve/store results in the in-memory LRU cache
+                       (meant for repeated queries, not bulk document indexing)
+            strict: Raise on provider errors instead of silently falling back
+                    to another model (bulk indexing retries instead)
+        """
         if isinstance(texts, str): texts = [texts]
         if not texts: return np.array([])
+        if not use_cache:
+            return self._embed_uncached(texts, strict)
+        
+        model = self.active_model or ""
+        vectors: List[Optional[np.ndarray]] = [self.cache.get(model, t) for t in texts]
+        missing = [i for i, v in enumerate(vectors) if v is None]
         
+        if missing:
+            fresh = self._embed_uncached([texts[i] for i in missing])
+            if self.active_model != model and len(missing) < len(texts):
+                # Backend changed underneath us: cached vectors are from another model
+                return self._embed_uncached(texts)
+            for i, vector in zip(missing, fresh):
+                vectors[i] = vector
+                self.cache.put(self.active_model, texts[i], vector)
+        
+        return np.array(vectors)
+    
+    def _embed_uncached(self, texts: List[str], strict: bool = False) -> np.ndarray:
         # 1. Try OpenAI Embeddings
         client = self.get_openai_client()
         if client:
             try:
                 # Replace newlines
                 texts = [t.replace("\n", " ") for t in texts]
-                response = client.embeddings.create(input=texts, model="text-embedding-3-small")
+                response = client.embeddings.create(input=texts, model=OPENAI_EMBED_MODEL)
                 embeddings = [data.embedding for data in response.data]
+                self.active_model = OPENAI_EMBED_MODEL
                 return np.array(embeddings)
             except Exception as e:
+                if strict:
+                    raise
                 print(f"[EMBED] OpenAI embedding failed: {e}. Falling back to local.")
 
         # 2. Try Sentence Transformers (Local BGE)
+        model = self._local_model()
+        if model is not None:
+            try:
+                embeddings = model.encode(texts, normalize_embeddings=True)
+                self.active_model = self.model_name
+                return embeddings
+            except Exception as e:
+                self.local_failed_at = time.monotonic()
+                if strict:
+                    raise
+                print(f"[EMBED] Local embedding failed: {e}. Using random fallback.")
+        elif strict:
+            raise RuntimeError(f"No embedding model available ({self.model_name} failed to load)")
+
+        # 3. Fallback: Fake embeddings
+        self.active_model = FALLBACK_EMBED_MODEL
+        return self._fallback_embed(texts)
+
+    def _local_model(self):
+        """
+        The SentenceTransformer model, loading it on first use.
+
+        Returns None while a recent load or encode failure is cooling down
+        (EMBED_LOCAL_RETRY seconds), so a transient failure is re-probed later
+        instead of pinning the process to the random fallback.
+        """
+        if time.monotonic() - self.local_failed_at < self.local_retry_seconds:
+            return None
+        if self.model:
+            return self.model
         try:
             from sentence_transformers import SentenceTransformer
-            if not self.model:
-                self.model = SentenceTransformer(self.model_name)
-                self.dimension = self.model.get_sentence_embedding_dimension()
-            return self.model.encode(texts, normalize_embeddings=True)
+            self.model = SentenceTransformer(self.model_name)
+            self.dimension = self.model.get_sentence_embedding_dimension()
+            return self.model
         except Exception as e:
-            # 3. Fallback: Fake embeddings
-            print(f"[EMBED] Local embedding failed: {e}. Using random fallback.")
-            return self._fallback_embed(texts)
+            print(f"[EMBED] Local model unavailable: {e}. Retrying in {self.local_retry_seconds:g}s.")
+            self.local_failed_at = time.monotonic()
+            return None
+    
+    def embed_documents(self, texts: List[str], hashes: List[str] = None,
+                        strict: bool = False) -> np.ndarray:
+        """
+        Embed document chunks through the persistent content-addressed cache,
+        so only text that changed since the last indexing run hits the model.
+        
+        Args:
+            texts: Chunk texts
+            hashes: Optional precomputed sha256 content hashes (from the chunker)
+            strict: Raise on provider errors instead of falling back
+        """
+        if not texts: return np.array([])
+        hashes = hashes or [content_hash(t) for t in texts]
+        
+        model = self._resolve_model()
+        if model == FALLBACK_EMBED_MODEL:
+            # Random fallback vectors are process-specific; never persist them
+            return self._embed_uncached(texts, strict)
+        
+        cached = embedding_cache.get_many(model, hashes)
+        missing = [i for i, h in enumerate(hashes) if h not in cached]
+        
+        fresh: Dict[str, np.ndarray] = {}
+        if missing:
+            vectors = self._embed_uncached([texts[i] for i in missing], strict)
+            if self.active_model != model:
+                # Provider fell back to another model: cached vectors no longer match
+                return self._embed_uncached(texts, strict) if cached else vectors
+            missing_hashes = [hashes[i] for i in missing]
+            embedding_cache.put_many(model, missing_hashes, vectors)
+            fresh = dict(zip(missing_hashes, np.asarray(vectors, dtype=np.float32)))
+        
+        return np.array([cached[h] if h in cached else fresh[h] for h in hashes])
+    
+    def _resolve_model(self) -> str:
+        """Name of the backend the next embedding call will use."""
+        if self.get_openai_client():
+            return OPENAI_EMBED_MODEL
+        if self._local_model() is not None:
+            return self.model_name
+        return FALLBACK_EMBED_MODEL
+    
+    def semantic_available(self) -> bool:
+        """Whether a real embedding model is available (not the random fallback)."""
+        return self._resolve_model() != FALLBACK_EMBED_MODEL
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """Query-embedding cache statistics."""
+        return {**self.cache.stats(), "model": self.active_model}
 
     def _fallback_embed(self, texts: List[str]) -> np.ndarray:
         embeddings = []
@@ -0,0 +1,107 @@
+"""
+Persistent Embedding Cache
+Content-addressed SQLite store: (sha256 of chunk text, model) -> float32 vector.
+Re-indexing only sends chunks whose text actually changed to the embedding model.
+"""
+import os
+import time
+import sqlite3
+import hashlib
+from threading import Lock
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))), "data", "vector_store")
+CACHE_DB = os.path.join(DATA_DIR, "embedding_cache.sqlite")
+
+# SQLite limits bound parameters per statement; stay well below it
+LOOKUP_BATCH = 500
+
+
+def content_hash(text: str) -> str:
+    """sha256 of the chunk text, used as the cache key."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class PersistentEmbeddingCache:
+    def __init__(self, db_path: str):
+        """
+        Initialize persistent cache.
+
+        Args:
+            db_path: SQLite file path (created on first use)
+        """
+        self.db_path = db_path
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    content_hash TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    dim INTEGER NOT NULL,
+                    vector BLOB NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (content_hash, model)
+                )
+            """)
+            self.conn.commit()
+        return self.conn
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, np.ndarray]:
+        """Return cached vectors for the given content hashes (missing hashes are absent)."""
+        found: Dict[str, np.ndarray] = {}
+        unique = list(dict.fromkeys(hashes))
+        with self.lock:
+            conn = self._connect()
+            for start in range(0, len(unique), LOOKUP_BATCH):
+                batch = unique[start:start + LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    f"SELECT content_hash, vector FROM embeddings WHERE model = ? AND content_hash IN ({placeholders})",
+                    [model, *batch]
+                ).fetchall()
+                for h, blob in rows:
+                    found[h] = np.frombuffer(blob, dtype=np.float32)
+            self.hits += len(found)
+            self.misses += len(unique) - len(found)
+        return found
+
+    def put_many(self, model: str, hashes: List[str], vectors: np.ndarray):
+        """Store vectors under their content hashes."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        now = time.time()
+        rows = [
+            (h, model, int(v.shape[0]), v.tobytes(), now)
+            for h, v in zip(hashes, vectors)
+        ]
+        with self.lock:
+            conn = self._connect()
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (content_hash, model, dim, vector, created_at) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            count = self._connect().execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "entries": count,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0
+        }
+
+
+# Singleton instance (connects lazily on first use)
+embedding_cache = PersistentEmbeddingCache(CACHE_DB)
@@ -0,0 +1,74 @@
+"""
+Index Manifest
+Persisted record of which chunk ids are indexed for each course, so
+re-indexing survives restarts and only touches chunks that changed.
+"""
+import os
+import json
+import datetime
+from threading import Lock
+from typing import List, Dict, Any, Optional
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))), "data", "vector_store")
+MANIFEST_FILE = os.path.join(DATA_DIR, "index_manifest.json")
+
+
+class IndexManifest:
+    def __init__(self, path: str):
+        """
+        Initialize index manifest.
+
+        Args:
+            path: JSON file holding {"courses": {course_id: {...}}}
+        """
+        self.path = path
+        self.lock = Lock()
+        self.courses: Dict[str, Dict[str, Any]] = {}
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                self.courses = json.load(f).get("courses", {})
+        except Exception as e:
+            print(f"[INDEX] Unreadable index manifest ({e}). Courses will be re-diffed against the store.")
+            self.courses = {}
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"courses": self.courses}, f)
+        os.replace(tmp_path, self.path)
+
+    def get(self, course_id: str) -> Optional[List[str]]:
+        """Chunk ids indexed for a course, or None if the course was never recorded."""
+        entry = self.courses.get(str(course_id))
+        return list(entry["chunk_ids"]) if entry else None
+
+    def set(self, course_id: str, chunk_ids: List[str]):
+        with self.lock:
+            self.courses[str(course_id)] = {
+                "chunk_ids": list(chunk_ids),
+                "indexed_at": datetime.datetime.now().isoformat()
+            }
+            self._save()
+
+    def remove(self, course_id: str):
+        with self.lock:
+            if self.courses.pop(str(course_id), None) is not None:
+                self._save()
+
+    def clear(self):
+        with self.lock:
+            self.courses = {}
+            self._save()
+
+    def course_ids(self) -> List[str]:
+        return list(self.courses.keys())
+
+
+# Singleton instance
+index_manifest = IndexManifest(MANIFEST_FILE)
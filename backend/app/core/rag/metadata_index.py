@@ -0,0 +1,79 @@
+"""
+Metadata Index
+Per-field posting lists (value -> row ids) for filtered vector search.
+"""
+from collections import defaultdict
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+# Fields the retriever filters on; other fields fall back to a scan of the candidates
+INDEXED_FIELDS = ("course_id", "module_id", "topic_id", "content_type")
+
+
+class MetadataIndex:
+    def __init__(self, fields: Tuple[str, ...] = INDEXED_FIELDS):
+        """
+        Initialize metadata index.
+
+        Args:
+            fields: Metadata keys to maintain posting lists for
+        """
+        self.fields = fields
+        self.postings: Dict[str, Dict[Any, List[int]]] = {f: defaultdict(list) for f in fields}
+        self._arrays: Dict[Tuple[str, Any], np.ndarray] = {}
+
+    def rebuild(self, documents: List[Dict[str, Any]]):
+        """Recreate all posting lists from the document list."""
+        self.postings = {f: defaultdict(list) for f in self.fields}
+        self._arrays = {}
+        self.add(documents, 0)
+
+    def add(self, documents: List[Dict[str, Any]], start_row: int):
+        """Index documents stored at rows start_row, start_row + 1, ..."""
+        for offset, doc in enumerate(documents):
+            metadata = doc.get("metadata") or {}
+            for field in self.fields:
+                value = metadata.get(field)
+                if value is not None:
+                    self.postings[field][value].append(start_row + offset)
+                    self._arrays.pop((field, value), None)
+
+    def rows(self, field: str, value: Any) -> np.ndarray:
+        """Sorted row ids whose metadata[field] == value (cached as a NumPy array)."""
+        key = (field, value)
+        if key not in self._arrays:
+            self._arrays[key] = np.asarray(self.postings[field].get(value, []), dtype=np.int64)
+        return self._arrays[key]
+
+    def candidates(self, where: Dict[str, Any], documents: List[Dict[str, Any]]) -> np.ndarray:
+        """
+        Resolve an equality filter to candidate row ids.
+
+        Indexed fields are intersected from posting lists; any remaining
+        fields are checked only against those candidates.
+        """
+        indexed = [(k, v) for k, v in where.items() if k in self.postings]
+        remaining = [(k, v) for k, v in where.items() if k not in self.postings]
+
+        if indexed:
+            # Intersect smallest posting list first
+            lists = sorted((self.rows(k, v) for k, v in indexed), key=len)
+            rows = lists[0]
+            for other in lists[1:]:
+                if not len(rows):
+                    break
+                rows = np.intersect1d(rows, other, assume_unique=True)
+        else:
+            rows = np.arange(len(documents), dtype=np.int64)
+
+        if remaining and len(rows):
+            rows = np.array([
+                i for i in rows
+                if all(documents[i].get("metadata", {}).get(k) == v for k, v in remaining)
+            ], dtype=np.int64)
+        return rows
+
+    def stats(self) -> Dict[str, int]:
+        """Distinct values per indexed field."""
+        return {f: len(values) for f, values in self.postings.items()}
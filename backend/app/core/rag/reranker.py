@@ -0,0 +1,190 @@
+"""
+Reranker
+Cross-encoder reranking of retrieved chunks under a per-request latency budget.
+"""
+import os
+import time
+import hashlib
+from collections import OrderedDict
+from threading import Lock
+from typing import List, Dict, Any, Optional, Tuple
+
+
+class RerankScoreCache:
+    """LRU of cross-encoder scores keyed by (query, chunk id)."""
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self.entries: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _query_key(query: str) -> str:
+        return hashlib.sha1(" ".join(query.lower().split()).encode("utf-8")).hexdigest()
+
+    def get(self, query: str, chunk_id: str) -> Optional[float]:
+        key = (self._query_key(query), chunk_id)
+        with self.lock:
+            score = self.entries.get(key)
+            if score is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return score
+
+    def put(self, query: str, chunk_id: str, score: float):
+        key = (self._query_key(query), chunk_id)
+        with self.lock:
+            self.entries[key] = score
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "size": len(self.entries)
+        }
+
+
+class Reranker:
+    def __init__(self, model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2",
+                 enabled: bool = False, candidates: int = 20, budget_ms: float = 150.0,
+                 batch_size: int = 16):
+        """
+        Initialize reranker.
+
+        Args:
+            model_name: sentence-transformers CrossEncoder model (small, CPU-friendly)
+            enabled: Whether retrieval runs the rerank stage at all
+            candidates: Chunks over-fetched from retrieval and scored
+            budget_ms: Per-request rerank latency budget
+            batch_size: Query/chunk pairs per forward pass
+        """
+        self.model_name = model_name
+        self.enabled = enabled
+        self.candidates = candidates
+        self.budget_ms = budget_ms
+        self.batch_size = batch_size
+        self.model = None
+        self.available = True  # flips to False if the model cannot be loaded
+        self.cache = RerankScoreCache()
+
+        # EWMA of milliseconds per scored pair, used to predict request cost
+        self.ms_per_pair: Optional[float] = None
+        self.timings = {"requests": 0, "reranked": 0, "over_budget": 0, "total_ms": 0.0, "last_ms": 0.0}
+
+    def active(self) -> bool:
+        return self.enabled and self.available
+
+    def _get_model(self):
+        """Lazy load the cross-encoder."""
+        if self.model is None:
+            try:
+                from sentence_transformers import CrossEncoder
+                self.model = CrossEncoder(self.model_name, device="cpu")
+                print(f"[RERANK] Loaded cross-encoder: {self.model_name}")
+            except Exception as e:
+                print(f"[RERANK] Cross-encoder unavailable ({e}). Reranking disabled.")
+                self.available = False
+        return self.model
+
+    def rerank(self, query: str, results: List[Dict[str, Any]], k: int) -> List[Dict[str, Any]]:
+        """
+        Reorder retrieved chunks by cross-encoder relevance.
+
+        Falls back to the incoming (retrieval) order when the predicted or
+        actual scoring time exceeds the latency budget.
+
+        Args:
+            query: User query
+            results: Retrieved chunks, best first (each with "id" and "text")
+            k: Number of chunks to keep
+
+        Returns:
+            Top-k chunks, each with "rerank_score" when reranked
+        """
+        if not self.active() or len(results) <= 1:
+            return results[:k]
+
+        start = time.perf_counter()
+        self.timings["requests"] += 1
+
+        scores: List[Optional[float]] = [
+            self.cache.get(query, r["id"]) if r.get("id") else None for r in results
+        ]
+        pending = [i for i, s in enumerate(scores) if s is None]
+
+        if pending:
+            if self.ms_per_pair is not None and len(pending) * self.ms_per_pair > self.budget_ms:
+                return self._over_budget(results, k, start)
+            model = self._get_model()
+            if model is None:
+                return results[:k]
+
+            for offset in range(0, len(pending), self.batch_size):
+                batch = pending[offset:offset + self.batch_size]
+                batch_start = time.perf_counter()
+                batch_scores = model.predict([(query, results[i]["text"]) for i in batch],
+                                             batch_size=self.batch_size)
+                self._observe((time.perf_counter() - batch_start) * 1000 / len(batch))
+                for i, score in zip(batch, batch_scores):
+                    scores[i] = float(score)
+                    if results[i].get("id"):
+                        self.cache.put(query, results[i]["id"], scores[i])
+                if (time.perf_counter() - start) * 1000 > self.budget_ms and offset + self.batch_size < len(pending):
+                    return self._over_budget(results, k, start)
+
+        order = sorted(range(len(results)), key=lambda i: scores[i], reverse=True)[:k]
+        elapsed_ms = self._record(start)
+        self.timings["reranked"] += 1
+        return [{**results[i], "rerank_score": scores[i], "rerank_ms": elapsed_ms} for i in order]
+
+    def _observe(self, ms_per_pair: float):
+        if self.ms_per_pair is None:
+            self.ms_per_pair = ms_per_pair
+        else:
+            self.ms_per_pair = 0.8 * self.ms_per_pair + 0.2 * ms_per_pair
+
+    def _record(self, start: float) -> float:
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.timings["total_ms"] += elapsed_ms
+        self.timings["last_ms"] = round(elapsed_ms, 2)
+        return round(elapsed_ms, 2)
+
+    def _over_budget(self, results: List[Dict[str, Any]], k: int, start: float) -> List[Dict[str, Any]]:
+        self.timings["over_budget"] += 1
+        self._record(start)
+        return results[:k]
+
+    def stats(self) -> Dict[str, Any]:
+        requests = self.timings["requests"]
+        return {
+            "enabled": self.enabled,
+            "available": self.available,
+            "model": self.model_name,
+            "candidates": self.candidates,
+            "budget_ms": self.budget_ms,
+            "ms_per_pair": round(self.ms_per_pair, 3) if self.ms_per_pair is not None else None,
+            "requests": requests,
+            "reranked": self.timings["reranked"],
+            "over_budget": self.timings["over_budget"],
+            "avg_ms": round(self.timings["total_ms"] / requests, 2) if requests else 0.0,
+            "last_ms": self.timings["last_ms"],
+            "score_cache": self.cache.stats()
+        }
+
+
+# Singleton instance
+reranker = Reranker(
+    model_name=os.environ.get("RAG_RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2"),
+    enabled=os.environ.get("RAG_RERANK", "false").lower() == "true",
+    candidates=int(os.environ.get("RAG_RERANK_CANDIDATES", "20")),
+    budget_ms=float(os.environ.get("RAG_RERANK_BUDGET_MS", "150"))
+)
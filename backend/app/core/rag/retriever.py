@@ -2,57 +2,132 @@
 RAG Retriever
 Retrieves relevant context for queries using vector store.
 """
-from typing import List, Dict, Any, Optional
+import os
+from typing import List, Dict, Any, Optional, Iterable
 
 from .vector_store import vector_store
-from .chunker import chunker
+from .chunker import chunker, store_metadata
+from .embedder import embedder
+from .embedding_cache import embedding_cache
+from .index_manifest import index_manifest
+from .reranker import reranker
+from .context_packer import context_packer
+from .semantic_cache import semantic_cache
+
+
+RETRIEVAL_MODES = ("hybrid", "dense", "lexical")
 
 
 class Retriever:
-    def __init__(self, top_k: int = 5, min_score: float = 0.3):
+    def __init__(self, top_k: int = 5, min_score: float = 0.3, mode: str = "hybrid",
+                 rrf_k: int = 60, candidates_per_leg: int = 20, min_lexical_score: float = 1.0,
+                 lexical_scale: float = 10.0):
         """
         Initialize retriever.
         
         Args:
             top_k: Number of chunks to retrieve
-            min_score: Minimum similarity score threshold
+            min_score: Minimum similarity score threshold (dense results)
+            mode: "hybrid" (BM25 + dense, RRF-fused), "dense" or "lexical"
+            rrf_k: Reciprocal rank fusion constant
+            candidates_per_leg: Minimum results fetched from each leg before fusion
+            min_lexical_score: Minimum raw BM25 score threshold (lexical results)
+            lexical_scale: BM25 score mapped to 0.5 when normalising into "score"
         """
         self.top_k = top_k
         self.min_score = min_score
-        self.indexed_courses = set()
+        self.min_lexical_score = min_lexical_score
+        self.lexical_scale = lexical_scale
+        self.mode = mode if mode in RETRIEVAL_MODES else "hybrid"
+        self.rrf_k = rrf_k
+        self.candidates_per_leg = candidates_per_leg
+    
+    @property
+    def indexed_courses(self) -> List[str]:
+        """Courses recorded in the persisted index manifest."""
+        return index_manifest.course_ids()
+    
+    def diff_course(self, course_id: str, chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Compare a course's fresh chunks with what is already indexed.
+        
+        Chunk ids are deterministic, so an unchanged chunk keeps its id and
+        only new/edited chunks need embedding. Courses missing from the
+        manifest (first run, or indexed before the manifest existed) are
+        diffed against the store itself, which also purges old duplicates.
+        
+        Args:
+            course_id: Course identifier
+            chunks: Output of chunker.chunk_course_content
+        
+        Returns:
+            Dict with "add" (chunks to upsert), "delete" (stale ids)
+            and "ids" (every chunk id of the course after the update)
+        """
+        fresh = {c["id"]: c for c in chunks}
+        previous = index_manifest.get(course_id)
+        if previous is None:
+            previous = vector_store.get_ids({"course_id": course_id})
+        previous = set(previous)
+        
+        return {
+            "add": [c for chunk_id, c in fresh.items() if chunk_id not in previous],
+            "delete": [chunk_id for chunk_id in previous if chunk_id not in fresh],
+            "ids": list(fresh.keys())
+        }
     
     def index_course(self, course_data: Dict[str, Any]) -> int:
         """
-        Index a course into the vector store.
+        Index (or incrementally re-index) a course into the vector store.
         
         Args:
             course_data: Course dictionary from course service
         
         Returns:
-            Number of chunks indexed
+            Number of new or changed chunks written
         """
         course_id = course_data.get("id", "unknown")
         
-        # Check if already indexed
-        if course_id in self.indexed_courses:
-            print(f"Course {course_id} already indexed.")
-            return 0
-        
-        # Chunk the course content
+        # Chunk the course content and diff against the manifest
         chunks = chunker.chunk_course_content(course_data)
+        plan = self.diff_course(course_id, chunks)
         
-        if not chunks:
+        if not plan["add"] and not plan["delete"]:
+            print(f"Course {course_id} unchanged. Nothing to index.")
+            if index_manifest.get(course_id) is None:
+                index_manifest.set(course_id, plan["ids"])
             return 0
         
-        # Add to vector store
-        texts = [c["text"] for c in chunks]
-        metadatas = [c.get("metadata", {}) for c in chunks]
+        # Remove stale chunks, then upsert new/changed ones
+        vector_store.delete(plan["delete"])
+        added = plan["add"]
+        if added:
+            vector_store.upsert(
+                [c["text"] for c in added],
+                [store_metadata(c) for c in added],
+                [c["id"] for c in added]
+            )
+        index_manifest.set(course_id, plan["ids"])
+        vector_store.persist()
+        semantic_cache.invalidate_course(course_id)
         
-        vector_store.add(texts, metadatas)
-        self.indexed_courses.add(course_id)
+        print(f"Indexed {len(added)} changed chunks ({len(plan['delete'])} removed) for course: {course_id}")
+        return len(added)
+    
+    def index_courses(self, courses: Iterable[Dict[str, Any]], resume: bool = True) -> Dict[str, Any]:
+        """
+        Bulk-index many courses through the streaming pipeline.
         
-        print(f"Indexed {len(chunks)} chunks for course: {course_id}")
-        return len(chunks)
+        Args:
+            courses: Iterable (or generator) of course dictionaries
+            resume: Continue from the checkpoint of an interrupted run
+        
+        Returns:
+            Run report including chunks/s throughput
+        """
+        from .bulk_indexer import bulk_indexer
+        
+        return bulk_indexer.index_courses((c for c in courses if c), resume=resume)
     
     def index_text(self, text: str, metadata: Dict[str, Any] = None) -> int:
         """
@@ -71,9 +146,10 @@ class Retriever:
             return 0
         
         texts = [c["text"] for c in chunks]
-        metadatas = [c.get("metadata", {}) for c in chunks]
+        metadatas = [store_metadata(c) for c in chunks]
         
-        vector_store.add(texts, metadatas)
+        # Deterministic ids: re-indexing the same text replaces rather than duplicates it
+        vector_store.upsert(texts, metadatas, [c["id"] for c in chunks])
         return len(chunks)
     
     def retrieve(self, query: str, course_id: str = None, 
@@ -96,13 +172,74 @@ class Retriever:
         if course_id:
             where = {"course_id": course_id}
         
+        # Optional rerank stage: over-fetch, then let the cross-encoder pick the top k
+        if reranker.active():
+            candidates = self._candidates(query, where, max(k, reranker.candidates))
+            return reranker.rerank(query, candidates, k)
+        return self._candidates(query, where, k)
+    
+    def _candidates(self, query: str, where: Optional[Dict[str, Any]], k: int) -> List[Dict[str, Any]]:
+        """
+        First-stage retrieval (dense, lexical or fused) of up to k chunks.
+        
+        "score" is always a 0-1 similarity (cosine for dense hits, normalised
+        BM25 for lexical-only hits), so confidence and thresholds mean the same
+        in every mode; fused results carry the RRF value in "rrf_score".
+        """
+        mode = self.active_mode()
+        if mode == "lexical":
+            return self._lexical(query, where, k)
+        
+        fetch = k if mode == "dense" else max(k * 4, self.candidates_per_leg)
+        
         # Query vector store
-        results = vector_store.query(query, n_results=k, where=where)
+        results = vector_store.query(query, n_results=fetch, where=where)
         
         # Filter by minimum score
         filtered = [r for r in results if r["score"] >= self.min_score]
         
-        return filtered
+        if mode == "dense":
+            return filtered
+        
+        lexical = self._lexical(query, where, fetch)
+        return self._fuse(filtered, lexical, k)
+    
+    def _lexical(self, query: str, where: Optional[Dict[str, Any]], k: int) -> List[Dict[str, Any]]:
+        """BM25 hits above min_lexical_score; raw BM25 moves to "lexical_score"."""
+        results = []
+        for r in vector_store.lexical_query(query, n_results=k, where=where):
+            bm25 = r["score"]
+            if bm25 < self.min_lexical_score:
+                continue
+            results.append({**r, "lexical_score": bm25, "score": bm25 / (bm25 + self.lexical_scale)})
+        return results
+    
+    def active_mode(self) -> str:
+        """Configured mode, downgraded to lexical-only when only random fallback embeddings exist."""
+        if self.mode != "lexical" and not embedder.semantic_available():
+            return "lexical"
+        return self.mode
+    
+    def _fuse(self, dense: List[Dict[str, Any]], lexical: List[Dict[str, Any]],
+              k: int) -> List[Dict[str, Any]]:
+        """
+        Reciprocal rank fusion: rrf_score = sum over legs of 1 / (rrf_k + rank).
+        
+        "score" keeps the dense similarity when the chunk came from the dense
+        leg, else its normalised lexical score.
+        """
+        fused: Dict[str, Dict[str, Any]] = {}
+        for leg, results in (("dense", dense), ("lexical", lexical)):
+            for rank, result in enumerate(results):
+                key = result.get("id") or result["text"]
+                entry = fused.setdefault(key, {**result, "rrf_score": 0.0})
+                if leg == "dense":
+                    entry["dense_score"] = result["score"]
+                else:
+                    entry["lexical_score"] = result["lexical_score"]
+                entry["rrf_score"] += 1.0 / (self.rrf_k + rank + 1)
+        
+        return sorted(fused.values(), key=lambda r: r["rrf_score"], reverse=True)[:k]
     
     def retrieve_context(self, query: str, course_id: str = None,
                          max_tokens: int = 2000) -> str:
@@ -117,45 +254,51 @@ class Retriever:
         Returns:
             Formatted context string
         """
-        results = self.retrieve(query, course_id)
-        
-        if not results:
-            return ""
-        
-        context_parts = []
-        total_tokens = 0
-        
-        for i, result in enumerate(results):
-            text = result["text"]
-            metadata = result.get("metadata", {})
-            
-            # Estimate tokens (rough: 4 chars per token)
-            text_tokens = len(text) // 4
-            
-            if total_tokens + text_tokens > max_tokens:
-                break
-            
-            # Format with source info
-            source = ""
-            if metadata.get("topic_title"):
-                source = f"[Source: {metadata['topic_title']}]"
-            elif metadata.get("course_title"):
-                source = f"[Source: {metadata['course_title']}]"
-            
-            context_parts.append(f"{source}\n{text}")
-            total_tokens += text_tokens
-        
-        return "\n\n---\n\n".join(context_parts)
+        return self.retrieve_bundle(query, course_id, max_tokens)["context"]
+    
+    def retrieve_bundle(self, query: str, course_id: str = None,
+                        max_tokens: int = 2000, top_k: int = None) -> Dict[str, Any]:
+        """
+        Single-pass retrieval: one embedding and one vector query serve both
+        the raw chunks and the formatted prompt context.
+        
+        Args:
+            query: User query
+            course_id: Optional filter by course
+            max_tokens: Maximum tokens for the context string
+            top_k: Override default top_k
+        
+        Returns:
+            Dict with "chunks" (scored results), "context" (formatted string)
+            and "sources" (source label of each chunk in the context)
+        """
+        chunks = self.retrieve(query, course_id, top_k)
+        context, sources = context_packer.pack(chunks, max_tokens)
+        return {
+            "chunks": chunks,
+            "context": context,
+            "sources": sources
+        }
     
     def get_stats(self) -> Dict[str, Any]:
         """Get retriever statistics."""
         return {
-            "indexed_courses": list(self.indexed_courses),
+            "indexed_courses": self.indexed_courses,
             "total_chunks": vector_store.count(),
+            "index": vector_store.index_stats(),
+            "embedding_cache": embedder.cache_stats(),
+            "persistent_embedding_cache": embedding_cache.stats(),
+            "retrieval_mode": self.active_mode(),
+            "reranker": reranker.stats(),
+            "semantic_cache": semantic_cache.stats(),
             "top_k": self.top_k,
-            "min_score": self.min_score
+            "min_score": self.min_score,
+            "min_lexical_score": self.min_lexical_score
         }
 
 
 # Singleton instance
-retriever = Retriever()
+retriever = Retriever(
+    mode=os.environ.get("RAG_RETRIEVAL_MODE", "hybrid"),
+    min_lexical_score=float(os.environ.get("RAG_MIN_LEXICAL_SCORE", "1.0"))
+)
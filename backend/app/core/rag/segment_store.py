@@ -0,0 +1,551 @@
+"""
+Segment Store
+Append-only, memory-mapped float32 storage for the non-Chroma vector fallback.
+
+Layout of a collection directory:
+    manifest.json            - segment list (each with its tombstoned row offsets), dimension,
+                               counters and replaced segments whose files could not be deleted yet
+    seg_000001.f32.npy       - contiguous float32 embedding block (opened with mmap)
+    seg_000001.docs.jsonl    - one {"id", "text", "metadata"} record per row
+    seg_000001.offsets.npy   - byte offset of every record in the sidecar (rows + 1 entries, mmapped)
+    seg_000001.ids.npy       - document id of every row (mmapped)
+
+Opening a collection only maps these files; a record is parsed the first
+time its row is read. New segments are merged in size tiers (merge_factor
+similar-sized neighbours at a time), so each row is rewritten O(log N)
+times over the life of the store instead of on every compaction.
+"""
+import os
+import json
+import math
+from collections import OrderedDict
+from threading import Lock
+from typing import List, Dict, Any, Optional, Set, Iterable, Iterator
+
+import numpy as np
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 2
+
+
+class SegmentDocuments:
+    """Read-only list view of the stored records, parsed on access (recent rows are kept in an LRU)."""
+
+    def __init__(self, store: "SegmentStore", cache_size: int = 4096):
+        self.store = store
+        self.cache_size = cache_size
+        self.cache: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self.lock = Lock()
+
+    def __len__(self) -> int:
+        return self.store.count()
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self[i] for i in range(*row.indices(len(self)))]
+        row = int(row)
+        if row < 0:
+            row += len(self)
+        with self.lock:
+            doc = self.cache.get(row)
+            if doc is not None:
+                self.cache.move_to_end(row)
+                return doc
+        doc = self.store.read_record(row)
+        with self.lock:
+            self.cache[row] = doc
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return doc
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        """Every record in row order (one sequential read per segment)."""
+        for index in range(len(self.store.segments)):
+            yield from self.store.iter_segment(index)
+
+    def invalidate(self):
+        """Forget cached records (row ids were renumbered)."""
+        with self.lock:
+            self.cache.clear()
+
+
+class SegmentStore:
+    def __init__(self, root_dir: str, max_segments: int = 16, max_deleted_ratio: float = 0.25,
+                 merge_factor: int = 4):
+        """
+        Initialize segment store.
+
+        Args:
+            root_dir: Directory holding the manifest and segment files
+            max_segments: Hard cap on the segment count (smallest neighbours are merged beyond it)
+            max_deleted_ratio: Tombstoned share of rows that triggers compaction on delete
+            merge_factor: Number of same-tier neighbouring segments merged into one
+        """
+        self.root_dir = root_dir
+        self.max_segments = max_segments
+        self.max_deleted_ratio = max_deleted_ratio
+        self.merge_factor = max(2, merge_factor)
+        self.lock = Lock()
+        self._ids_lock = Lock()
+
+        self.dimension: Optional[int] = None
+        self.next_segment = 1
+        self.segments: List[Dict[str, Any]] = []   # {"name": str, "rows": int}
+        self.blocks: List[np.ndarray] = []         # memmapped embedding blocks
+        self.offsets: List[np.ndarray] = []        # memmapped sidecar byte offsets
+        self.ids: List[np.ndarray] = []            # memmapped document ids
+        self.starts: List[int] = []                # global row id of each segment's first row
+        self.documents = SegmentDocuments(self)
+        self.deleted: Set[int] = set()             # tombstoned global row ids
+        self._id_rows: Optional[Dict[str, List[int]]] = None  # built on first use
+        self.orphans: List[str] = []               # replaced segments still on disk (e.g. mapped on Windows)
+
+        # Bumped whenever rows are renumbered (compaction that drops tombstones,
+        # a damaged segment skipped on load); persisted in the manifest
+        self.generation = 0
+
+        os.makedirs(self.root_dir, exist_ok=True)
+        self.load()
+
+    # ============================================
+    # PATHS & MANIFEST
+    # ============================================
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root_dir, name)
+
+    def _vectors_path(self, segment: str) -> str:
+        return self._path(f"{segment}.f32.npy")
+
+    def _docs_path(self, segment: str) -> str:
+        return self._path(f"{segment}.docs.jsonl")
+
+    def _offsets_path(self, segment: str) -> str:
+        return self._path(f"{segment}.offsets.npy")
+
+    def _ids_path(self, segment: str) -> str:
+        return self._path(f"{segment}.ids.npy")
+
+    def _segment_paths(self, segment: str) -> List[str]:
+        return [self._vectors_path(segment), self._docs_path(segment),
+                self._offsets_path(segment), self._ids_path(segment)]
+
+    def _segment_deleted(self) -> List[List[int]]:
+        """Tombstones as per-segment row offsets (stable if another segment goes missing)."""
+        deleted = np.asarray(sorted(self.deleted), dtype=np.int64)
+        per_segment = []
+        for start, segment in zip(self.starts, self.segments):
+            lo, hi = np.searchsorted(deleted, [start, start + segment["rows"]])
+            per_segment.append((deleted[lo:hi] - start).tolist())
+        return per_segment
+
+    def _write_manifest(self):
+        """Atomically replace the manifest (segments not listed are garbage)."""
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "dimension": self.dimension,
+            "next_segment": self.next_segment,
+            "generation": self.generation,
+            "segments": [
+                {**segment, "deleted": deleted}
+                for segment, deleted in zip(self.segments, self._segment_deleted())
+            ],
+            "orphans": self.orphans
+        }
+        tmp_path = self._path(MANIFEST_NAME + ".tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self._path(MANIFEST_NAME))
+
+    def exists(self) -> bool:
+        """Whether a manifest has been written for this collection."""
+        return os.path.exists(self._path(MANIFEST_NAME))
+
+    # ============================================
+    # LOAD
+    # ============================================
+
+    def load(self):
+        """Map every segment listed in the manifest (no record is parsed here)."""
+        self.segments, self.blocks, self.offsets, self.ids, self.starts = [], [], [], [], []
+        self.deleted, self._id_rows = set(), None
+        self.documents.invalidate()
+        if not self.exists():
+            return
+
+        try:
+            with open(self._path(MANIFEST_NAME), 'r') as f:
+                manifest = json.load(f)
+        except Exception as e:
+            print(f"[VECTOR] Unreadable segment manifest ({e}). Starting empty.")
+            return
+
+        self.dimension = manifest.get("dimension")
+        self.next_segment = manifest.get("next_segment", 1)
+        self.generation = manifest.get("generation", 0)
+
+        # Nothing in this process maps replaced segments yet, so they can go now
+        self.orphans = list(manifest.get("orphans", []))
+        if self.orphans:
+            self._remove_segment_files([])
+
+        listed = manifest.get("segments", [])
+        legacy_deleted = self._legacy_deleted(manifest, listed)
+
+        skipped = []
+        for position, segment in enumerate(listed):
+            name = segment["name"]
+            try:
+                block = np.load(self._vectors_path(name), mmap_mode="r")
+                offsets, ids = self._open_row_index(name)
+            except Exception as e:
+                print(f"[VECTOR] Skipping damaged segment {name}: {e}")
+                skipped.append(name)
+                continue
+
+            rows = min(segment.get("rows", block.shape[0]), block.shape[0], len(offsets) - 1, len(ids))
+            start = self.count()
+            self.segments.append({"name": name, "rows": rows})
+            self.blocks.append(block[:rows])
+            self.offsets.append(offsets[:rows + 1])
+            self.ids.append(ids[:rows])
+            self.starts.append(start)
+            deleted = segment.get("deleted", legacy_deleted[position])
+            self.deleted.update(start + r for r in deleted if r < rows)
+
+        if skipped:
+            # Later rows moved down: row-addressed indexes built on the old numbering are void
+            self.generation += 1
+            self._write_manifest()
+
+    @staticmethod
+    def _legacy_deleted(manifest: Dict[str, Any], listed: List[Dict[str, Any]]) -> List[List[int]]:
+        """Split a version-1 global "deleted_rows" list by the row counts the manifest recorded."""
+        deleted = np.asarray(sorted(manifest.get("deleted_rows", [])), dtype=np.int64)
+        per_segment, start = [], 0
+        for segment in listed:
+            lo, hi = np.searchsorted(deleted, [start, start + segment.get("rows", 0)])
+            per_segment.append((deleted[lo:hi] - start).tolist())
+            start += segment.get("rows", 0)
+        return per_segment
+
+    def _open_row_index(self, name: str):
+        """Mmap a segment's offsets and ids, writing them once for segments that predate them."""
+        if not (os.path.exists(self._offsets_path(name)) and os.path.exists(self._ids_path(name))):
+            offsets, ids = [0], []
+            with open(self._docs_path(name), 'rb') as f:
+                for line in f:
+                    if line.strip():
+                        ids.append(json.loads(line)["id"])
+                        offsets.append(offsets[-1] + len(line))
+            np.save(self._offsets_path(name), np.asarray(offsets, dtype=np.int64))
+            np.save(self._ids_path(name), np.asarray(ids, dtype=str))
+            print(f"[VECTOR] Indexed {len(ids)} rows of legacy segment {name}.")
+        return (np.load(self._offsets_path(name), mmap_mode="r"),
+                np.load(self._ids_path(name), mmap_mode="r"))
+
+    # ============================================
+    # ID MAP
+    # ============================================
+
+    @property
+    def id_rows(self) -> Dict[str, List[int]]:
+        """Document id -> live global row ids (built from the id files on first use)."""
+        if self._id_rows is None:
+            with self._ids_lock:
+                if self._id_rows is None:
+                    id_rows: Dict[str, List[int]] = {}
+                    for start, ids in zip(self.starts, self.ids):
+                        for offset, doc_id in enumerate(ids.tolist()):
+                            if start + offset not in self.deleted:
+                                id_rows.setdefault(doc_id, []).append(start + offset)
+                    self._id_rows = id_rows
+        return self._id_rows
+
+    def _index_ids(self, start_row: int, ids: List[str]):
+        """Add new rows to the id map (if it has been built)."""
+        if self._id_rows is None:
+            return
+        for offset, doc_id in enumerate(ids):
+            self._id_rows.setdefault(doc_id, []).append(start_row + offset)
+
+    # ============================================
+    # WRITE
+    # ============================================
+
+    def _write_segment(self, data: bytes, offsets: np.ndarray, ids: np.ndarray,
+                       embeddings: np.ndarray) -> Dict[str, Any]:
+        """Write one immutable segment (vectors, sidecar, row index) and mmap it back."""
+        name = f"seg_{self.next_segment:06d}"
+        self.next_segment += 1
+
+        np.save(self._vectors_path(name), np.ascontiguousarray(embeddings, dtype=np.float32))
+        with open(self._docs_path(name), 'wb') as f:
+            f.write(data)
+        np.save(self._offsets_path(name), np.asarray(offsets, dtype=np.int64))
+        np.save(self._ids_path(name), np.asarray(ids, dtype=str))
+
+        return {
+            "name": name,
+            "rows": len(ids),
+            "block": np.load(self._vectors_path(name), mmap_mode="r"),
+            "offsets": np.load(self._offsets_path(name), mmap_mode="r"),
+            "ids": np.load(self._ids_path(name), mmap_mode="r")
+        }
+
+    def _place(self, position: int, count: int, segment: Dict[str, Any]):
+        """Replace segments[position:position + count] by one new segment."""
+        self.segments[position:position + count] = [{"name": segment["name"], "rows": segment["rows"]}]
+        self.blocks[position:position + count] = [segment["block"]]
+        self.offsets[position:position + count] = [segment["offsets"]]
+        self.ids[position:position + count] = [segment["ids"]]
+        self.starts = np.cumsum([0] + [s["rows"] for s in self.segments])[:-1].tolist()
+
+    def append(self, docs: List[Dict[str, Any]], embeddings: np.ndarray):
+        """
+        Append rows as a new segment. Cost is proportional to the new rows
+        (plus amortised O(log N) tier merges).
+
+        Args:
+            docs: Document records ({"id", "text", "metadata"})
+            embeddings: Matrix of shape (len(docs), dimension)
+        """
+        if not docs:
+            return
+
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.ndim == 1:
+            embeddings = embeddings.reshape(1, -1)
+        if embeddings.shape[0] != len(docs):
+            raise ValueError(f"Got {embeddings.shape[0]} embeddings for {len(docs)} documents")
+
+        lines = [(json.dumps(doc) + "\n").encode("utf-8") for doc in docs]
+        offsets = np.cumsum([0] + [len(line) for line in lines])
+        ids = [doc["id"] for doc in docs]
+
+        with self.lock:
+            if self.dimension is None:
+                self.dimension = int(embeddings.shape[1])
+            elif embeddings.shape[1] != self.dimension:
+                raise ValueError(
+                    f"Embedding dimension {embeddings.shape[1]} does not match store dimension {self.dimension}"
+                )
+
+            start_row = self.count()
+            segment = self._write_segment(b"".join(lines), offsets, np.asarray(ids, dtype=str), embeddings)
+            self._place(len(self.segments), 0, segment)
+            self._index_ids(start_row, ids)
+            self._write_manifest()
+            self._merge_tiers_locked()
+
+    def _tier(self, rows: int) -> int:
+        return int(math.log(max(rows, 1), self.merge_factor))
+
+    def _merge_tiers_locked(self):
+        """Merge the newest run of same-tier segments, then enforce max_segments."""
+        while len(self.segments) > 1:
+            tier = self._tier(self.segments[-1]["rows"])
+            first = len(self.segments) - 1
+            while first > 0 and self._tier(self.segments[first - 1]["rows"]) <= tier:
+                first -= 1
+            if len(self.segments) - first < self.merge_factor:
+                break
+            self._merge_locked(first, len(self.segments))
+
+        while len(self.segments) > self.max_segments:
+            sizes = [a["rows"] + b["rows"] for a, b in zip(self.segments, self.segments[1:])]
+            first = int(np.argmin(sizes))
+            self._merge_locked(first, first + 2)
+
+    def _merge_locked(self, first: int, end: int):
+        """
+        Rewrite neighbouring segments [first, end) as one.
+
+        Tombstoned rows are carried over, so global row ids (and every index
+        keyed by them) stay valid; only compaction renumbers.
+        """
+        old_names = [s["name"] for s in self.segments[first:end]]
+        parts, offsets, base = [], [np.zeros(1, dtype=np.int64)], 0
+        for index in range(first, end):
+            size = int(self.offsets[index][-1])
+            with open(self._docs_path(self.segments[index]["name"]), 'rb') as f:
+                parts.append(f.read(size))
+            offsets.append(np.asarray(self.offsets[index][1:]) + base)
+            base += size
+        ids = np.concatenate([np.asarray(i) for i in self.ids[first:end]])
+        merged = np.concatenate([np.asarray(b) for b in self.blocks[first:end]])
+
+        segment = self._write_segment(b"".join(parts), np.concatenate(offsets), ids, merged)
+        self._place(first, end - first, segment)
+        self._write_manifest()
+
+        del merged
+        self._remove_segment_files(old_names)
+
+    def delete(self, ids: Iterable[str]) -> int:
+        """
+        Tombstone every row stored under the given document ids.
+
+        Rows stay on disk (and keep their row ids) until the next compaction,
+        which runs automatically once too large a share of rows is deleted.
+
+        Returns:
+            Number of rows tombstoned
+        """
+        id_rows = self.id_rows
+        with self.lock:
+            rows = [r for doc_id in ids for r in id_rows.pop(doc_id, []) if r not in self.deleted]
+            if not rows:
+                return 0
+            self.deleted.update(rows)
+            self._write_manifest()
+
+            if len(self.deleted) > self.max_deleted_ratio * self.count():
+                self._compact_locked()
+            return len(rows)
+
+    def compact(self):
+        """Merge all segments into a single contiguous block, dropping tombstoned rows."""
+        with self.lock:
+            self._compact_locked()
+
+    def _compact_locked(self):
+        if len(self.segments) <= 1 and not self.deleted:
+            return
+
+        old_names = [s["name"] for s in self.segments]
+        dropped = len(self.deleted)
+        keep = np.ones(self.count(), dtype=bool)
+        if self.deleted:
+            keep[list(self.deleted)] = False
+
+        parts, lengths, ids, blocks = [], [], [], []
+        for index, (start, segment) in enumerate(zip(self.starts, self.segments)):
+            live = np.flatnonzero(keep[start:start + segment["rows"]])
+            if not len(live):
+                continue
+            offsets = np.asarray(self.offsets[index])
+            with open(self._docs_path(segment["name"]), 'rb') as f:
+                data = f.read(int(offsets[-1]))
+            parts.extend(data[offsets[r]:offsets[r + 1]] for r in live)
+            lengths.append(offsets[live + 1] - offsets[live])
+            ids.append(np.asarray(self.ids[index])[live])
+            blocks.append(np.asarray(self.blocks[index])[live])
+
+        self.segments, self.blocks, self.offsets, self.ids, self.starts = [], [], [], [], []
+        if parts:
+            merged = np.concatenate(blocks)
+            segment = self._write_segment(b"".join(parts), np.cumsum(np.concatenate([[0]] + lengths)),
+                                          np.concatenate(ids), merged)
+            self._place(0, 0, segment)
+            del merged
+        if dropped:
+            self.deleted = set()
+            self._id_rows = None
+            self.documents.invalidate()
+            self.generation += 1
+        self._write_manifest()
+
+        self._remove_segment_files(old_names)
+        print(f"[VECTOR] Compacted {len(old_names)} segments into {len(self.segments)} "
+              f"({self.count()} rows, {dropped} deleted rows dropped)")
+
+    def _remove_segment_files(self, names: List[str]):
+        """
+        Delete segment files, retrying earlier orphans first.
+
+        Windows refuses to delete files that are still mapped (by a running
+        query or an ANN index built over the old block); those segments are
+        recorded as orphans and swept on a later compaction or the next load.
+        """
+        remaining = []
+        for name in list(dict.fromkeys(self.orphans + names)):
+            for path in self._segment_paths(name):
+                try:
+                    if os.path.exists(path):
+                        os.remove(path)
+                except OSError:
+                    remaining.append(name)
+                    break
+        if remaining != self.orphans:
+            self.orphans = remaining
+            self._write_manifest()
+
+    def clear(self):
+        """Drop every segment."""
+        with self.lock:
+            old_names = [s["name"] for s in self.segments]
+            self.segments, self.blocks, self.offsets, self.ids, self.starts = [], [], [], [], []
+            self.deleted, self._id_rows = set(), None
+            self.documents.invalidate()
+            self.dimension = None
+            self.generation += 1
+            self._write_manifest()
+            self._remove_segment_files(old_names)
+
+    # ============================================
+    # READ
+    # ============================================
+
+    def count(self) -> int:
+        """Physical row count, including tombstoned rows (row ids range over this)."""
+        return self.starts[-1] + self.segments[-1]["rows"] if self.segments else 0
+
+    def live_count(self) -> int:
+        return self.count() - len(self.deleted)
+
+    def has_id(self, doc_id: str) -> bool:
+        return doc_id in self.id_rows
+
+    def _locate(self, row: int):
+        """(segment index, row offset within it) of a global row id."""
+        if not 0 <= row < self.count():
+            raise IndexError(f"Row {row} out of range")
+        index = int(np.searchsorted(self.starts, row, side="right")) - 1
+        return index, row - self.starts[index]
+
+    def read_record(self, row: int) -> Dict[str, Any]:
+        """Parse one sidecar record (a single seek + read)."""
+        index, offset = self._locate(row)
+        start, end = int(self.offsets[index][offset]), int(self.offsets[index][offset + 1])
+        with open(self._docs_path(self.segments[index]["name"]), 'rb') as f:
+            f.seek(start)
+            return json.loads(f.read(end - start))
+
+    def iter_segment(self, index: int) -> Iterator[Dict[str, Any]]:
+        """Records of one segment in row order."""
+        rows = self.segments[index]["rows"]
+        with open(self._docs_path(self.segments[index]["name"]), 'rb') as f:
+            data = f.read(int(self.offsets[index][rows]))
+        offsets = np.asarray(self.offsets[index])
+        for r in range(rows):
+            yield json.loads(data[offsets[r]:offsets[r + 1]])
+
+    def similarity(self, query_embedding: np.ndarray) -> np.ndarray:
+        """Dot-product scores for every stored row, computed segment by segment."""
+        if not self.blocks:
+            return np.zeros(0, dtype=np.float32)
+        query = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+        return np.concatenate([block @ query for block in self.blocks])
+
+    def gather(self, rows: np.ndarray) -> np.ndarray:
+        """Embeddings for the given global row ids, in the same order."""
+        rows = np.asarray(rows, dtype=np.int64)
+        out = np.empty((len(rows), self.dimension or 0), dtype=np.float32)
+        if not len(rows):
+            return out
+
+        offsets = np.cumsum([0] + [s["rows"] for s in self.segments])
+        block_ids = np.searchsorted(offsets, rows, side="right") - 1
+        for b in np.unique(block_ids):
+            mask = block_ids == b
+            out[mask] = self.blocks[b][rows[mask] - offsets[b]]
+        return out
+
+    def vectors(self) -> Optional[np.ndarray]:
+        """All embeddings as one matrix (zero-copy when the store is compacted)."""
+        if not self.blocks:
+            return None
+        if len(self.blocks) == 1:
+            return self.blocks[0]
+        return np.concatenate([np.asarray(b) for b in self.blocks])
@@ -0,0 +1,224 @@
+"""
+Semantic Response Cache
+Reuses tutor answers for semantically equivalent questions within a course.
+
+Entries are keyed by (course_id, embedding model, query embedding) and
+matched by cosine similarity. Persisted to SQLite; bounded with LFU
+eviction (ties broken by least recent use); invalidated per course when
+the course is re-indexed.
+"""
+import os
+import json
+import time
+import sqlite3
+from threading import Lock
+from typing import Dict, Any, Optional, Tuple
+
+import numpy as np
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))), "data")
+CACHE_DB = os.path.join(DATA_DIR, "semantic_cache.sqlite")
+
+
+class SemanticCache:
+    def __init__(self, db_path: str, enabled: bool = True, threshold: float = 0.95,
+                 ttl_seconds: float = 86400.0, max_entries: int = 5000):
+        """
+        Initialize semantic cache.
+
+        Args:
+            db_path: SQLite file path (created on first use)
+            enabled: Master switch
+            threshold: Minimum cosine similarity for a hit
+            ttl_seconds: Entry lifetime
+            max_entries: Store bound; least-used entries are evicted
+        """
+        self.db_path = db_path
+        self.enabled = enabled
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.lock = Lock()
+        self.conn: Optional[sqlite3.Connection] = None
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+        # Per-(course, model) matrices of live entries, loaded lazily from SQLite
+        self._matrices: Dict[Tuple[str, str], Tuple[np.ndarray, np.ndarray]] = {}
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    course_id TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    query TEXT NOT NULL,
+                    embedding BLOB NOT NULL,
+                    payload TEXT NOT NULL,
+                    tokens INTEGER NOT NULL DEFAULT 0,
+                    hits INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_course ON responses (course_id, model)")
+            self.conn.commit()
+        return self.conn
+
+    def _matrix(self, course_id: str, model: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Row ids and normalised embeddings of the course's unexpired entries."""
+        key = (course_id, model)
+        if key not in self._matrices:
+            rows = self._connect().execute(
+                "SELECT id, embedding FROM responses WHERE course_id = ? AND model = ? AND created_at >= ?",
+                (course_id, model, time.time() - self.ttl_seconds)
+            ).fetchall()
+            ids = np.array([r[0] for r in rows], dtype=np.int64)
+            if rows:
+                matrix = np.vstack([np.frombuffer(r[1], dtype=np.float32) for r in rows])
+            else:
+                matrix = np.zeros((0, 0), dtype=np.float32)
+            self._matrices[key] = (ids, matrix)
+        return self._matrices[key]
+
+    @staticmethod
+    def _normalise(embedding: np.ndarray) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, course_id: Optional[str], model: str, query_embedding: np.ndarray) -> Optional[Dict[str, Any]]:
+        """
+        Find a cached answer for a semantically equivalent question.
+
+        Args:
+            course_id: Course scope (None = global)
+            model: Embedding model that produced query_embedding
+            query_embedding: Embedding of the student's question
+
+        Returns:
+            {"payload", "tokens", "similarity", "query"} on a hit, else None
+        """
+        if not self.enabled:
+            return None
+        course_key = str(course_id or "")
+        query = self._normalise(query_embedding)
+
+        with self.lock:
+            ids, matrix = self._matrix(course_key, model)
+            if not len(ids) or matrix.shape[1] != query.shape[0]:
+                self.misses += 1
+                return None
+
+            similarities = matrix @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT payload, tokens, query, created_at FROM responses WHERE id = ?", (int(ids[best]),)
+            ).fetchone()
+            if row is None or row[3] < time.time() - self.ttl_seconds:
+                # Evicted or expired since the matrix was loaded
+                self._matrices.pop((course_key, model), None)
+                self.misses += 1
+                return None
+
+            conn.execute("UPDATE responses SET hits = hits + 1, last_used = ? WHERE id = ?",
+                         (time.time(), int(ids[best])))
+            conn.commit()
+            self.hits += 1
+            return {
+                "payload": json.loads(row[0]),
+                "tokens": row[1],
+                "similarity": round(float(similarities[best]), 4),
+                "query": row[2]
+            }
+
+    def put(self, course_id: Optional[str], model: str, query: str, query_embedding: np.ndarray,
+            payload: Dict[str, Any], tokens: int = 0):
+        """
+        Store a generated answer.
+
+        Args:
+            course_id: Course scope (None = global)
+            model: Embedding model that produced query_embedding
+            query: Original question (kept for inspection)
+            query_embedding: Embedding of the question
+            payload: JSON-serialisable response returned to the client
+            tokens: LLM tokens (prompt + completion) a future hit saves
+        """
+        if not self.enabled:
+            return
+        course_key = str(course_id or "")
+        now = time.time()
+        with self.lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT INTO responses (course_id, model, query, embedding, payload, tokens, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (course_key, model, query, self._normalise(query_embedding).tobytes(),
+                 json.dumps(payload), int(tokens), now, now)
+            )
+            self._evict_locked(conn)
+            conn.commit()
+            self._matrices.pop((course_key, model), None)
+            self.stores += 1
+
+    def _evict_locked(self, conn: sqlite3.Connection):
+        """Drop expired entries, then the least-used ones beyond max_entries."""
+        expired = conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl_seconds,)).rowcount
+        overflow = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_entries
+        if overflow > 0:
+            conn.execute(
+                "DELETE FROM responses WHERE id IN "
+                "(SELECT id FROM responses ORDER BY hits ASC, last_used ASC LIMIT ?)", (overflow,)
+            )
+        if expired > 0 or overflow > 0:
+            self._matrices = {}
+
+    def invalidate_course(self, course_id: Optional[str]) -> int:
+        """Forget every answer for a course (its indexed content changed)."""
+        course_key = str(course_id or "")
+        with self.lock:
+            conn = self._connect()
+            removed = conn.execute("DELETE FROM responses WHERE course_id = ?", (course_key,)).rowcount
+            conn.commit()
+            self._matrices = {k: v for k, v in self._matrices.items() if k[0] != course_key}
+        if removed:
+            print(f"[CACHE] Invalidated {removed} cached answers for course {course_key}")
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            entries = self._connect().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": entries,
+            "lookups": total,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "threshold": self.threshold,
+            "ttl_seconds": self.ttl_seconds,
+            "max_entries": self.max_entries
+        }
+
+
+# Singleton instance (connects lazily on first use)
+semantic_cache = SemanticCache(
+    CACHE_DB,
+    enabled=os.environ.get("SEMANTIC_CACHE", "true").lower() == "true",
+    threshold=float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.95")),
+    ttl_seconds=float(os.environ.get("SEMANTIC_CACHE_TTL", "86400")),
+    max_entries=int(os.environ.get("SEMANTIC_CACHE_SIZE", "5000"))
+)
@@ -4,15 +4,60 @@ ChromaDB wrapper for storing and querying embeddings.
 """
 import os
 import json
+from contextlib import contextmanager
+from threading import Condition, Lock
 from typing import List, Dict, Any, Optional
 import numpy as np
 
 from .embedder import embedder
+from .segment_store import SegmentStore
+from .ann_index import build_ann_index, ExactIndex
+from .metadata_index import MetadataIndex
+from .bm25 import BM25Index
 
 # Data directory for persistence
 DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))), "data", "vector_store")
 
 
+class _ReadWriteLock:
+    """Many concurrent readers or one writer; a waiting writer holds back new readers."""
+
+    def __init__(self):
+        self._cond = Condition(Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
 class VectorStore:
     def __init__(self, collection_name: str = "edunexus_knowledge"):
         """
@@ -26,16 +71,33 @@ class VectorStore:
         self.collection = None
         self.use_chroma = False
         
-        # Fallback: in-memory store
+        # Fallback: memory-mapped segment store
+        self.segments: Optional[SegmentStore] = None
         self.documents: List[Dict[str, Any]] = []
-        self.embeddings: Optional[np.ndarray] = None
+        self.ann = None
+        self.metadata_index = MetadataIndex()
+        self._metadata_ready = False
+        self._metadata_lock = Lock()
+        self.ann_min_rows = int(os.environ.get("RAG_ANN_MIN_ROWS", "5000"))
+        self._generation = 0
+        self._live_rows: Optional[np.ndarray] = None
+        
+        # Writes (reindexing runs in background threads) replace rows, renumber
+        # them on compaction and mutate the BM25 postings; queries must never
+        # observe that half-done. Embedding happens outside the lock.
+        self.rw_lock = _ReadWriteLock()
         
         # Ensure data directory exists
         os.makedirs(DATA_DIR, exist_ok=True)
-        self.fallback_path = os.path.join(DATA_DIR, f"{collection_name}.json")
+        self.fallback_path = os.path.join(DATA_DIR, f"{collection_name}.json")  # legacy JSON format
+        self.segments_dir = os.path.join(DATA_DIR, collection_name)
+        
+        # Lexical (BM25) index, maintained for both backends
+        self.lexical = BM25Index(os.path.join(self.segments_dir, "bm25.npz"))
         
         # Try to load ChromaDB
         self._init_store()
+        self._sync_lexical()
     
     def _init_store(self):
         """Initialize ChromaDB as the primary vector memory."""
@@ -65,32 +127,97 @@ class VectorStore:
             self.use_chroma = True
             print(f"ChromaDB Knowledge Base Initialized: {self.collection_name}")
         except Exception as e:
-            print(f"ChromaDB error: {e}. Falling back to transient JSON memory.")
+            print(f"ChromaDB error: {e}. Falling back to memory-mapped segment store.")
             self._load_fallback()
     
+    def _sync_lexical(self):
+        """Rebuild the BM25 index if it drifted from the store (e.g. unsaved writes before a crash)."""
+        if self.lexical.count() == self.count():
+            return
+        if self.use_chroma and self.collection:
+            data = self.collection.get(include=["documents", "metadatas"])
+            ids, texts, metadatas = data["ids"], data["documents"], data["metadatas"]
+        else:
+            # One sequential pass over the sidecars rather than a seek per row
+            deleted = self.segments.deleted
+            docs = [doc for row, doc in enumerate(self.documents) if row not in deleted]
+            ids = [d["id"] for d in docs]
+            texts = [d["text"] for d in docs]
+            metadatas = [d.get("metadata", {}) for d in docs]
+        print(f"[BM25] Rebuilding lexical index over {len(ids)} documents.")
+        self.lexical.rebuild(ids, texts, metadatas)
+    
+    @property
+    def embeddings(self) -> Optional[np.ndarray]:
+        """Fallback embedding matrix (memory-mapped)."""
+        return self.segments.vectors() if self.segments else None
+    
     def _load_fallback(self):
-        """Load fallback store from disk."""
-        if os.path.exists(self.fallback_path):
-            try:
-                with open(self.fallback_path, 'r') as f:
-                    data = json.load(f)
-                    self.documents = data.get("documents", [])
-                    if data.get("embeddings"):
-                        self.embeddings = np.array(data["embeddings"])
-            except:
-                self.documents = []
-                self.embeddings = None
-    
-    def _save_fallback(self):
-        """Save fallback store to disk."""
-        data = {
-            "documents": self.documents,
-            "embeddings": self.embeddings.tolist() if self.embeddings is not None else None
-        }
-        with open(self.fallback_path, 'w') as f:
-            json.dump(data, f)
+        """Open the segment store, migrating a legacy JSON store on first run."""
+        max_segments = int(os.environ.get("RAG_MAX_SEGMENTS", "16"))
+        max_deleted_ratio = float(os.environ.get("RAG_MAX_DELETED_RATIO", "0.25"))
+        merge_factor = int(os.environ.get("RAG_MERGE_FACTOR", "4"))
+        self.segments = SegmentStore(self.segments_dir, max_segments=max_segments,
+                                     max_deleted_ratio=max_deleted_ratio, merge_factor=merge_factor)
+        
+        if not self.segments.exists() and os.path.exists(self.fallback_path):
+            self._migrate_legacy_json()
+        
+        # Records are parsed lazily; the metadata posting lists follow on first filtered read
+        self.documents = self.segments.documents
+        self._metadata_ready = False
+        self.ann = build_ann_index(self.segments_dir)
+        self.ann.sync(self.segments)
+        self._generation = self.segments.generation
+    
+    def _reindex_if_renumbered(self) -> bool:
+        """Rebuild row-addressed indexes after a compaction dropped tombstoned rows."""
+        self._live_rows = None
+        if self.segments.generation == self._generation:
+            return False
+        self._generation = self.segments.generation
+        self._metadata_ready = False
+        self.ann.reset()
+        self.ann.sync(self.segments)
+        self.ann.save(force=True)
+        return True
+    
+    def _metadata(self) -> MetadataIndex:
+        """Posting lists, built on first use (reading every record is O(N), so not at startup)."""
+        if not self._metadata_ready:
+            with self._metadata_lock:
+                if not self._metadata_ready:
+                    self.metadata_index.rebuild(self.documents)
+                    self._metadata_ready = True
+        return self.metadata_index
     
-    def add(self, texts: List[str], metadatas: List[Dict[str, Any]] = None, ids: List[str] = None):
+    def _live(self, rows: Optional[np.ndarray]) -> Optional[np.ndarray]:
+        """Drop tombstoned rows from a candidate set (None = all rows)."""
+        if not self.segments.deleted:
+            return rows
+        if rows is None:
+            if self._live_rows is None:
+                mask = np.ones(self.segments.count(), dtype=bool)
+                mask[list(self.segments.deleted)] = False
+                self._live_rows = np.flatnonzero(mask)
+            return self._live_rows
+        return rows[~np.isin(rows, list(self.segments.deleted))]
+    
+    def _migrate_legacy_json(self):
+        """One-off import of the old `{documents, embeddings}` JSON file."""
+        try:
+            with open(self.fallback_path, 'r') as f:
+                data = json.load(f)
+            documents = data.get("documents", [])
+            if documents and data.get("embeddings"):
+                self.segments.append(documents, np.array(data["embeddings"], dtype=np.float32))
+            os.replace(self.fallback_path, self.fallback_path + ".migrated")
+            print(f"[VECTOR] Migrated {len(documents)} documents from legacy JSON store.")
+        except Exception as e:
+            print(f"[VECTOR] Legacy JSON migration failed: {e}")
+    
+    def add(self, texts: List[str], metadatas: List[Dict[str, Any]] = None, ids: List[str] = None,
+            embeddings: np.ndarray = None):
         """
         Add documents to the store.
         
@@ -98,6 +225,7 @@ class VectorStore:
             texts: List of document texts
             metadatas: Optional list of metadata dicts
             ids: Optional list of unique IDs
+            embeddings: Optional precomputed embeddings (skips the embedder)
         """
         if not texts:
             return
@@ -110,8 +238,18 @@ class VectorStore:
         if metadatas is None:
             metadatas = [{} for _ in texts]
         
-        # Generate embeddings
-        embeddings = embedder.embed(texts)
+        # Generate embeddings; unchanged chunk text is served from the persistent cache
+        if embeddings is None:
+            hashes = [m.get("content_hash") for m in metadatas]
+            embeddings = embedder.embed_documents(texts, hashes if all(hashes) else None)
+        
+        with self.rw_lock.write():
+            self._add_locked(texts, metadatas, ids, embeddings)
+    
+    def _add_locked(self, texts: List[str], metadatas: List[Dict[str, Any]], ids: List[str],
+                    embeddings: np.ndarray):
+        self.lexical.add(ids, texts, metadatas)
+        self.lexical.save()
         
         if self.use_chroma and self.collection:
             self.collection.add(
@@ -121,21 +259,89 @@ class VectorStore:
                 ids=ids
             )
         else:
-            # Fallback store
-            for i, (text, meta, doc_id) in enumerate(zip(texts, metadatas, ids)):
-                self.documents.append({
-                    "id": doc_id,
-                    "text": text,
-                    "metadata": meta
-                })
+            # Fallback store: append-only segment write (O(new rows))
+            docs = [
+                {"id": doc_id, "text": text, "metadata": meta}
+                for text, meta, doc_id in zip(texts, metadatas, ids)
+            ]
+            start_row = self.segments.count()
+            self.segments.append(docs, embeddings)
+            if self._reindex_if_renumbered():
+                return
             
-            # Update embeddings
-            if self.embeddings is None:
-                self.embeddings = embeddings
+            # Incrementally index the new rows
+            if self._metadata_ready:
+                self.metadata_index.add(docs, start_row)
+            self.ann.add(self.segments, start_row)
+            self.ann.save()
+    
+    def upsert(self, texts: List[str], metadatas: List[Dict[str, Any]], ids: List[str],
+               embeddings: np.ndarray = None):
+        """
+        Insert documents, replacing any already stored under the same ids.
+        
+        Args:
+            texts: List of document texts
+            metadatas: List of metadata dicts
+            ids: Unique (deterministic) IDs
+            embeddings: Optional precomputed embeddings (skips the embedder)
+        """
+        if not texts:
+            return
+        if embeddings is None:
+            hashes = [m.get("content_hash") for m in metadatas]
+            embeddings = embedder.embed_documents(texts, hashes if all(hashes) else None)
+        
+        with self.rw_lock.write():
+            if self.use_chroma and self.collection:
+                self.collection.upsert(
+                    documents=texts,
+                    embeddings=embeddings.tolist(),
+                    metadatas=metadatas,
+                    ids=ids
+                )
+                self.lexical.add(ids, texts, metadatas)
+                self.lexical.save()
             else:
-                self.embeddings = np.vstack([self.embeddings, embeddings])
-            
-            self._save_fallback()
+                # Delete + add under one write lock: readers never see a half-replaced course
+                self._delete_locked([doc_id for doc_id in ids if self.segments.has_id(doc_id)])
+                self._add_locked(texts, metadatas, ids, embeddings)
+    
+    def delete(self, ids: List[str]) -> int:
+        """
+        Delete documents by id.
+        
+        Args:
+            ids: IDs to remove (unknown ids are ignored)
+        
+        Returns:
+            Number of fallback rows tombstoned (ids requested on Chroma)
+        """
+        if not ids:
+            return 0
+        with self.rw_lock.write():
+            return self._delete_locked(ids)
+    
+    def _delete_locked(self, ids: List[str]) -> int:
+        if not ids:
+            return 0
+        self.lexical.delete(ids)
+        self.lexical.save()
+        if self.use_chroma and self.collection:
+            self.collection.delete(ids=list(ids))
+            return len(ids)
+        
+        deleted = self.segments.delete(ids)
+        self._reindex_if_renumbered()
+        return deleted
+    
+    def get_ids(self, where: Dict[str, Any]) -> List[str]:
+        """IDs of all stored documents matching a metadata filter."""
+        if self.use_chroma and self.collection:
+            return self.collection.get(where=where, include=[])["ids"]
+        with self.rw_lock.read():
+            rows = self._live(self._metadata().candidates(where, self.documents))
+            return [self.documents[i]["id"] for i in rows]
     
     def query(self, query_text: str, n_results: int = 5, 
               where: Dict[str, Any] = None) -> List[Dict[str, Any]]:
@@ -152,6 +358,11 @@ class VectorStore:
         """
         query_embedding = embedder.embed(query_text)
         
+        with self.rw_lock.read():
+            return self._query_locked(query_embedding, n_results, where)
+    
+    def _query_locked(self, query_embedding: np.ndarray, n_results: int,
+                      where: Dict[str, Any] = None) -> List[Dict[str, Any]]:
         if self.use_chroma and self.collection:
             results = self.collection.query(
                 query_embeddings=query_embedding.tolist(),
@@ -172,30 +383,21 @@ class VectorStore:
             return formatted
         else:
             # Fallback query
-            if not self.documents or self.embeddings is None:
+            if not self.documents:
                 return []
             
-            # Calculate similarities
-            similarities = embedder.similarity(query_embedding, self.embeddings)
-            
-            # Apply filter if provided
-            filtered_indices = list(range(len(self.documents)))
+            # Apply filter via posting lists so only the candidate subset is scored
+            candidates = None
             if where:
-                filtered_indices = [
-                    i for i, doc in enumerate(self.documents)
-                    if all(doc.get("metadata", {}).get(k) == v for k, v in where.items())
-                ]
-            
-            # Get top-k
-            if not filtered_indices:
+                candidates = self._metadata().candidates(where, self.documents)
+            candidates = self._live(candidates)
+            if candidates is not None and not len(candidates):
                 return []
             
-            filtered_scores = [(i, similarities[i]) for i in filtered_indices]
-            filtered_scores.sort(key=lambda x: x[1], reverse=True)
-            top_k = filtered_scores[:n_results]
+            rows, scores = self._search(query_embedding, n_results, candidates)
             
             results = []
-            for idx, score in top_k:
+            for idx, score in zip(rows, scores):
                 doc = self.documents[idx]
                 results.append({
                     "text": doc["text"],
@@ -206,24 +408,108 @@ class VectorStore:
             
             return results
     
+    def lexical_query(self, query_text: str, n_results: int = 5,
+                      where: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+        """
+        BM25 keyword search (no embedding call).
+        
+        Args:
+            query_text: Query text
+            n_results: Number of results to return
+            where: Optional metadata filter
+        
+        Returns:
+            List of results with text, metadata, and BM25 score
+        """
+        with self.rw_lock.read():
+            return self._lexical_query_locked(query_text, n_results, where)
+    
+    def _lexical_query_locked(self, query_text: str, n_results: int,
+                              where: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+        hits = self.lexical.search(query_text, n_results, where)
+        if not hits:
+            return []
+        
+        if self.use_chroma and self.collection:
+            data = self.collection.get(ids=[doc_id for doc_id, _ in hits], include=["documents", "metadatas"])
+            found = {
+                doc_id: {"text": text, "metadata": meta or {}}
+                for doc_id, text, meta in zip(data["ids"], data["documents"], data["metadatas"])
+            }
+        else:
+            found = {}
+            for doc_id, _ in hits:
+                rows = self.segments.id_rows.get(doc_id)
+                if rows:
+                    doc = self.documents[rows[-1]]
+                    found[doc_id] = {"text": doc["text"], "metadata": doc.get("metadata", {})}
+        
+        return [
+            {**found[doc_id], "score": score, "id": doc_id}
+            for doc_id, score in hits if doc_id in found
+        ]
+    
+    def _search(self, query_embedding: np.ndarray, k: int, candidates: Optional[np.ndarray] = None):
+        """Top-k rows from the ANN index, or exact search for small collections/subsets."""
+        searched_rows = self.count() if candidates is None else len(candidates)
+        if searched_rows >= self.ann_min_rows and self.ann.ready(self.segments):
+            return self.ann.search(self.segments, query_embedding, k, candidates)
+        return ExactIndex().search(self.segments, query_embedding, k, candidates)
+    
     def count(self) -> int:
         """Get number of documents in store."""
         if self.use_chroma and self.collection:
             return self.collection.count()
-        return len(self.documents)
+        return self.segments.live_count()
+    
+    def index_stats(self) -> Dict[str, Any]:
+        """Describe the active search backend."""
+        if self.use_chroma and self.collection:
+            return {"backend": "chroma", "lexical": self.lexical.stats()}
+        with self.rw_lock.read():
+            return self._index_stats_locked()
+    
+    def _index_stats_locked(self) -> Dict[str, Any]:
+        return {
+            **self.ann.stats(),
+            "segments": len(self.segments.segments),
+            "deleted_rows": len(self.segments.deleted),
+            "exact_below_rows": self.ann_min_rows,
+            "metadata_values": self.metadata_index.stats() if self._metadata_ready else None,
+            "lexical": self.lexical.stats()
+        }
+    
+    def persist(self):
+        """Force-write batched index state (call at the end of an indexing run)."""
+        with self.rw_lock.write():
+            self.lexical.save(force=True)
+            if not self.use_chroma and self.ann:
+                self.ann.save(force=True)
+    
+    def compact(self):
+        """Merge fallback segments into one contiguous block (no-op on Chroma)."""
+        if not self.use_chroma and self.segments:
+            with self.rw_lock.write():
+                self.segments.compact()
+                if not self._reindex_if_renumbered():
+                    self.ann.save(force=True)
     
     def clear(self):
         """Clear all documents from store."""
-        if self.use_chroma and self.collection:
-            self.client.delete_collection(self.collection_name)
-            self.collection = self.client.create_collection(
-                name=self.collection_name,
-                metadata={"hnsw:space": "cosine"}
-            )
-        else:
-            self.documents = []
-            self.embeddings = None
-            self._save_fallback()
+        with self.rw_lock.write():
+            self.lexical.clear()
+            if self.use_chroma and self.collection:
+                self.client.delete_collection(self.collection_name)
+                self.collection = self.client.create_collection(
+                    name=self.collection_name,
+                    metadata={"hnsw:space": "cosine"}
+                )
+            else:
+                self.segments.clear()
+                self._generation = self.segments.generation
+                self._live_rows = None
+                self._metadata_ready = False
+                self.ann.reset()
 
 
 # Singleton instance
@@ -3,9 +3,12 @@ AI Tutor Feature Router (Enhanced)
 Chat and interactive mode with RAG, tools, and analytics.
 """
 import time
+import json
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Dict, Any
 
 # Core modules
 from app.core.rag.retriever import retriever
@@ -19,8 +22,14 @@ from .session_service import ai_session_service, TutorState
 from app.features.auth.service import auth_service
 from app.features.progress.service import progress_service
 from app.shared.model_service import model_service
+from app.shared.async_model_service import async_model_service
+from app.shared.completion_cache import completion_cache
+from app.shared.http_client import remote_engine
+from app.shared.provider_pool import provider_pool
+from app.shared.single_flight import single_flight
+from app.shared.history_compactor import history_compactor
 from app.shared.audit import audit_service
-from app.core.database import User
+from app.core.database import User, unit_of_work
 
 router = APIRouter()
 
@@ -50,6 +59,19 @@ class IndexCourseRequest(BaseModel):
     course_id: str
 
 
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _event_stream(events) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 # ============================================
 # RAG MANAGEMENT ENDPOINTS
 # ============================================
@@ -75,6 +97,27 @@ async def index_course_for_rag(
     }
 
 
+@router.post("/index/catalog")
+async def index_catalog_for_rag(
+    resume: bool = True,
+    current_user: User = Depends(auth_service.get_current_user)
+):
+    """Bulk re-index every course (streaming, batched, resumable). Tutors and admins only."""
+    if current_user.role not in ("tutor", "admin"):
+        raise HTTPException(status_code=403, detail="Tutor or admin access only.")
+    
+    from app.features.courses.service import course_service
+    
+    def course_stream():
+        for summary in course_service.get_all_courses():
+            course = course_service.get_course_by_id(str(summary["id"]))
+            if course:
+                yield course
+    
+    report = await run_in_threadpool(retriever.index_courses, course_stream(), resume)
+    return {"status": "indexed", **report}
+
+
 @router.get("/rag/stats")
 async def get_rag_stats(
     current_user: User = Depends(auth_service.get_current_user)
@@ -83,6 +126,21 @@ async def get_rag_stats(
     return retriever.get_stats()
 
 
+@router.get("/llm/stats")
+async def get_llm_stats(
+    current_user: User = Depends(auth_service.get_current_user)
+):
+    """Get LLM client statistics (provider ranking, remote engine pool, caches, concurrency)."""
+    return {
+        "providers": await run_in_threadpool(provider_pool.stats),
+        "remote_engine": remote_engine.stats(),
+        "completion_cache": await run_in_threadpool(completion_cache.stats),
+        "single_flight": single_flight.stats(),
+        "history_compactor": history_compactor.stats(),
+        "async": async_model_service.stats()
+    }
+
+
 # ============================================
 # CHAT MODE (RAG-Enhanced)
 # ============================================
@@ -97,58 +155,125 @@ async def ai_chat(
     Does NOT affect GPA.
     """
     start_time = time.time()
-    user_id = str(current_user.id)
-    
-    # Get or create session
-    session_id = data.session_id
-    if not session_id:
-        session = ai_session_service.create_session(
-            user_id, "chat", data.course_id, data.topic_id
-        )
-        session_id = session["session_id"]
-    
-    # Add user message
-    ai_session_service.add_chat_message(session_id, "user", data.message)
-    
-    # Check if tools are needed
-    tool_result = tool_router.route(data.message)
-    tool_context = tool_result.get("inject_context", "")
-    
-    # Get user memory for personalization
-    user_memory = ai_session_service.get_user_memory(user_id)
+    turn = await run_in_threadpool(_start_chat_turn, data, current_user)
     
-    # Get conversation history
-    conversation_history = ai_session_service.get_chat_context(session_id)
-    
-    # Generate response with RAG
+    # Generate response with RAG (awaitable: the event loop stays free during the LLM call)
     if data.use_reasoning:
-        result = model_service.generate_with_reasoning(
+        result = await async_model_service.agenerate_with_reasoning(
             data.message, data.course_id
         )
-        response = result["response"]
-        confidence = result.get("confidence", 0.7)
         rag_context = []
     else:
         # Standard RAG generation
-        if tool_context:
-            # Inject tool result into query
-            enhanced_query = f"{data.message}\n\n{tool_context}"
-        else:
-            enhanced_query = data.message
-        
-        result = model_service.generate_with_rag(
-            enhanced_query,
+        result = await async_model_service.agenerate_with_rag(
+            turn["query"],
             course_id=data.course_id,
-            user_memory=user_memory,
-            conversation_history=conversation_history,
+            user_memory=turn["user_memory"],
+            conversation_history=turn["conversation_history"],
             max_tokens=500
         )
-        response = result["response"]
-        confidence = result.get("confidence", 0.5)
         rag_context = result.get("retrieved_context", [])
     
+    return await run_in_threadpool(_finish_chat_turn, data, turn, result, rag_context, start_time)
+
+
+@router.post("/chat/stream")
+async def ai_chat_stream(
+    data: ChatRequest,
+    current_user: User = Depends(auth_service.get_current_user)
+):
+    """
+    Chat mode streamed as Server-Sent Events.
+    Emits "token" events as the answer is generated and a final "done"
+    event with the same fields as /chat. The session is saved afterwards.
+    """
+    start_time = time.time()
+    turn = await run_in_threadpool(_start_chat_turn, data, current_user)
+    
+    def events():
+        yield _sse("session", {"session_id": turn["session_id"]})
+        if data.use_reasoning:
+            # Two-pass reasoning validates the full answer, so it cannot stream
+            result = model_service.generate_with_reasoning(data.message, data.course_id)
+            yield _sse("token", {"text": result["response"]})
+            yield _sse("done", _finish_chat_turn(data, turn, result, [], start_time))
+            return
+        
+        parts, result = [], None
+        try:
+            for event in model_service.stream_with_rag(
+                turn["query"],
+                course_id=data.course_id,
+                user_memory=turn["user_memory"],
+                conversation_history=turn["conversation_history"],
+                max_tokens=500
+            ):
+                if event["type"] == "token":
+                    parts.append(event["text"])
+                    yield _sse("token", {"text": event["text"]})
+                else:
+                    result = event
+        finally:
+            if result is None and parts:
+                # Client went away mid-stream: keep what was generated
+                ai_session_service.add_chat_message(turn["session_id"], "assistant", "".join(parts).strip())
+        
+        if result is not None:
+            yield _sse("done", _finish_chat_turn(
+                data, turn, result, result.get("retrieved_context", []), start_time
+            ))
+    
+    return _event_stream(events())
+
+
+def _start_chat_turn(data: ChatRequest, current_user: User) -> Dict[str, Any]:
+    """Session, tool routing and personalization shared by /chat and /chat/stream."""
+    user_id = str(current_user.id)
+    
+    # Check if tools are needed
+    tool_result = tool_router.route(data.message)
+    tool_context = tool_result.get("inject_context", "")
+    
+    # One DB session and one commit for all session reads/writes of this turn
+    with unit_of_work() as db:
+        # Get or create session
+        session_id = data.session_id
+        if not session_id:
+            session = ai_session_service.create_session(
+                user_id, "chat", data.course_id, data.topic_id, db=db
+            )
+            session_id = session["session_id"]
+        
+        # Get conversation history (prior turns only, so a first question stays cacheable)
+        conversation_history = ai_session_service.get_chat_context(session_id, db=db)
+        
+        # Add user message
+        ai_session_service.add_chat_message(session_id, "user", data.message, db=db)
+        
+        # Get user memory for personalization
+        user_memory = ai_session_service.get_user_memory(user_id, db=db)
+    
+    # Inject tool result into query
+    query = f"{data.message}\n\n{tool_context}" if tool_context else data.message
+    
+    return {
+        "session_id": session_id,
+        "tool_result": tool_result,
+        "query": query,
+        "user_memory": user_memory,
+        "conversation_history": conversation_history
+    }
+
+
+def _finish_chat_turn(data: ChatRequest, turn: Dict[str, Any], result: Dict[str, Any],
+                      rag_context: List[str], start_time: float) -> Dict[str, Any]:
+    """Persist the answer, log analytics and build the /chat response body."""
+    response = result["response"]
+    confidence = result.get("confidence", 0.5 if rag_context else 0.7)
+    
     # Add AI response
-    ai_session_service.add_chat_message(session_id, "assistant", response)
+    with unit_of_work() as db:
+        ai_session_service.add_chat_message(turn["session_id"], "assistant", response, db=db)
     
     # Track analytics
     response_time_ms = int((time.time() - start_time) * 1000)
@@ -160,10 +285,10 @@ async def ai_chat(
     )
     
     return {
-        "session_id": session_id,
+        "session_id": turn["session_id"],
         "response": response,
         "confidence": confidence,
-        "tool_used": tool_result.get("tool_used"),
+        "tool_used": turn["tool_result"].get("tool_used"),
         "rag_sources": result.get("sources", []),
         "affects_gpa": False,
         "response_time_ms": response_time_ms
@@ -184,34 +309,86 @@ async def ai_interactive(
     AFFECTS GPA.
     """
     start_time = time.time()
+    turn = await run_in_threadpool(_start_interactive_turn, data, current_user)
+    
+    # Generate response with state awareness
+    result = await async_model_service.agenerate_interactive(data.message, **turn["generation"])
+    
+    return await run_in_threadpool(
+        _finish_interactive_turn, data, current_user, turn, result["response"], start_time
+    )
+
+
+@router.post("/interactive/stream")
+async def ai_interactive_stream(
+    data: InteractiveRequest,
+    current_user: User = Depends(auth_service.get_current_user)
+):
+    """
+    Interactive tutoring mode streamed as Server-Sent Events.
+    Emits "token" events, then a "done" event with the same fields as
+    /interactive once the session (and any grading) has been saved.
+    """
+    start_time = time.time()
+    turn = await run_in_threadpool(_start_interactive_turn, data, current_user)
+    
+    def events():
+        yield _sse("session", {"session_id": turn["session_id"]})
+        parts, completed = [], False
+        try:
+            for text in model_service.stream_interactive(data.message, **turn["generation"]):
+                parts.append(text)
+                yield _sse("token", {"text": text})
+            completed = True
+        finally:
+            if not completed and parts:
+                # Client went away mid-stream: keep what was generated
+                ai_session_service.add_chat_message(turn["session_id"], "assistant", "".join(parts).strip())
+        
+        yield _sse("done", _finish_interactive_turn(
+            data, current_user, turn, "".join(parts).strip(), start_time
+        ))
+    
+    return _event_stream(events())
+
+
+def _start_interactive_turn(data: InteractiveRequest, current_user: User) -> Dict[str, Any]:
+    """Session, actions and tutor context shared by /interactive and /interactive/stream."""
     user_id = str(current_user.id)
     
-    # Get User Interactive Memory (Mastery, Style, Mistakes)
-    user_memory = ai_session_service.get_user_memory(current_user.id)
+    # One DB session and one commit for all session reads/writes of this turn
+    with unit_of_work() as db:
+        # Get User Interactive Memory (Mastery, Style, Mistakes)
+        user_memory = ai_session_service.get_user_memory(current_user.id, db=db)
+        
+        # Get or create session
+        session_id = data.session_id
+        if session_id:
+            session = ai_session_service.get_session(session_id, db=db)
+        else:
+            session = ai_session_service.create_session(
+                user_id, "interactive", data.course_id, data.topic_id, db=db
+            )
+            session_id = session["session_id"]
+        current_state = session.get("state", TutorState.INTRODUCE.value)
+        hints_used = session.get("hints_used", 0)
+        
+        # Handle special actions
+        if data.action == "hint":
+            ai_session_service.record_hint_used(session_id, db=db)
+            session["hints_used"] = hints_used + 1
+        
+        # Add user message
+        ai_session_service.add_chat_message(session_id, "user", data.message, db=db)
     
-    # Get or create session
-    session_id = data.session_id
-    if not session_id:
-        session = ai_session_service.create_session(
-            user_id, "interactive", data.course_id, data.topic_id
-        )
-        session_id = session["session_id"]
+    if not data.session_id:
         audit_service.log_session_start(
             user_id, session_id, "interactive", 
             data.course_id, data.topic_id
         )
-    
-    session = ai_session_service.get_session(session_id)
-    current_state = session.get("state", TutorState.INTRODUCE.value)
-    
-    # Handle special actions
     if data.action == "hint":
-        ai_session_service.record_hint_used(session_id)
         audit_service.log_hint_used(user_id, session_id, data.topic_id)
     
-    # Add user message
-    ai_session_service.add_chat_message(session_id, "user", data.message)
-    
     # Get course/topic context
     topic = curriculum_loader.get_topic(data.topic_id) if data.topic_id else {}
     course_data = {
@@ -221,48 +398,70 @@ async def ai_interactive(
         "topic_title": topic.get("title", "Unknown Topic")
     }
     
-    # Generate response with state awareness
-    result = model_service.generate_interactive(
-        data.message,
-        tutor_state=current_state,
-        course_data=course_data,
-        user_memory=user_memory, # Added for personalization
-        mastery=session.get("mastery", 0),
-        hints_used=session.get("hints_used", 0),
-        max_tokens=400
-    )
-    response = result["response"]
-    
-    # Add AI response
-    ai_session_service.add_chat_message(session_id, "assistant", response)
+    return {
+        "session_id": session_id,
+        "session": session,
+        "topic": topic,
+        "current_state": current_state,
+        "generation": {
+            "tutor_state": current_state,
+            "course_data": course_data,
+            "user_memory": user_memory, # Added for personalization
+            "mastery": session.get("mastery", 0),
+            "hints_used": hints_used,
+            "max_tokens": 400
+        }
+    }
+
+
+def _finish_interactive_turn(data: InteractiveRequest, current_user: User, turn: Dict[str, Any],
+                             response: str, start_time: float) -> Dict[str, Any]:
+    """Persist the answer, grade ASSESS turns and build the /interactive response body."""
+    user_id = str(current_user.id)
+    session_id = turn["session_id"]
+    session = turn["session"]
+    topic = turn["topic"]
+    current_state = turn["current_state"]
     
     # Handle state transitions and grading
     affects_gpa = False
     next_state = current_state
     grade_result = None
+    mastery = session.get("mastery", 0)
     
     if current_state == TutorState.ASSESS.value:
         affects_gpa = True
         
-        # Grade the response
+        # Grade the response (before the unit of work, so no row stays locked during the LLM call)
         topic_title = topic.get("title", "")
         grade_result = model_service.grade_essay(
             topic_title, data.message, topic_id=data.topic_id
         )
         score = grade_result.get("score", 70)
+    
+    # One DB session and one commit for the answer, mastery and progress writes
+    with unit_of_work() as db:
+        # Add AI response
+        ai_session_service.add_chat_message(session_id, "assistant", response, db=db)
         
-        # Record mistakes for future remediation
-        if score < 80:
-             mistake = grade_result.get("feedback", "Misunderstood concept")
-             ai_session_service.record_mistake(current_user.id, data.topic_id, mistake)
-        reading_progress = progress_service._get_topic_progress(
-            user_id, data.topic_id
-        ).get("read_progress", 0)
-        
-        old_mastery = session.get("mastery", 0)
-        new_mastery = ai_session_service.update_session_mastery(
-            session_id, reading_progress, score / 100
-        )
+        if affects_gpa:
+            # Record mistakes for future remediation
+            if score < 80:
+                 mistake = grade_result.get("feedback", "Misunderstood concept")
+                 ai_session_service.record_mistake(current_user.id, data.topic_id, mistake, db=db)
+            reading_progress = progress_service.get_topic_progress(
+                user_id, data.topic_id, db=db
+            ).get("read_progress", 0)
+            
+            new_mastery = ai_session_service.update_session_mastery(
+                session_id, reading_progress, score / 100, db=db
+            )
+            
+            # Update progress
+            progress_service.update_exercise_score(user_id, data.topic_id, score, db=db)
+    
+    if affects_gpa:
+        old_mastery, mastery = mastery, new_mastery
         
         # Log events
         audit_service.log_exercise_graded(
@@ -278,15 +477,9 @@ async def ai_interactive(
             user_id, data.topic_id, score, "interactive"
         )
         
-        # Update progress
-        progress_service.update_exercise_score(user_id, data.topic_id, score)
-        
         # Transition state
         next_state = TutorState.UPDATE.value
     
-    # Get updated session
-    session = ai_session_service.get_session(session_id)
-    
     # Track analytics
     response_time_ms = int((time.time() - start_time) * 1000)
     analytics_collector.log_query(
@@ -299,7 +492,7 @@ async def ai_interactive(
         "session_id": session_id,
         "response": response,
         "current_state": next_state,
-        "mastery": session.get("mastery", 0),
+        "mastery": mastery,
         "hints_used": session.get("hints_used", 0),
         "affects_gpa": affects_gpa,
         "grade_result": grade_result,
@@ -317,7 +510,7 @@ async def get_session(
     current_user: User = Depends(auth_service.get_current_user)
 ):
     """Get session details."""
-    session = ai_session_service.get_session(session_id)
+    session = ai_session_service.get_session(session_id, include_messages=True)
     if not session or session["user_id"] != str(current_user.id):
         raise HTTPException(status_code=404, detail="Session not found")
     return session
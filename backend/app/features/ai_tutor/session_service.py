@@ -2,9 +2,12 @@
 AI Session Service
 Manages dual-mode AI sessions (Chat + Interactive) with tutor state machine.
 """
-from app.core.database import SessionLocal, StudentPerformance, AISession
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app.core.database import SessionLocal, AISession, AIMessage, commit_or_flush
+from app.shared.history_compactor import history_compactor
+from app.shared.learner_profile import learner_profile_service
 import uuid
-import json
 import datetime
 from typing import Dict, Any, Optional, List
 from enum import Enum
@@ -34,11 +37,21 @@ STATE_TRANSITIONS = {
 
 class AISessionService:
     def __init__(self):
-        pass
+        # Compaction reads message_count in its own session, so it may only start once the
+        # unit of work that appended the message has committed
+        event.listen(SessionLocal, "after_commit", self._after_commit)
+        event.listen(SessionLocal, "after_rollback", self._after_rollback)
+
+    def _after_commit(self, session: Session):
+        for session_id in session.info.pop("compaction_due", ()):
+            history_compactor.schedule(session_id, self._compact_history, session_id)
+
+    def _after_rollback(self, session: Session):
+        session.info.pop("compaction_due", None)
     
-    def _format_session(self, session: AISession) -> Dict[str, Any]:
-        """Convert SQLAlchemy model to dict."""
-        return {
+    def _format_session(self, session: AISession, messages: List[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Convert SQLAlchemy model to dict (messages only when loaded by the caller)."""
+        data = {
             "session_id": session.session_id,
             "user_id": str(session.user_id),
             "mode": session.mode,
@@ -47,18 +60,32 @@ class AISessionService:
             "state": session.state,
             "mastery": session.mastery,
             "hints_used": session.hints_used,
-            "messages": json.loads(session.messages_json),
+            "message_count": session.message_count or 0,
+            "history_summary": session.history_summary,
+            "summarized_messages": session.summarized_messages or 0,
             "created_at": session.created_at.isoformat(),
             "last_activity": session.last_activity.isoformat()
         }
+        if messages is not None:
+            data["messages"] = messages
+        return data
+
+    def _format_message(self, message: AIMessage) -> Dict[str, Any]:
+        return {
+            "role": message.role,
+            "content": message.content,
+            "web_scraped": bool(message.web_scraped),
+            "timestamp": message.timestamp.isoformat()
+        }
     
     # ==========================================
     # SESSION MANAGEMENT
     # ==========================================
     
-    def create_session(self, user_id: str, mode: str, course_id: str = None, topic_id: str = None) -> Dict[str, Any]:
-        """Create a new AI session in DB."""
-        db = SessionLocal()
+    def create_session(self, user_id: str, mode: str, course_id: str = None, topic_id: str = None,
+                       db: Session = None) -> Dict[str, Any]:
+        """Create a new AI session in DB (pass db to join a request's unit of work)."""
+        _db = db or SessionLocal()
         try:
             session_id = str(uuid.uuid4())
             new_session = AISession(
@@ -68,143 +95,160 @@ class AISessionService:
                 course_id=course_id,
                 topic_id=topic_id,
                 state=TutorState.INTRODUCE.value if mode == "interactive" else None,
-                messages_json=json.dumps([])
+                message_count=0
             )
-            db.add(new_session)
-            db.commit()
-            db.refresh(new_session)
+            _db.add(new_session)
+            learner_profile_service.record_session(_db, new_session.user_id, mode)
+            commit_or_flush(_db, owned=db is None)
             return self._format_session(new_session)
         finally:
-            db.close()
+            if db is None:
+                _db.close()
     
-    def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
-        """Get session by ID from DB."""
-        db = SessionLocal()
+    def get_session(self, session_id: str, include_messages: bool = False, db: Session = None) -> Optional[Dict[str, Any]]:
+        """Get session by ID from DB (full message history only if requested)."""
+        _db = db or SessionLocal()
         try:
-            session = db.query(AISession).filter_by(session_id=session_id).first()
-            return self._format_session(session) if session else None
+            session = _db.query(AISession).filter_by(session_id=session_id).first()
+            if not session:
+                return None
+            messages = self.get_messages(session_id, db=_db) if include_messages else None
+            return self._format_session(session, messages)
         finally:
-            db.close()
+            if db is None:
+                _db.close()
+
+    def get_messages(self, session_id: str, start: int = 0, end: int = None, db: Session = None) -> List[Dict[str, Any]]:
+        """
+        Read a range of a session's messages.
+
+        Args:
+            session_id: Session ID
+            start: First message position (inclusive)
+            end: Last message position (exclusive); None = through the latest
+
+        Returns:
+            Messages ordered by position
+        """
+        _db = db or SessionLocal()
+        try:
+            query = _db.query(AIMessage).filter(AIMessage.session_id == session_id, AIMessage.seq >= start)
+            if end is not None:
+                query = query.filter(AIMessage.seq < end)
+            return [self._format_message(m) for m in query.order_by(AIMessage.seq).all()]
+        finally:
+            if db is None:
+                _db.close()
     
-    def get_user_sessions(self, user_id: str) -> List[Dict[str, Any]]:
+    def get_user_sessions(self, user_id: str, db: Session = None) -> List[Dict[str, Any]]:
         """Get all sessions for a user from DB."""
-        db = SessionLocal()
+        _db = db or SessionLocal()
         try:
-            sessions = db.query(AISession).filter_by(user_id=int(user_id)).all()
+            sessions = _db.query(AISession).filter_by(user_id=int(user_id)).all()
             return [self._format_session(s) for s in sessions]
         finally:
-            db.close()
+            if db is None:
+                _db.close()
     
-    def get_user_memory(self, user_id: int) -> Dict[str, Any]:
+    def get_user_memory(self, user_id: int, db: Session = None) -> Dict[str, Any]:
         """
         Get long-term user memory for personalization.
-        Aggregates data from DB and all user sessions.
+        Served from the materialized learner profile (see app.shared.learner_profile).
         """
-        from app.core.database import SessionLocal, StudentPerformance
-        db = SessionLocal()
-        user_sessions = self.get_user_sessions(str(user_id))
-        
-        # Aggregate topics and mistakes from DB
-        db_perf = db.query(StudentPerformance).filter_by(user_id=user_id).all()
-        topics_covered = {p.topic_id for p in db_perf}
-        common_mistakes = []
-        for p in db_perf:
-            if p.mistakes_json:
-                mistakes = json.loads(p.mistakes_json)
-                common_mistakes.extend(mistakes)
-        
-        # Aggregate stats
-        total_mastery = sum(p.mastery for p in db_perf if p.mastery) if db_perf else 0
-        hints_total = sum(s.get("hints_used", 0) for s in user_sessions)
-        
-        # Calculate overall mastery
-        overall_mastery = total_mastery / len(db_perf) if db_perf else 0
-        
-        # Determine learning style
-        learning_style = self._infer_learning_style(user_sessions)
-        db.close()
-        
-        return {
-            "topics_covered": list(topics_covered),
-            "overall_mastery": round(overall_mastery, 2),
-            "total_sessions": len(user_sessions),
-            "total_hints_used": hints_total,
-            "learning_style": learning_style,
-            "common_mistakes": list(set(common_mistakes))[:10], # Top 10 unique
-            "preferred_topics": [] 
-        }
+        return learner_profile_service.get_memory(user_id, db=db)
 
-    def record_mistake(self, user_id: int, topic_id: str, mistake_text: str):
-        """Log a student mistake to DB for future remediation."""
-        from app.core.database import SessionLocal, StudentPerformance
-        db = SessionLocal()
+    def record_mistake(self, user_id: int, topic_id: str, mistake_text: str, db: Session = None):
+        """Log a student mistake to the learner profile for future remediation."""
+        _db = db or SessionLocal()
         try:
-            perf = db.query(StudentPerformance).filter_by(user_id=user_id, topic_id=topic_id).first()
-            if perf:
-                mistakes = json.loads(perf.mistakes_json) if perf.mistakes_json else []
-                if mistake_text not in mistakes:
-                    mistakes.append(mistake_text)
-                    perf.mistakes_json = json.dumps(mistakes)
-                    db.commit()
+            learner_profile_service.record_mistake(_db, user_id, mistake_text)
+            commit_or_flush(_db, owned=db is None)
         except:
-            db.rollback()
+            if db is not None:
+                raise  # the unit of work decides whether to roll back
+            _db.rollback()
         finally:
-            db.close()
+            if db is None:
+                _db.close()
     
-    def _infer_learning_style(self, sessions: List[Dict[str, Any]]) -> str:
-        """Infer learning style from session patterns."""
-        if not sessions:
-            return "balanced"
-        
-        interactive_count = sum(1 for s in sessions if s.get("mode") == "interactive")
-        chat_count = sum(1 for s in sessions if s.get("mode") == "chat")
-        
-        if interactive_count > chat_count * 2:
-            return "hands-on"
-        elif chat_count > interactive_count * 2:
-            return "conversational"
-        else:
-            return "balanced"
-
     # ==========================================
     # CHAT MODE
     # ==========================================
     
-    def add_chat_message(self, session_id: str, role: str, content: str, web_scraped: bool = False) -> Dict[str, Any]:
-        """Add a message to chat session in DB."""
-        db = SessionLocal()
+    def add_chat_message(self, session_id: str, role: str, content: str, web_scraped: bool = False,
+                         db: Session = None) -> Dict[str, Any]:
+        """Append a message to a session (one counter bump + one row insert)."""
+        _db = db or SessionLocal()
         try:
-            session = db.query(AISession).filter_by(session_id=session_id).first()
-            if not session:
+            now = datetime.datetime.utcnow()
+            # Atomic increment reserves the position and row-locks the session until commit
+            reserved = _db.query(AISession).filter_by(session_id=session_id).update(
+                {"message_count": AISession.message_count + 1, "last_activity": now},
+                synchronize_session=False
+            )
+            if not reserved:
                 return None
+            count, summarized = _db.query(AISession.message_count, AISession.summarized_messages).filter_by(
+                session_id=session_id
+            ).one()
             
-            messages = json.loads(session.messages_json)
-            message = {
-                "role": role,
-                "content": content,
-                "web_scraped": web_scraped,
-                "timestamp": datetime.datetime.now().isoformat()
-            }
-            messages.append(message)
-            session.messages_json = json.dumps(messages)
-            session.last_activity = datetime.datetime.utcnow()
-            db.commit()
-            return message
+            message = AIMessage(
+                session_id=session_id,
+                seq=count - 1,
+                role=role,
+                content=content,
+                web_scraped=web_scraped,
+                timestamp=now
+            )
+            _db.add(message)
+            
+            # Fold aged-out messages into the rolling summary off the request path (after commit)
+            if history_compactor.due(count, summarized or 0):
+                _db.info.setdefault("compaction_due", set()).add(session_id)
+            commit_or_flush(_db, owned=db is None)
+            return self._format_message(message)
         finally:
-            db.close()
+            if db is None:
+                _db.close()
     
-    def get_chat_context(self, session_id: str, max_messages: int = 10) -> str:
-        """Get conversation context for AI prompt."""
-        session = self.get_session(session_id)
+    def get_chat_context(self, session_id: str, db: Session = None) -> str:
+        """Get conversation context for AI prompt (rolling summary + recent messages)."""
+        session = self.get_session(session_id, db=db)
         if not session:
             return ""
         
-        messages = session["messages"][-max_messages:]
-        context = ""
-        for msg in messages:
-            prefix = "[STUDENT]" if msg["role"] == "user" else "[MUSA]"
-            context += f"{prefix} {msg['content']}\n"
-        return context
+        summarized = session["summarized_messages"]
+        start = history_compactor.window_start(session["message_count"], summarized)
+        return history_compactor.render(
+            self.get_messages(session_id, start, db=db), session["history_summary"], max(0, summarized - start)
+        )
+
+    def _compact_history(self, session_id: str) -> bool:
+        """Summarise messages that aged out of the verbatim window (background job)."""
+        session = self.get_session(session_id)
+        if not session:
+            return False
+        start = session["summarized_messages"]
+        end = session["message_count"] - history_compactor.keep_messages
+        if end <= start:
+            return False
+        
+        messages = self.get_messages(session_id, start, end)
+        summary = history_compactor.summarize(session["history_summary"], messages)
+        if not summary:
+            return False
+        
+        db = SessionLocal()
+        try:
+            # Compare-and-set: skip if another worker already advanced the summary
+            updated = db.query(AISession).filter(
+                AISession.session_id == session_id,
+                AISession.summarized_messages == start
+            ).update({"history_summary": summary, "summarized_messages": end}, synchronize_session=False)
+            db.commit()
+            return updated == 1
+        finally:
+            db.close()
     
     # ==========================================
     # TUTOR STATE MACHINE (Interactive Mode)
@@ -245,22 +289,25 @@ class AISessionService:
         finally:
             db.close()
     
-    def record_hint_used(self, session_id: str):
+    def record_hint_used(self, session_id: str, db: Session = None):
         """Record that a hint was used in DB."""
-        db = SessionLocal()
+        _db = db or SessionLocal()
         try:
-            session = db.query(AISession).filter_by(session_id=session_id).first()
+            session = _db.query(AISession).filter_by(session_id=session_id).first()
             if session:
                 session.hints_used += 1
-                db.commit()
+                learner_profile_service.record_hint(_db, session.user_id)
+                commit_or_flush(_db, owned=db is None)
         finally:
-            db.close()
+            if db is None:
+                _db.close()
     
-    def update_session_mastery(self, session_id: str, reading_score: float, exercise_score: float) -> float:
+    def update_session_mastery(self, session_id: str, reading_score: float, exercise_score: float,
+                               db: Session = None) -> float:
         """Update mastery for interactive session in DB."""
-        db = SessionLocal()
+        _db = db or SessionLocal()
         try:
-            session = db.query(AISession).filter_by(session_id=session_id).first()
+            session = _db.query(AISession).filter_by(session_id=session_id).first()
             if not session:
                 return 0.0
             
@@ -269,10 +316,11 @@ class AISessionService:
             mastery = max(0.0, min(1.0, mastery))
             
             session.mastery = round(mastery, 3)
-            db.commit()
+            commit_or_flush(_db, owned=db is None)
             return session.mastery
         finally:
-            db.close()
+            if db is None:
+                _db.close()
     
     # ==========================================
     # TUTOR PROMPT GENERATION
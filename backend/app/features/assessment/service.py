@@ -7,6 +7,7 @@ from typing import List, Dict, Any
 from sqlalchemy.orm import joinedload
 from app.core.database import SessionLocal, AssessmentSubmission, CourseAnalytics, Assessment, Course, Module, SubTopic
 from app.shared.model_service import model_service
+from app.shared.single_flight import single_flight, flight_key
 from app.shared.utils import calculate_gpa_score
 
 # ASSESSMENTS_FILE removed - relying on 'assessments' table now.
@@ -53,7 +54,10 @@ class AssessmentService:
             db.close()
 
     def get_or_create_final_exam(self, course_id: str):
-        """Generate or retrieve Final Exam."""
+        """Generate or retrieve Final Exam (concurrent first requests share one generation)."""
+        return single_flight.do(flight_key("final-exam", course_id), self._get_or_create_final_exam, course_id)
+
+    def _get_or_create_final_exam(self, course_id: str):
         exam_id = f"final-exam-{course_id}"
         
         db = SessionLocal()
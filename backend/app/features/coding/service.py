@@ -2,6 +2,7 @@ import json
 from sqlalchemy.orm import Session
 from app.core.database import SessionLocal, GeneratedContent
 from app.shared.model_service import model_service
+from app.shared.rate_limiter import Priority
 from .models import LessonDefinition, LessonSpec, LessonConstraints, Language, GradingResult
 
 class LessonService:
@@ -38,6 +39,36 @@ class LessonService:
             if db is None:
                 _db.close()
 
+    @staticmethod
+    def _parse_lesson(response: str, topic: str):
+        """Extract the lesson JSON from an AI reply. Returns (data, LessonDefinition); raises if invalid."""
+        # Clean JSON
+        clean_json = response.strip()
+        
+        # Robust JSON extraction
+        if "```json" in clean_json:
+            clean_json = clean_json.split("```json")[1].split("```")[0].strip()
+        elif "```" in clean_json:
+            clean_json = clean_json.split("```")[1].split("```")[0].strip()
+        elif "{" in clean_json:
+            # Find start and end of JSON object
+            start = clean_json.find("{")
+            end = clean_json.rfind("}")
+            if start != -1 and end != -1:
+                clean_json = clean_json[start:end+1]
+        
+        if not clean_json:
+            print(f"[CodingService] ERROR: AI response was empty or contained no JSON blocks. Raw: {response[:100]}...")
+            raise ValueError("AI response empty")
+            
+        data = json.loads(clean_json)
+        
+        # Ensure ID match
+        data["id"] = topic
+        
+        # Validate with Pydantic
+        return data, LessonDefinition(**data)
+
     def generate_lesson(self, topic: str, db: Session) -> LessonDefinition:
         """Generate a new coding lesson using AI."""
         print(f"[CodingService] Generating lesson for topic: {topic}")
@@ -64,35 +95,14 @@ class LessonService:
         Only return valid JSON.
         """
         
-        response = model_service.generate_response(prompt, max_tokens=1024)
+        # Only a reply that yields a valid lesson is cached; a malformed one is regenerated next time
+        response = model_service.generate_response(
+            prompt, max_tokens=1024, use_cache=True, priority=Priority.BACKGROUND,
+            validate=lambda raw: self._parse_lesson(raw, topic)
+        )
         
         try:
-            # Clean JSON
-            clean_json = response.strip()
-            
-            # Robust JSON extraction
-            if "```json" in clean_json:
-                clean_json = clean_json.split("```json")[1].split("```")[0].strip()
-            elif "```" in clean_json:
-                clean_json = clean_json.split("```")[1].split("```")[0].strip()
-            elif "{" in clean_json:
-                # Find start and end of JSON object
-                start = clean_json.find("{")
-                end = clean_json.rfind("}")
-                if start != -1 and end != -1:
-                    clean_json = clean_json[start:end+1]
-            
-            if not clean_json:
-                print(f"[CodingService] ERROR: AI response was empty or contained no JSON blocks. Raw: {response[:100]}...")
-                raise ValueError("AI response empty")
-                
-            data = json.loads(clean_json)
-            
-            # Ensure ID match
-            data["id"] = topic
-            
-            # Validate with Pydantic
-            lesson = LessonDefinition(**data)
+            data, lesson = self._parse_lesson(response, topic)
             
             # Save to DB
             new_content = GeneratedContent(
@@ -136,6 +146,6 @@ class LessonService:
         - If correct, congratulate and suggest a way to optimize or a related advanced concept.
         - Be brief (max 3-4 sentences).
         """
-        return model_service.generate_response(prompt, max_tokens=300)
+        return model_service.generate_response(prompt, max_tokens=300, priority=Priority.INTERACTIVE)
 
 coding_service = LessonService()
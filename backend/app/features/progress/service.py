@@ -5,9 +5,10 @@ SQLAlchemy-based single source of truth for student progress.
 import datetime
 from typing import Dict, Any, Optional, List
 from sqlalchemy.orm import Session
-from app.core.database import StudentPerformance, SubTopic, Module, SessionLocal, ActivityLog
+from app.core.database import StudentPerformance, SubTopic, Module, SessionLocal, ActivityLog, commit_or_flush
 
 from app.shared.schemas import TopicIdentifier
+from app.shared.learner_profile import learner_profile_service
 
 class ProgressService:
     def __init__(self):
@@ -52,8 +53,7 @@ class ProgressService:
                 passed=False
             )
             db.add(perf)
-            db.commit()
-            db.refresh(perf)
+            db.flush()  # callers commit together with their own changes
             
         return perf
 
@@ -61,6 +61,7 @@ class ProgressService:
         db = SessionLocal()
         try:
             perf = self._get_or_create_performance(db, user_id, topic_id)
+            old_mastery = perf.mastery
             
             # Use JSON-like field names for response compatibility if needed, 
             # but we'll use performance attributes
@@ -84,16 +85,18 @@ class ProgressService:
             
             perf.duration_seconds += int(time_spent)
             perf.last_attempt = datetime.datetime.utcnow()
+            learner_profile_service.record_topic(db, user_id, topic_id, perf.mastery - old_mastery)
             
             db.commit()
             return self._format_response(perf)
         finally:
             db.close()
 
-    def update_exercise_score(self, user_id: int, topic_id: str, score: float) -> Dict[str, Any]:
-        db = SessionLocal()
+    def update_exercise_score(self, user_id: int, topic_id: str, score: float, db: Session = None) -> Dict[str, Any]:
+        _db = db or SessionLocal()
         try:
-            perf = self._get_or_create_performance(db, user_id, topic_id)
+            perf = self._get_or_create_performance(_db, user_id, topic_id)
+            old_mastery = perf.mastery
             
             perf.attempts += 1
             if score >= 80:
@@ -108,11 +111,25 @@ class ProgressService:
             perf.mastery = round(read_component + exercise_component, 2)
             
             perf.last_attempt = datetime.datetime.utcnow()
-            db.commit()
+            learner_profile_service.record_topic(_db, user_id, topic_id, perf.mastery - old_mastery)
+            commit_or_flush(_db, owned=db is None)
             
             return self._format_response(perf)
         finally:
-            db.close()
+            if db is None:
+                _db.close()
+
+    def get_topic_progress(self, user_id: int, topic_id: str, db: Session = None) -> Dict[str, Any]:
+        """Current progress for one topic (read-only; zero progress if never started)."""
+        _db = db or SessionLocal()
+        try:
+            perf = _db.query(StudentPerformance).filter_by(user_id=user_id, topic_id=topic_id).first()
+            if not perf:
+                return {"user_id": str(user_id), "topic_id": topic_id, "read_progress": 0.0, "mastery": 0.0}
+            return self._format_response(perf)
+        finally:
+            if db is None:
+                _db.close()
 
     def check_exercise_unlock(self, user_id: int, topic_id: str) -> bool:
         db = SessionLocal()
@@ -207,8 +224,10 @@ class ProgressService:
         try:
             chapter_topic = f"{course_id}-chapter-{chapter_index}"
             perf = self._get_or_create_performance(db, user_id, chapter_topic, course_id)
+            old_mastery = perf.mastery
             perf.passed = True
             perf.mastery = 1.0
+            learner_profile_service.record_topic(db, user_id, chapter_topic, perf.mastery - old_mastery)
             db.commit()
         finally:
             db.close()
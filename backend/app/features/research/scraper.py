@@ -15,6 +15,7 @@ from typing import List, Dict, Optional
 from bs4 import BeautifulSoup
 from duckduckgo_search import DDGS
 from .production_scraper import production_scraper
+from app.shared.rate_limiter import Priority
 
 # ============================================
 # TRUSTED DOMAINS & CONFIG
@@ -72,7 +73,7 @@ Snippet: {text[:500]}"""
         try:
             # Run blocking LLM call in thread
             response = await asyncio.to_thread(
-                self.model_service.generate_response, prompt, max_tokens=100
+                self.model_service.generate_response, prompt, max_tokens=100, priority=Priority.BACKGROUND
             )
             
             # Robust JSON extraction
@@ -38,3 +38,8 @@ class UpdateStructureRequest(BaseModel):
 
 class GenerateQuizRequest(BaseModel):
     section_content: str
+
+class TextbookChatRequest(BaseModel):
+    chapter_id: str
+    section_title: str
+    message: str
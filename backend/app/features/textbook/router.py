@@ -2,14 +2,17 @@
 Textbook Feature Router
 Electronic textbook generation and content endpoints.
 """
+import json
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional
 
 from .service import textbook_service
-from .models import UpdateStructureRequest, GenerateQuizRequest
+from .models import UpdateStructureRequest, GenerateQuizRequest, TextbookChatRequest
 from app.features.auth.service import auth_service
 from app.features.progress.service import progress_service
+from app.shared.async_model_service import async_model_service
 from app.core.database import User
 
 router = APIRouter()
@@ -56,7 +59,7 @@ async def generate_quiz(
     current_user: User = Depends(auth_service.get_current_user)
 ):
     """Generate a quiz for a section."""
-    return textbook_service.generate_quiz(data.section_content)
+    return await async_model_service.run_blocking(textbook_service.generate_quiz, data.section_content)
 
 
 class GenerateFinalExamRequest(BaseModel):
@@ -78,7 +81,8 @@ async def generate_final_exam_endpoint(
     if not textbook:
         raise HTTPException(status_code=404, detail="Textbook not found")
         
-    return textbook_service.generate_final_exam(
+    return await async_model_service.run_blocking(
+        textbook_service.generate_final_exam,
         data.course_id,
         textbook.get("title", "Course"),
         textbook
@@ -98,7 +102,7 @@ async def generate_chapter_assessment(
     current_user: User = Depends(auth_service.get_current_user)
 ):
     """Generate a full chapter assessment (10 MCQs + 2 Open-Ended)."""
-    return textbook_service.generate_chapter_assessment(
+    return await textbook_service.generate_chapter_assessment(
         data.course_id, 
         data.chapter_index, 
         data.chapter_title, 
@@ -115,3 +119,21 @@ async def get_chapter(
 ):
     """Get specific chapter content."""
     return textbook_service.get_chapter(course_id, chapter_id)
+
+
+@router.post("/{course_id}/chat/stream")
+async def stream_textbook_chat(
+    course_id: str,
+    data: TextbookChatRequest,
+    current_user: User = Depends(auth_service.get_current_user)
+):
+    """Chat about a textbook section, streamed as Server-Sent Events."""
+    def events():
+        parts = []
+        for text in textbook_service.stream_chat_context(course_id, data.chapter_id, data.section_title, data.message):
+            parts.append(text)
+            yield f"event: token\ndata: {json.dumps({'text': text})}\n\n"
+        yield f"event: done\ndata: {json.dumps({'response': ''.join(parts).strip()})}\n\n"
+    
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -1,8 +1,13 @@
 import json
 import datetime
+from typing import Dict, Any
 from app.core.database import Course, Module, CourseMaterial, GeneratedContent, SessionLocal, get_db
 from sqlalchemy.orm import Session
 from app.shared.model_service import model_service
+from app.shared.async_model_service import async_model_service
+from app.shared.single_flight import single_flight, flight_key
+from app.shared.rate_limiter import Priority
+from app.shared.prompt_builder import section_prompt
 from app.features.courses.service import course_service
 from app.shared.schemas import TopicIdentifier
 
@@ -86,7 +91,9 @@ class TextbookService:
                 # Generate Intro if missing
                 if not chapter.get("intro") or force_regenerate:
                     intro_prompt = f"Write an engaging introduction for the chapter '{chapter['title']}' in the course '{textbook_content['title']}'."
-                    chapter["intro"] = model_service.generate_response(intro_prompt)
+                    chapter["intro"] = await async_model_service.agenerate_response(
+                        intro_prompt, use_cache=not force_regenerate, priority=Priority.BACKGROUND
+                    )
 
                 # Generate Section Content
                 for section in chapter["sections"]:
@@ -95,9 +102,11 @@ class TextbookService:
 
                     print(f"  - Generating Section: {section['title']}")
                     
-                    # RAG Context Retrieval
+                    # RAG Context Retrieval (embedding call + vector search run off the event loop)
                     query = f"{chapter['title']}: {section['title']}"
-                    context = retriever.retrieve_context(query, str(course_id), max_tokens=1500)
+                    context = await async_model_service.run_blocking(
+                        retriever.retrieve_context, query, str(course_id), max_tokens=1500
+                    )
                     
                     # DeepSeek Prompt for Detailed Content
                     prompt = f"""You are the author of a comprehensive university-level textbook.
@@ -118,17 +127,28 @@ Structure:
 
 Write ONLY the content in Markdown format.
 """
-                    content = model_service.generate_response(prompt, max_tokens=3000)
+                    content = await async_model_service.agenerate_response(
+                        prompt, max_tokens=3000, use_cache=not force_regenerate, priority=Priority.BACKGROUND
+                    )
                     section["content"] = content
                     
                     # Save progress after each section (to handle timeouts/failures)
-                    self._save_to_db(_db, c_id, textbook_content, user_id)
+                    await async_model_service.run_blocking(self._save_to_db, _db, c_id, textbook_content, user_id)
 
                 # Generate Summary if missing
                 if not chapter.get("summary") or force_regenerate:
-                    summary_prompt = f"Summarize the key points of the chapter '{chapter['title']}' based on its sections."
-                    chapter["summary"] = model_service.generate_response(summary_prompt)
-                    self._save_to_db(_db, c_id, textbook_content, user_id)
+                    # The prompt carries the course and the generated sections, so the cache key is
+                    # specific to this chapter's content (not shared by every "Introduction")
+                    sections_text = "\n\n".join(
+                        f"## {section['title']}\n{(section.get('content') or '')[:1500]}" for section in chapter["sections"]
+                    )
+                    summary_prompt = f"""Summarize the key points of the chapter '{chapter['title']}' in the course '{textbook_content['title']}' based on its sections.
+
+{sections_text}"""
+                    chapter["summary"] = await async_model_service.agenerate_response(
+                        summary_prompt, use_cache=not force_regenerate, priority=Priority.BACKGROUND
+                    )
+                    await async_model_service.run_blocking(self._save_to_db, _db, c_id, textbook_content, user_id)
 
             return textbook_content
 
@@ -163,9 +183,17 @@ Write ONLY the content in Markdown format.
 
     def chat_context(self, course_id, chapter_id, section_title, user_query):
         """Context-aware chat with Musa about specific textbook section."""
+        return model_service.generate_response(self._chat_prompt(course_id, chapter_id, section_title, user_query))
+
+    def stream_chat_context(self, course_id, chapter_id, section_title, user_query):
+        """Streaming variant of chat_context (yields text deltas)."""
+        prompt = self._chat_prompt(course_id, chapter_id, section_title, user_query)
+        return model_service.stream_generate(prompt, use_cache=False)
+
+    def _chat_prompt(self, course_id, chapter_id, section_title, user_query):
         textbook = self.get_textbook(course_id)
         if not textbook:
-            return model_service.generate_response(user_query)
+            return user_query
 
         # Find the specific section content
         context_text = ""
@@ -176,18 +204,14 @@ Write ONLY the content in Markdown format.
                         context_text = section.get('content', "")
                         break
         
-        prompt = f"""You are Musa, the EduNexus AI Tutor. 
-You are helping a student who is currently reading the following section of their Electronic Textbook:
-Context: {context_text[:3000]}
-
-Student: {user_query}
-
-Provide a deep, insightful, and supportive response based on the textbook content. Track their progress and encourage further inquiry."""
-        
-        return model_service.generate_response(prompt)
+        # The section is the cacheable prefix; the system prompt already introduces Musa
+        return section_prompt(user_query, context_text)
 
     def generate_quiz(self, section_content: str):
-        """Generate a 3-question MCQ quiz for a section."""
+        """Generate a 3-question MCQ quiz for a section (one generation per section at a time)."""
+        return single_flight.do(flight_key("quiz", section_content[:2000]), self._generate_quiz, section_content)
+
+    def _generate_quiz(self, section_content: str):
         prompt = f"""Generate a mini-quiz to test comprehension of the following text:
 Text: {section_content[:2000]}
 
@@ -212,7 +236,15 @@ Requirements:
         - 10 MCQs (5 marks each)
         - 2 Open-Ended (5 marks each)
         - Total 60 Marks
+
+        Concurrent requests for the same chapter share one generation (and one registration).
         """
+        key = flight_key("chapter-assessment", course_id, chapter_index, chapter_title, chapter_content[:15000])
+        return await single_flight.ado(
+            key, self._generate_chapter_assessment, course_id, chapter_index, chapter_title, chapter_content
+        )
+
+    async def _generate_chapter_assessment(self, course_id: str, chapter_index: int, chapter_title: str, chapter_content: str):
         prompt = f"""Create a comprehensive assessment for the chapter '{chapter_title}'.
         
 Content Context:
@@ -248,11 +280,9 @@ Output Format (Strict JSON):
   ]
 }}
 """
-        # Run in thread pool to avoid blocking
-        loop = asyncio.get_event_loop()
-        full_assessment = await loop.run_in_executor(
-            None, 
-            lambda: self._generate_json(prompt, default={"mcqs": [], "open_ended": []})
+        # Run in the LLM executor to avoid blocking
+        full_assessment = await async_model_service.run_blocking(
+            self._generate_json, prompt, default={"mcqs": [], "open_ended": []}
         )
         
         # Add Metadata
@@ -297,6 +327,10 @@ Output Format (Strict JSON):
         """
         Generate a comprehensive final exam for the course.
         """
+        key = flight_key("final-exam", course_id, title, json.dumps(textbook_content, sort_keys=True))
+        return single_flight.do(key, self._generate_final_exam, course_id, title, textbook_content)
+
+    def _generate_final_exam(self, course_id: str, title: str, textbook_content: Dict[str, Any]):
         # 1. Aggregate Content Summary (Limit size for context window)
         # We'll take chapter summaries and titles.
         context_text = f"Course: {title}\n\n"
@@ -358,21 +392,29 @@ Output Format (Strict JSON):
             
         return sanitized
 
+    @staticmethod
+    def _parse_json(response):
+        """Extract and parse the JSON payload of an AI reply (raises if there is none)."""
+        clean_json = response.strip()
+        if "```json" in clean_json:
+            clean_json = clean_json.split("```json")[1].split("```")[0].strip()
+        elif "```" in clean_json:
+             clean_json = clean_json.split("```")[1].split("```")[0].strip()
+        elif "[" in clean_json and clean_json.startswith("["): # Array
+            pass 
+        elif "{" in clean_json: # Object
+            clean_json = "{" + clean_json.split("{", 1)[1].rsplit("}", 1)[0] + "}"
+        
+        return json.loads(clean_json)
+
     def _generate_json(self, prompt, default=None):
         """Helper to generate and parse JSON from AI."""
         try:
-            response = model_service.generate_response(prompt, max_tokens=2000)
-            clean_json = response.strip()
-            if "```json" in clean_json:
-                clean_json = clean_json.split("```json")[1].split("```")[0].strip()
-            elif "```" in clean_json:
-                 clean_json = clean_json.split("```")[1].split("```")[0].strip()
-            elif "[" in clean_json and clean_json.startswith("["): # Array
-                pass 
-            elif "{" in clean_json: # Object
-                clean_json = "{" + clean_json.split("{", 1)[1].rsplit("}", 1)[0] + "}"
-            
-            return json.loads(clean_json)
+            # Only replies that parse are cached, so a malformed one is regenerated next time
+            response = model_service.generate_response(
+                prompt, max_tokens=2000, use_cache=True, priority=Priority.BACKGROUND, validate=self._parse_json
+            )
+            return self._parse_json(response)
         except Exception as e:
             print(f"Error generating JSON: {e}")
             return default
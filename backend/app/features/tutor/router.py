@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, Body
+from fastapi import APIRouter, Depends, HTTPException, Body, BackgroundTasks
 import datetime
 from sqlalchemy.orm import Session
 from app.core.database import get_db, User
@@ -25,11 +25,13 @@ class CourseCreate(BaseModel):
     is_programming: Optional[bool] = False
 
 class SubTopicUpdate(BaseModel):
+    id: Optional[int] = None  # existing sub-topic (kept in place)
     title: str
     content: Optional[str] = ""
     practice_code: Optional[str] = ""
 
 class ModuleUpdate(BaseModel):
+    id: Optional[int] = None  # existing module (kept in place)
     title: str
     description: Optional[str] = ""
     expected_outcome: Optional[str] = ""
@@ -67,13 +69,26 @@ async def create_course(course: CourseCreate, db: Session = Depends(get_db), cur
     return TutorService.create_course(db, current_user.id, course.dict())
 
 @router.post("/courses/{course_id}/outline")
-async def update_course_outline(course_id: int, outline: List[ModuleUpdate], db: Session = Depends(get_db), current_user: User = Depends(auth_service.get_current_user)):
+async def update_course_outline(course_id: int, outline: List[ModuleUpdate], background_tasks: BackgroundTasks, db: Session = Depends(get_db), current_user: User = Depends(auth_service.get_current_user)):
     if current_user.role != "tutor":
         raise HTTPException(status_code=403, detail="Tutor access only.")
     # In full app, we'd check if current_user owns this course
     success = TutorService.update_course_outline(db, course_id, [m.dict() for m in outline])
+    if success:
+        # Incremental RAG re-index: ids survive the edit, so only changed topics are re-embedded
+        background_tasks.add_task(_reindex_course, course_id)
     return {"status": "success" if success else "error"}
 
+def _reindex_course(course_id: int):
+    from app.features.courses.service import course_service
+    from app.core.rag.retriever import retriever
+    try:
+        course = course_service.get_course_by_id(str(course_id))
+        if course:
+            retriever.index_course(course)
+    except Exception as e:
+        print(f"[INDEX] Re-index of course {course_id} failed: {e}")
+
 @router.get("/courses/{course_id}/performance")
 async def get_course_performance(course_id: int, db: Session = Depends(get_db), current_user: User = Depends(auth_service.get_current_user)):
     if current_user.role != "tutor":
@@ -68,40 +68,75 @@ class TutorService:
         db.refresh(new_course)
         return new_course
 
+    @staticmethod
+    def _match_existing(existing: list, items: list) -> list:
+        """
+        Pair each outline item with an existing row: by id, then by title, then by position.
+        Returns one row (or None for a new item) per item.
+        """
+        unmatched = list(existing)
+        by_id = {row.id: row for row in existing}
+        matched = [None] * len(items)
+        for i, item in enumerate(items):
+            row = by_id.get(item.get('id'))
+            if row in unmatched:
+                matched[i] = row
+                unmatched.remove(row)
+        for i, item in enumerate(items):
+            if matched[i] is None:
+                row = next((r for r in unmatched if r.title == item['title']), None)
+                if row is not None:
+                    matched[i] = row
+                    unmatched.remove(row)
+        for i in range(len(items)):
+            if matched[i] is None and unmatched:
+                matched[i] = unmatched.pop(0)
+        return matched
+
     @staticmethod
     def update_course_outline(db: Session, course_id: int, outline: list):
-        # Outline is a list of modules, each with sub_topics
-        # Clear existing modules/subtopics for simplicity in this MVP sync
-        # In a real app, we'd do smart updates, but here we rebuild the tree
-        
-        # Delete existing
-        modules = db.query(Module).filter(Module.course_id == course_id).all()
-        for m in modules:
-            db.query(SubTopic).filter(SubTopic.module_id == m.id).delete()
-        db.query(Module).filter(Module.course_id == course_id).delete()
+        # Outline is a list of modules, each with sub_topics.
+        # Rows are updated in place so module/sub-topic ids survive an edit: RAG chunk ids
+        # and student progress are keyed by them, so only edited topics get re-indexed.
+        modules = db.query(Module).filter(Module.course_id == course_id).order_by(Module.order, Module.id).all()
+        matched = TutorService._match_existing(modules, outline)
         
-        # Add new
-        for i, mod_data in enumerate(outline):
-            new_mod = Module(
-                course_id=course_id,
-                title=mod_data['title'],
-                description=mod_data.get('description', ''),
-                expected_outcome=mod_data.get('expected_outcome', ''),
-                duration=mod_data.get('duration', '1h'),
-                locked=i > 0
-            )
-            db.add(new_mod)
+        for i, (mod_data, module) in enumerate(zip(outline, matched)):
+            if module is None:
+                module = Module(course_id=course_id)
+                db.add(module)
+            module.title = mod_data['title']
+            module.description = mod_data.get('description', '')
+            module.expected_outcome = mod_data.get('expected_outcome', '')
+            module.duration = mod_data.get('duration', '1h')
+            module.order = i
+            module.locked = i > 0
             db.flush() # Get ID
             
-            for j, sub_data in enumerate(mod_data.get('sub_topics', [])):
-                new_sub = SubTopic(
-                    module_id=new_mod.id,
-                    title=sub_data['title'],
-                    content=sub_data.get('content', 'Content coming soon...'),
-                    practice_code=sub_data.get('practice_code', ''),
-                    order=j
-                )
-                db.add(new_sub)
+            sub_topics = db.query(SubTopic).filter(SubTopic.module_id == module.id).order_by(SubTopic.order, SubTopic.id).all()
+            subs_data = mod_data.get('sub_topics', [])
+            matched_subs = TutorService._match_existing(sub_topics, subs_data)
+            for j, (sub_data, sub) in enumerate(zip(subs_data, matched_subs)):
+                if sub is None:
+                    sub = SubTopic(module_id=module.id)
+                    db.add(sub)
+                sub.title = sub_data['title']
+                sub.content = sub_data.get('content', 'Content coming soon...')
+                sub.practice_code = sub_data.get('practice_code', '')
+                sub.order = j
+            
+            # Sub-topics no longer in the outline
+            kept = {sub.id for sub in matched_subs if sub is not None}
+            for sub in sub_topics:
+                if sub.id not in kept:
+                    db.delete(sub)
+        
+        # Modules no longer in the outline
+        kept = {module.id for module in matched if module is not None}
+        for module in modules:
+            if module.id not in kept:
+                db.query(SubTopic).filter(SubTopic.module_id == module.id).delete()
+                db.delete(module)
         
         db.commit()
         return True
@@ -10,6 +10,9 @@ from datetime import datetime
 from typing import List, Dict, Optional
 import re
 
+from app.shared.prompt_builder import Prompt
+from app.shared.history_compactor import history_compactor
+
 # ============================================
 # CONVERSATION MEMORY
 # ============================================
@@ -20,6 +23,7 @@ class ConversationMemory:
     def __init__(self, max_turns: int = 10):
         self.max_turns = max_turns
         self.sessions: Dict[str, List[Dict]] = {}
+        self.summaries: Dict[str, str] = {}  # rolling summary of turns folded out of sessions
     
     def get_session(self, session_id: str) -> List[Dict]:
         """Get or create a conversation session."""
@@ -36,23 +40,41 @@ class ConversationMemory:
             "timestamp": datetime.now().isoformat()
         })
         
-        # Keep only last N turns
+        # Hard cap in case summarisation falls behind
         if len(session) > self.max_turns * 2:
-            self.sessions[session_id] = session[-(self.max_turns * 2):]
+            self.sessions[session_id] = session = session[-(self.max_turns * 2):]
+        
+        # Fold older turns into the rolling summary in the background
+        if history_compactor.due(len(session), 0):
+            history_compactor.schedule(f"voice:{session_id}", self._compact, session_id)
+    
+    def _compact(self, session_id: str) -> bool:
+        """Summarise and drop turns older than the verbatim window (background job)."""
+        session = self.sessions.get(session_id)
+        if not session:
+            return False
+        aged = session[:len(session) - history_compactor.keep_messages]
+        if not aged:
+            return False
+        summary = history_compactor.summarize(self.summaries.get(session_id), aged)
+        if not summary or self.sessions.get(session_id) is not session:
+            return False  # failed, or the session was cleared/trimmed meanwhile
+        self.summaries[session_id] = summary
+        del session[:len(aged)]
+        return True
     
     def get_context(self, session_id: str) -> str:
-        """Build conversation context for LLM."""
-        session = self.get_session(session_id)
-        context_parts = []
-        for msg in session:
-            role = "Student" if msg["role"] == "user" else "Tutor"
-            context_parts.append(f"{role}: {msg['content']}")
-        return "\n".join(context_parts)
+        """Build conversation context for LLM (rolling summary + recent turns)."""
+        return history_compactor.render(
+            self.get_session(session_id), self.summaries.get(session_id), 0,
+            labels=("Student:", "Tutor:"), summary_label="Earlier in this conversation:"
+        ).rstrip("\n")
     
     def clear_session(self, session_id: str):
         """Clear a conversation session."""
         if session_id in self.sessions:
             del self.sessions[session_id]
+        self.summaries.pop(session_id, None)
 
 # ============================================
 # TUTOR PERSONALITY
@@ -145,12 +167,11 @@ class VoiceService:
         context = self.memory.get_context(session_id)
         
         # Build prompt for LLM
-        prompt = f"""{TUTOR_SYSTEM_PROMPT}
-
-Conversation so far:
+        # Persona first (cacheable prefix), then the growing conversation
+        prompt = Prompt(f"{TUTOR_SYSTEM_PROMPT}\n\n", f"""Conversation so far:
 {context}
 
-Tutor:"""
+Tutor:""")
         
         # Generate response
         if self.model_service and self.model_service.llm:
@@ -0,0 +1,183 @@
+"""
+Async Model Service
+Awaitable counterparts of ModelService for async FastAPI handlers.
+
+LLM requests go through the provider pool's async clients, so a slow
+completion no longer holds the event loop. Blocking work (retrieval, cache
+I/O, grading helpers, providers without an async client) runs on a
+dedicated, bounded thread pool instead of the loop thread.
+"""
+import os
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, Callable
+
+from app.core.rag.retriever import retriever
+from app.shared.model_service import model_service, ModelService, SYSTEM_PROMPT
+from app.shared.completion_cache import completion_cache, completion_key
+from app.shared.provider_pool import provider_pool, ProviderError
+from app.shared.single_flight import single_flight
+from app.shared.rate_limiter import Priority
+
+
+class AsyncModelService:
+    def __init__(self, service: ModelService, max_concurrency: int = 256, executor_workers: int = 16):
+        """
+        Initialize async model service.
+
+        Args:
+            service: Synchronous ModelService holding provider configuration
+            max_concurrency: Maximum in-flight LLM requests per worker
+            executor_workers: Threads for blocking work
+        """
+        self.service = service
+        self.max_concurrency = max_concurrency
+        self.executor = ThreadPoolExecutor(max_workers=executor_workers, thread_name_prefix="llm-blocking")
+        self.executor_workers = executor_workers
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.counters = {"requests": 0, "in_flight": 0, "errors": 0}
+
+    # ============================================
+    # EXECUTION HELPERS
+    # ============================================
+
+    async def run_blocking(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run a synchronous callable on the bounded executor."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+
+    def _limit(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    # ============================================
+    # CORE GENERATION
+    # ============================================
+
+    async def agenerate(self, prompt: str, max_tokens: int = 500, use_cache: bool = False,
+                        priority: Priority = Priority.CHAT, validate: Callable[[str], Any] = None) -> str:
+        """Awaitable ModelService._generate (same caching and fallback semantics)."""
+        if not self.service.llm:
+            loaded = await self.run_blocking(self.service.load_model)
+            if not loaded:
+                return "I'm having trouble loading my AI brain. Please try again."
+
+        provider, model = self.service._active_model()
+        key = completion_key(provider, model, prompt, max_tokens, self.service.temperature)
+        if not use_cache:
+            return await self._limited_call(prompt, max_tokens, priority)
+
+        cached = await self.run_blocking(completion_cache.get, key)
+        if cached is not None:
+            return cached
+        return await single_flight.ado(key, self._afill_cache, key, prompt, max_tokens, provider, model, priority,
+                                       validate)
+
+    async def _afill_cache(self, key: str, prompt: str, max_tokens: int, provider: str, model: str,
+                           priority: Priority = Priority.CHAT, validate: Callable[[str], Any] = None) -> str:
+        """Generate a cache miss and store it (run once per key by single_flight)."""
+        response = await self._limited_call(prompt, max_tokens, priority)
+        if self.service._cacheable(response, validate):
+            await self.run_blocking(completion_cache.put, key, response, provider, model)
+        return response
+
+    async def _limited_call(self, prompt: str, max_tokens: int, priority: Priority = Priority.CHAT) -> str:
+        async with self._limit():
+            self.counters["requests"] += 1
+            self.counters["in_flight"] += 1
+            try:
+                return await self._acall_llm(prompt, max_tokens, priority)
+            finally:
+                self.counters["in_flight"] -= 1
+
+    async def agenerate_response(self, prompt: str, max_tokens: int = 500, use_cache: bool = False,
+                                 priority: Priority = Priority.CHAT, validate: Callable[[str], Any] = None) -> str:
+        """Public wrapper for content generation."""
+        return await self.agenerate(prompt, max_tokens, use_cache=use_cache, priority=priority, validate=validate)
+
+    async def _acall_llm(self, prompt: str, max_tokens: int, priority: Priority = Priority.CHAT) -> str:
+        """Single uncached request, routed by the provider pool (with failover)."""
+        if self.service.llm == "POOL":
+            try:
+                text, _ = await provider_pool.agenerate(
+                    SYSTEM_PROMPT, prompt, max_tokens, self.service.temperature, priority
+                )
+                return text
+            except ProviderError as e:
+                print(f"[AI] All LLM providers failed: {e}")
+                self.counters["errors"] += 1
+                return "I'm having trouble connecting to the AI cloud."
+
+        # Fallback to Mock
+        return f"This is a simulated response (API not configured). Request: {prompt[:30]}..."
+
+    # ============================================
+    # TUTOR GENERATION
+    # ============================================
+
+    async def agenerate_with_rag(self, query: str, course_id: str = None,
+                                 user_memory: Dict[str, Any] = None,
+                                 conversation_history: str = "",
+                                 max_tokens: int = 500) -> Dict[str, Any]:
+        """Awaitable ModelService.generate_with_rag."""
+        lookup = await self.run_blocking(self.service._rag_cache_lookup, query, course_id, conversation_history)
+        if lookup["hit"]:
+            return {**lookup["hit"]["payload"], "cached": True}
+
+        prompt, bundle = await self.run_blocking(
+            self.service._rag_prompt, query, course_id,
+            self.service._rag_memory(lookup, user_memory), conversation_history
+        )
+        response = await self.agenerate(prompt, max_tokens, use_cache=False)
+
+        result = self.service._rag_result(response, bundle)
+        await self.run_blocking(self.service._rag_cache_store, lookup, query, course_id, prompt, result)
+        return result
+
+    async def agenerate_interactive(self, query: str, tutor_state: str,
+                                    course_data: Dict[str, Any] = None,
+                                    user_memory: Dict[str, Any] = None,
+                                    mastery: float = 0.0, hints_used: int = 0,
+                                    max_tokens: int = 400) -> Dict[str, Any]:
+        """Awaitable ModelService.generate_interactive."""
+        prompt = await self.run_blocking(
+            self.service._interactive_prompt, query, tutor_state, course_data, user_memory, mastery, hints_used
+        )
+        response = await self.agenerate(prompt, max_tokens, use_cache=False, priority=Priority.INTERACTIVE)
+
+        return {
+            "response": response,
+            "tutor_state": tutor_state,
+            "rag_enabled": True
+        }
+
+    async def agenerate_with_reasoning(self, query: str, course_id: str = None,
+                                       max_tokens: int = 500) -> Dict[str, Any]:
+        """Awaitable ModelService.generate_with_reasoning."""
+        context = await self.run_blocking(retriever.retrieve_context, query, course_id, 1500)
+        first_answer = await self.agenerate(self.service._reasoning_prompt(query, context), max_tokens, use_cache=False)
+        validation = await self.agenerate(
+            self.service._validation_prompt(query, context, first_answer), max_tokens=300, use_cache=False
+        )
+        return self.service._reasoning_result(first_answer, validation)
+
+    async def agrade_essay(self, *args, **kwargs) -> Dict[str, Any]:
+        """Awaitable ModelService.grade_essay (runs on the executor)."""
+        return await self.run_blocking(self.service.grade_essay, *args, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            "max_concurrency": self.max_concurrency,
+            "executor_workers": self.executor_workers
+        }
+
+
+# Singleton instance
+async_model_service = AsyncModelService(
+    model_service,
+    max_concurrency=int(os.environ.get("LLM_MAX_CONCURRENCY", "256")),
+    executor_workers=int(os.environ.get("LLM_EXECUTOR_WORKERS", "16"))
+)
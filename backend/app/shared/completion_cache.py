@@ -0,0 +1,215 @@
+"""
+Completion Cache
+Content-addressed cache of LLM completions for deterministic prompts.
+
+Keyed by (provider, model, prompt hash, max_tokens, temperature). A small
+in-memory LRU sits in front of a SQLite store; both tiers are bounded by
+size in bytes and evict least recently used entries first. Entries expire
+after a TTL, so a bad completion cannot stick forever.
+"""
+import os
+import time
+import hashlib
+import sqlite3
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Any, Optional, Tuple
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "data")
+CACHE_DB = os.path.join(DATA_DIR, "completion_cache.sqlite")
+
+
+def completion_key(provider: str, model: str, prompt: str, max_tokens: int, temperature: float) -> str:
+    """Stable cache key for one generation request."""
+    prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    raw = f"{provider}|{model}|{prompt_hash}|{int(max_tokens)}|{float(temperature):.3f}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class CompletionCache:
+    def __init__(self, db_path: str, enabled: bool = True,
+                 max_memory_bytes: int = 16 * 1024 * 1024, max_disk_bytes: int = 256 * 1024 * 1024,
+                 ttl_seconds: float = 7 * 86400):
+        """
+        Initialize completion cache.
+
+        Args:
+            db_path: SQLite file for the on-disk tier (created on first use)
+            enabled: Master switch
+            max_memory_bytes: Size bound of the in-memory tier
+            max_disk_bytes: Size bound of the on-disk tier
+            ttl_seconds: Age after which an entry is regenerated
+        """
+        self.db_path = db_path
+        self.enabled = enabled
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl_seconds = ttl_seconds
+        self.lock = Lock()
+        self.conn: Optional[sqlite3.Connection] = None
+
+        self.memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()  # key -> (response, created_at)
+        self.memory_bytes = 0
+        self.disk_bytes = 0
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS completions (
+                    key TEXT PRIMARY KEY,
+                    provider TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_completions_last_used ON completions (last_used)")
+            self.conn.commit()
+            self.disk_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+        return self.conn
+
+    # ============================================
+    # MEMORY TIER
+    # ============================================
+
+    def _remember_locked(self, key: str, response: str, created_at: float):
+        size = len(response.encode("utf-8"))
+        if size > self.max_memory_bytes:
+            return
+        self._forget_locked(key)
+        self.memory[key] = (response, created_at)
+        self.memory_bytes += size
+        while self.memory_bytes > self.max_memory_bytes:
+            _, (evicted, _) = self.memory.popitem(last=False)
+            self.memory_bytes -= len(evicted.encode("utf-8"))
+
+    def _forget_locked(self, key: str):
+        entry = self.memory.pop(key, None)
+        if entry is not None:
+            self.memory_bytes -= len(entry[0].encode("utf-8"))
+
+    def _expired(self, created_at: float) -> bool:
+        return time.time() - created_at > self.ttl_seconds
+
+    # ============================================
+    # READ / WRITE
+    # ============================================
+
+    def get(self, key: str) -> Optional[str]:
+        """Cached completion for key, or None."""
+        if not self.enabled:
+            return None
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None and not self._expired(entry[1]):
+                self.memory.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return entry[0]
+
+            conn = self._connect()
+            row = conn.execute("SELECT response, created_at FROM completions WHERE key = ?", (key,)).fetchone()
+            if row is not None and self._expired(row[1]):
+                self._delete_locked(conn, key)
+                conn.commit()
+                self.counters["expired"] += 1
+                row = None
+            if row is None:
+                self._forget_locked(key)
+                self.counters["misses"] += 1
+                return None
+            conn.execute("UPDATE completions SET last_used = ? WHERE key = ?", (time.time(), key))
+            conn.commit()
+            self._remember_locked(key, row[0], row[1])
+            self.counters["disk_hits"] += 1
+            return row[0]
+
+    def put(self, key: str, response: str, provider: str = "", model: str = ""):
+        """Store a completion in both tiers."""
+        if not self.enabled:
+            return
+        size = len(response.encode("utf-8"))
+        now = time.time()
+        with self.lock:
+            self._remember_locked(key, response, now)
+            if size > self.max_disk_bytes:
+                return
+            conn = self._connect()
+            previous = conn.execute("SELECT size FROM completions WHERE key = ?", (key,)).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO completions (key, provider, model, response, size, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, provider, model, response, size, now, now)
+            )
+            self.disk_bytes += size - (previous[0] if previous else 0)
+            self._evict_locked(conn)
+            conn.commit()
+            self.counters["stores"] += 1
+
+    def _delete_locked(self, conn: sqlite3.Connection, key: str):
+        self._forget_locked(key)
+        row = conn.execute("SELECT size FROM completions WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+            self.disk_bytes -= row[0]
+
+    def delete(self, key: str):
+        """Drop one completion from both tiers."""
+        with self.lock:
+            conn = self._connect()
+            self._delete_locked(conn, key)
+            conn.commit()
+
+    def _evict_locked(self, conn: sqlite3.Connection):
+        """Drop least recently used rows until the disk tier fits its bound."""
+        while self.disk_bytes > self.max_disk_bytes:
+            rows = conn.execute("SELECT key, size FROM completions ORDER BY last_used ASC LIMIT 100").fetchall()
+            if not rows:
+                self.disk_bytes = 0
+                return
+            for key, size in rows:
+                conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+                self.disk_bytes -= size
+                self.counters["evictions"] += 1
+                if self.disk_bytes <= self.max_disk_bytes:
+                    return
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+            self.memory_bytes = 0
+            conn = self._connect()
+            conn.execute("DELETE FROM completions")
+            conn.commit()
+            self.disk_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            entries = self._connect().execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+        hits = self.counters["memory_hits"] + self.counters["disk_hits"]
+        total = hits + self.counters["misses"]
+        return {
+            "enabled": self.enabled,
+            "ttl_seconds": self.ttl_seconds,
+            **self.counters,
+            "hit_rate": round(hits / total, 3) if total else 0.0,
+            "memory_entries": len(self.memory),
+            "memory_bytes": self.memory_bytes,
+            "disk_entries": entries,
+            "disk_bytes": self.disk_bytes
+        }
+
+
+# Singleton instance (connects lazily on first use)
+completion_cache = CompletionCache(
+    CACHE_DB,
+    enabled=os.environ.get("COMPLETION_CACHE", "true").lower() == "true",
+    max_memory_bytes=int(os.environ.get("COMPLETION_CACHE_MEMORY_MB", "16")) * 1024 * 1024,
+    max_disk_bytes=int(os.environ.get("COMPLETION_CACHE_DISK_MB", "256")) * 1024 * 1024,
+    ttl_seconds=float(os.environ.get("COMPLETION_CACHE_TTL", str(7 * 86400)))
+)
@@ -0,0 +1,163 @@
+"""
+History Compactor
+Keeps conversation context bounded for long tutoring sessions.
+
+The most recent messages stay verbatim; older ones are folded into a
+rolling summary that is updated incrementally (previous summary + the
+newly aged-out messages) on a background thread, never on the request
+path. Until a summary catches up, aged-out messages are shown truncated,
+so prompt size stays bounded either way.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Dict, Any, List, Callable, Tuple
+
+from app.shared.model_service import model_service
+from app.shared.rate_limiter import Priority
+
+SUMMARY_PROMPT = """Update the running summary of a tutoring conversation.
+
+[CURRENT SUMMARY]
+{summary}
+
+[NEW MESSAGES]
+{messages}
+
+Write the updated summary in at most {max_words} words. Keep: topics covered, what the student understood or struggled with, questions still open, and any commitments the tutor made. Drop greetings and small talk. Return only the summary text."""
+
+
+class HistoryCompactor:
+    def __init__(self, keep_messages: int = 6, batch_messages: int = 6, max_pending: int = 8,
+                 pending_chars: int = 160, summary_words: int = 150, workers: int = 2):
+        """
+        Initialize history compactor.
+
+        Args:
+            keep_messages: Most recent messages always sent verbatim
+            batch_messages: Aged-out messages to accumulate before re-summarising
+            max_pending: Aged-out, not-yet-summarised messages shown (truncated)
+            pending_chars: Truncation length for those messages
+            summary_words: Target summary length
+            workers: Background summarisation threads
+        """
+        self.keep_messages = keep_messages
+        self.batch_messages = batch_messages
+        self.max_pending = max_pending
+        self.pending_chars = pending_chars
+        self.summary_words = summary_words
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="history-compactor")
+        self.lock = Lock()
+        self.in_flight = set()
+        self.counters = {"scheduled": 0, "summarised": 0, "skipped": 0, "failed": 0}
+
+    # ============================================
+    # RENDERING
+    # ============================================
+
+    def render(self, messages: List[Dict[str, Any]], summary: str = None, summarized: int = 0,
+               labels: Tuple[str, str] = ("[STUDENT]", "[MUSA]"), summary_label: str = "[EARLIER IN THIS SESSION]") -> str:
+        """
+        Build the history block for a prompt.
+
+        Args:
+            messages: Full message list ({"role", "content"})
+            summary: Rolling summary of messages[:summarized]
+            summarized: How many leading messages the summary covers
+            labels: Prefixes for (user, assistant) lines
+
+        Returns:
+            Summary (if any), truncated aged-out messages, then the verbatim tail
+        """
+        tail_start = max(0, len(messages) - self.keep_messages)
+        pending_start = self.window_start(len(messages), summarized)
+
+        lines = []
+        if summary:
+            lines.append(f"{summary_label} {summary.strip()}")
+        for msg in messages[pending_start:tail_start]:
+            content = msg["content"]
+            if len(content) > self.pending_chars:
+                content = content[:self.pending_chars].rstrip() + "..."
+            lines.append(f"{self._label(msg, labels)} {content}")
+        for msg in messages[tail_start:]:
+            lines.append(f"{self._label(msg, labels)} {msg['content']}")
+        return "".join(f"{line}\n" for line in lines)
+
+    def window_start(self, total: int, summarized: int) -> int:
+        """
+        Index of the first message render() shows; earlier ones are only in the summary.
+
+        Callers reading history from storage can load messages[start:] and pass
+        summarized - start (floored at 0) to get the same output.
+        """
+        tail_start = max(0, total - self.keep_messages)
+        return max(min(summarized, tail_start), tail_start - self.max_pending)
+
+    @staticmethod
+    def _label(msg: Dict[str, Any], labels: Tuple[str, str]) -> str:
+        return labels[0] if msg["role"] == "user" else labels[1]
+
+    # ============================================
+    # COMPACTION
+    # ============================================
+
+    def due(self, total: int, summarized: int) -> bool:
+        """Whether enough messages have aged out since the last summary."""
+        return total - self.keep_messages - summarized >= self.batch_messages
+
+    def summarize(self, summary: str, messages: List[Dict[str, Any]],
+                  labels: Tuple[str, str] = ("Student:", "Tutor:")) -> str:
+        """
+        Fold messages into the previous summary (blocking LLM call).
+
+        Returns:
+            The new summary, or None if the model is unavailable
+        """
+        transcript = "\n".join(f"{self._label(m, labels)} {m['content']}" for m in messages)
+        prompt = SUMMARY_PROMPT.format(
+            summary=summary or "[None yet]", messages=transcript, max_words=self.summary_words
+        )
+        response = model_service.generate_response(
+            prompt, max_tokens=self.summary_words * 2, use_cache=False, priority=Priority.BACKGROUND
+        )
+        if not response or model_service._is_fallback_response(response):
+            return None
+        return response.strip()
+
+    def schedule(self, key: str, job: Callable, *args):
+        """Run job(*args) in the background unless one is already running for key."""
+        with self.lock:
+            if key in self.in_flight:
+                self.counters["skipped"] += 1
+                return
+            self.in_flight.add(key)
+            self.counters["scheduled"] += 1
+        self.executor.submit(self._run, key, job, *args)
+
+    def _run(self, key: str, job: Callable, *args):
+        try:
+            if job(*args):
+                self.counters["summarised"] += 1
+        except Exception as e:
+            print(f"[HISTORY] Compaction failed for {key}: {e}")
+            self.counters["failed"] += 1
+        finally:
+            with self.lock:
+                self.in_flight.discard(key)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            "in_flight": len(self.in_flight),
+            "keep_messages": self.keep_messages,
+            "batch_messages": self.batch_messages
+        }
+
+
+# Singleton instance
+history_compactor = HistoryCompactor(
+    keep_messages=int(os.environ.get("HISTORY_KEEP_MESSAGES", "6")),
+    batch_messages=int(os.environ.get("HISTORY_BATCH_MESSAGES", "6")),
+    summary_words=int(os.environ.get("HISTORY_SUMMARY_WORDS", "150"))
+)
@@ -0,0 +1,320 @@
+"""
+Remote Engine HTTP Client
+Process-wide, connection-pooled client for the MUSA_API_URL inference engine.
+
+Keeps connections alive across calls (HTTP/2 when the h2 package is
+installed), retries failures that cannot have reached the engine (connect
+errors, pool timeouts) and gateway statuses with jittered exponential
+backoff, probes /health, and records per-endpoint latency histograms.
+"""
+import os
+import time
+import random
+import asyncio
+from contextlib import contextmanager
+from threading import Lock, Thread
+from typing import Dict, Any, Optional, Iterator
+
+import httpx
+
+RETRY_STATUS = {429, 502, 503, 504}
+# Only errors raised before the request was sent: /generate is not idempotent, so a
+# read timeout must not fire a second (billed, duplicated) generation.
+RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram (milliseconds)."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot: above the largest bucket
+        self.total = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+        self.lock = Lock()
+
+    def record(self, ms: float):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if ms <= bound:
+                index = i
+                break
+        with self.lock:
+            self.counts[index] += 1
+            self.total += 1
+            self.sum_ms += ms
+            self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th percentile."""
+        if not self.total:
+            return None
+        target = q * self.total
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return float(self.buckets[i]) if i < len(self.buckets) else self.max_ms
+        return self.max_ms
+
+    def snapshot(self) -> Dict[str, Any]:
+        labels = [f"<={b}ms" for b in self.buckets] + [f">{self.buckets[-1]}ms"]
+        return {
+            "count": self.total,
+            "mean_ms": round(self.sum_ms / self.total, 2) if self.total else 0.0,
+            "max_ms": round(self.max_ms, 2),
+            "p50_ms": self.percentile(0.50),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+            "buckets": {label: count for label, count in zip(labels, self.counts) if count}
+        }
+
+
+class RemoteEngineClient:
+    def __init__(self, base_url: str = None, pool_size: int = 20, timeout: float = 30.0,
+                 connect_timeout: float = 5.0, retries: int = 2, backoff_base: float = 0.25,
+                 backoff_max: float = 4.0, health_interval: float = 30.0):
+        """
+        Initialize remote engine client.
+
+        Args:
+            base_url: Engine URL (default: MUSA_API_URL, read at call time)
+            pool_size: Maximum pooled connections
+            timeout: Read/write timeout per request (seconds)
+            connect_timeout: Connection setup timeout (seconds)
+            retries: Extra attempts on connection errors and 429/5xx gateway responses
+            backoff_base: First backoff ceiling (seconds), doubled per attempt
+            backoff_max: Backoff ceiling cap (seconds)
+            health_interval: Seconds a /health probe result stays valid
+        """
+        self._base_url = base_url
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.health_interval = health_interval
+
+        self.lock = Lock()
+        self._client: Optional[httpx.Client] = None
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self.http2 = self._http2_available()
+
+        self.healthy: Optional[bool] = None
+        self.last_probe = 0.0
+        self._probing = False
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self.counters = {"requests": 0, "retries": 0, "errors": 0, "health_probes": 0}
+
+    @staticmethod
+    def _http2_available() -> bool:
+        try:
+            import h2  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    @property
+    def base_url(self) -> str:
+        return (self._base_url or os.environ.get("MUSA_API_URL") or "").rstrip("/")
+
+    def configured(self) -> bool:
+        return self.base_url.startswith("http")
+
+    # ============================================
+    # CLIENTS
+    # ============================================
+
+    def _client_options(self) -> Dict[str, Any]:
+        return {
+            "http2": self.http2,
+            "limits": httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size,
+                                   keepalive_expiry=60.0),
+            "timeout": httpx.Timeout(self.timeout, connect=self.connect_timeout)
+        }
+
+    def client(self) -> httpx.Client:
+        if self._client is None:
+            with self.lock:
+                if self._client is None:
+                    self._client = httpx.Client(**self._client_options())
+        return self._client
+
+    def async_client(self) -> httpx.AsyncClient:
+        if self._async_client is None:
+            with self.lock:
+                if self._async_client is None:
+                    self._async_client = httpx.AsyncClient(**self._client_options())
+        return self._async_client
+
+    # ============================================
+    # INSTRUMENTATION
+    # ============================================
+
+    def _observe(self, path: str, start: float):
+        histogram = self.histograms.get(path)
+        if histogram is None:
+            histogram = self.histograms.setdefault(path, LatencyHistogram())
+        histogram.record((time.perf_counter() - start) * 1000)
+
+    def _backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _should_retry(self, attempt: int, response: httpx.Response = None,
+                      error: httpx.TransportError = None) -> bool:
+        if attempt >= self.retries:
+            return False
+        if error is not None:
+            return isinstance(error, RETRY_ERRORS)
+        return response is not None and response.status_code in RETRY_STATUS
+
+    # ============================================
+    # REQUESTS
+    # ============================================
+
+    def post(self, path: str, json: Dict[str, Any]) -> httpx.Response:
+        """POST with retries on connect failures and RETRY_STATUS; raises the last error otherwise."""
+        url = f"{self.base_url}{path}"
+        self.counters["requests"] += 1
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                response = self.client().post(url, json=json)
+            except httpx.TransportError as e:
+                self._observe(path, start)
+                if not self._should_retry(attempt, error=e):
+                    self.counters["errors"] += 1
+                    self.healthy = False
+                    raise
+            else:
+                self._observe(path, start)
+                if not self._should_retry(attempt, response):
+                    return response
+            self.counters["retries"] += 1
+            time.sleep(self._backoff(attempt))
+            attempt += 1
+
+    async def apost(self, path: str, json: Dict[str, Any]) -> httpx.Response:
+        """Awaitable post()."""
+        url = f"{self.base_url}{path}"
+        self.counters["requests"] += 1
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                response = await self.async_client().post(url, json=json)
+            except httpx.TransportError as e:
+                self._observe(path, start)
+                if not self._should_retry(attempt, error=e):
+                    self.counters["errors"] += 1
+                    self.healthy = False
+                    raise
+            else:
+                self._observe(path, start)
+                if not self._should_retry(attempt, response):
+                    return response
+            self.counters["retries"] += 1
+            await asyncio.sleep(self._backoff(attempt))
+            attempt += 1
+
+    @contextmanager
+    def stream(self, path: str, json: Dict[str, Any]) -> Iterator[httpx.Response]:
+        """Streaming POST. Connect failures are retried; a sent request or started stream is not."""
+        url = f"{self.base_url}{path}"
+        self.counters["requests"] += 1
+        attempt = 0
+        started = False
+        while True:
+            start = time.perf_counter()
+            try:
+                with self.client().stream("POST", url, json=json) as response:
+                    self._observe(f"{path} (first byte)", start)
+                    if not self._should_retry(attempt, response):
+                        started = True
+                        yield response
+                        return
+            except httpx.TransportError as e:
+                if started:
+                    self.counters["errors"] += 1
+                    raise
+                self._observe(f"{path} (first byte)", start)
+                if not self._should_retry(attempt, error=e):
+                    self.counters["errors"] += 1
+                    self.healthy = False
+                    raise
+            self.counters["retries"] += 1
+            time.sleep(self._backoff(attempt))
+            attempt += 1
+
+    # ============================================
+    # HEALTH
+    # ============================================
+
+    def probe(self) -> bool:
+        """GET /health now and remember the result."""
+        self.counters["health_probes"] += 1
+        start = time.perf_counter()
+        try:
+            response = self.client().get(f"{self.base_url}/health", timeout=self.connect_timeout)
+            self.healthy = response.status_code == 200
+        except httpx.HTTPError as e:
+            print(f"[REMOTE] Health probe failed: {e}")
+            self.healthy = False
+        self._observe("/health", start)
+        self.last_probe = time.time()
+        return self.healthy
+
+    def refresh(self):
+        """Start a background probe unless one is already running."""
+        with self.lock:
+            if self._probing:
+                return
+            self._probing = True
+        Thread(target=self._probe_in_background, name="remote-health", daemon=True).start()
+
+    def _probe_in_background(self):
+        try:
+            self.probe()
+        finally:
+            self._probing = False
+
+    def is_healthy(self) -> bool:
+        """
+        Last known health; never blocks on the network.
+
+        A stale (older than health_interval) or missing result triggers a
+        background re-probe. Until the first probe completes the engine is
+        assumed healthy, so a fresh process does not skip it.
+        """
+        if not self.configured():
+            return False
+        if self.healthy is None or time.time() - self.last_probe > self.health_interval:
+            self.refresh()
+        return self.healthy is not False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "configured": self.configured(),
+            "base_url": self.base_url,
+            "http2": self.http2,
+            "pool_size": self.pool_size,
+            "healthy": self.healthy,
+            "last_probe": self.last_probe,
+            **self.counters,
+            "latency": {path: h.snapshot() for path, h in self.histograms.items()}
+        }
+
+
+# Singleton instance (shared by every caller in the process)
+remote_engine = RemoteEngineClient(
+    pool_size=int(os.environ.get("MUSA_POOL_SIZE", "20")),
+    timeout=float(os.environ.get("MUSA_TIMEOUT", "30")),
+    connect_timeout=float(os.environ.get("MUSA_CONNECT_TIMEOUT", "5")),
+    retries=int(os.environ.get("MUSA_RETRIES", "2")),
+    health_interval=float(os.environ.get("MUSA_HEALTH_INTERVAL", "30"))
+)
@@ -0,0 +1,213 @@
+"""
+Learner Profile
+Materialized per-user tutoring memory (topics, mastery, hints, style, mistakes).
+
+get_user_memory used to aggregate every StudentPerformance row and every
+AISession on each turn. The aggregates now live in one learner_profiles
+row that the session and progress services update as things change, with
+an in-process cache in front, so reading the profile is O(1) regardless
+of history. A missing row is rebuilt once from history.
+"""
+import os
+import json
+import time
+from threading import Lock
+from typing import Dict, Any, Optional
+
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.database import SessionLocal, LearnerProfile, StudentPerformance, AISession
+
+MAX_MISTAKES = 20
+
+
+class LearnerProfileService:
+    def __init__(self, ttl_seconds: float = 300.0):
+        """
+        Initialize learner profile service.
+
+        Args:
+            ttl_seconds: How long a cached profile is served without re-reading the row
+                         (bounds staleness when several workers share the database)
+        """
+        self.ttl_seconds = ttl_seconds
+        self.cache: Dict[int, tuple] = {}  # user_id -> (expires_at, memory dict)
+        self.lock = Lock()
+        self.counters = {"hits": 0, "misses": 0, "rebuilds": 0}
+
+        # Changes made inside a unit of work are only visible to other readers after commit
+        event.listen(SessionLocal, "after_commit", self._after_commit)
+
+    # ============================================
+    # READ
+    # ============================================
+
+    def get_memory(self, user_id: int, db: Session = None) -> Dict[str, Any]:
+        """
+        User memory for prompt personalization.
+
+        Returns:
+            Dict with topics_covered, overall_mastery, total_sessions,
+            total_hints_used, learning_style, common_mistakes, preferred_topics
+        """
+        user_id = int(user_id)
+        with self.lock:
+            cached = self.cache.get(user_id)
+            if cached and cached[0] > time.time():
+                self.counters["hits"] += 1
+                return cached[1]
+            self.counters["misses"] += 1
+
+        _db = db or SessionLocal()
+        try:
+            profile, rebuilt = self._load_or_rebuild(_db, user_id)
+            memory = self._format_memory(profile)
+            if rebuilt and db is None:
+                _db.commit()
+        finally:
+            if db is None:
+                _db.close()
+
+        with self.lock:
+            self.cache[user_id] = (time.time() + self.ttl_seconds, memory)
+        return memory
+
+    def _format_memory(self, profile: LearnerProfile) -> Dict[str, Any]:
+        topics = json.loads(profile.topics_json or "[]")
+        mistakes = json.loads(profile.mistakes_json or "[]")
+        chat, interactive = profile.chat_sessions or 0, profile.interactive_sessions or 0
+        return {
+            "topics_covered": topics,
+            "overall_mastery": round((profile.mastery_total or 0) / len(topics), 2) if topics else 0,
+            "total_sessions": chat + interactive,
+            "total_hints_used": profile.hints_used or 0,
+            "learning_style": self._learning_style(interactive, chat),
+            "common_mistakes": mistakes[-10:],
+            "preferred_topics": []
+        }
+
+    @staticmethod
+    def _learning_style(interactive_count: int, chat_count: int) -> str:
+        """Infer learning style from session patterns."""
+        if not interactive_count and not chat_count:
+            return "balanced"
+        if interactive_count > chat_count * 2:
+            return "hands-on"
+        elif chat_count > interactive_count * 2:
+            return "conversational"
+        else:
+            return "balanced"
+
+    # ============================================
+    # INCREMENTAL UPDATES
+    # ============================================
+
+    def record_session(self, db: Session, user_id: int, mode: str):
+        """A tutoring session was created (call after it is added to db)."""
+        profile, rebuilt = self._load_for_update(db, user_id)
+        if not rebuilt:
+            if mode == "interactive":
+                profile.interactive_sessions = (profile.interactive_sessions or 0) + 1
+            else:
+                profile.chat_sessions = (profile.chat_sessions or 0) + 1
+        self._touched(db, user_id)
+
+    def record_hint(self, db: Session, user_id: int):
+        """A hint was used (call after AISession.hints_used is incremented)."""
+        profile, rebuilt = self._load_for_update(db, user_id)
+        if not rebuilt:
+            profile.hints_used = (profile.hints_used or 0) + 1
+        self._touched(db, user_id)
+
+    def record_topic(self, db: Session, user_id: int, topic_id: str, mastery_delta: float):
+        """A topic's StudentPerformance mastery changed by mastery_delta (call after the change)."""
+        profile, rebuilt = self._load_for_update(db, user_id)
+        if not rebuilt:
+            topics = json.loads(profile.topics_json or "[]")
+            if topic_id not in topics:
+                topics.append(topic_id)
+                profile.topics_json = json.dumps(topics)
+            profile.mastery_total = (profile.mastery_total or 0) + mastery_delta
+        self._touched(db, user_id)
+
+    def record_mistake(self, db: Session, user_id: int, mistake_text: str):
+        """Remember a mistake for remediation (most recent MAX_MISTAKES unique)."""
+        profile, _ = self._load_for_update(db, user_id)
+        mistakes = [m for m in json.loads(profile.mistakes_json or "[]") if m != mistake_text]
+        mistakes.append(mistake_text)
+        profile.mistakes_json = json.dumps(mistakes[-MAX_MISTAKES:])
+        self._touched(db, user_id)
+
+    # ============================================
+    # STORAGE
+    # ============================================
+
+    def _load_for_update(self, db: Session, user_id: int) -> tuple:
+        db.flush()  # a rebuild must see the caller's pending change
+        return self._load_or_rebuild(db, int(user_id), for_update=True)
+
+    def _load_or_rebuild(self, db: Session, user_id: int, for_update: bool = False) -> tuple:
+        """(profile row, rebuilt) - rebuilt rows already reflect everything flushed so far."""
+        query = db.query(LearnerProfile).filter_by(user_id=user_id)
+        if for_update:
+            query = query.with_for_update()
+        profile = query.first()
+        if profile:
+            return profile, False
+
+        profile = self._rebuild(db, user_id)
+        try:
+            with db.begin_nested():
+                db.add(profile)
+        except IntegrityError:
+            # Another request created it first
+            profile = db.query(LearnerProfile).filter_by(user_id=user_id).one()
+            return profile, False
+        self.counters["rebuilds"] += 1
+        return profile, True
+
+    def _rebuild(self, db: Session, user_id: int) -> LearnerProfile:
+        """Aggregate a profile from StudentPerformance and AISession history (one-off per user)."""
+        perfs = db.query(StudentPerformance.topic_id, StudentPerformance.mastery).filter_by(user_id=user_id).all()
+        modes = db.query(AISession.mode, AISession.hints_used).filter_by(user_id=user_id).all()
+        topics = list(dict.fromkeys(topic_id for topic_id, _ in perfs))
+        return LearnerProfile(
+            user_id=user_id,
+            topics_json=json.dumps(topics),
+            mastery_total=sum(mastery or 0 for _, mastery in perfs),
+            chat_sessions=sum(1 for mode, _ in modes if mode != "interactive"),
+            interactive_sessions=sum(1 for mode, _ in modes if mode == "interactive"),
+            hints_used=sum(hints or 0 for _, hints in modes),
+            mistakes_json="[]"
+        )
+
+    # ============================================
+    # CACHE
+    # ============================================
+
+    def _touched(self, db: Session, user_id: int):
+        db.info.setdefault("learner_profiles", set()).add(int(user_id))
+        self.invalidate(user_id)
+
+    def _after_commit(self, session: Session):
+        for user_id in session.info.pop("learner_profiles", ()):
+            self.invalidate(user_id)
+
+    def invalidate(self, user_id: Optional[int] = None):
+        """Drop one user's cached profile (or all of them)."""
+        with self.lock:
+            if user_id is None:
+                self.cache.clear()
+            else:
+                self.cache.pop(int(user_id), None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.counters, "cached": len(self.cache), "ttl_seconds": self.ttl_seconds}
+
+
+# Singleton instance
+learner_profile_service = LearnerProfileService(
+    ttl_seconds=float(os.environ.get("LEARNER_PROFILE_TTL", "300"))
+)
@@ -6,83 +6,30 @@ import json
 import os
 import re
 import time
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Iterator, Callable
 from threading import Lock
 
 from app.core.rag.retriever import retriever
-
-# ============================================
-# STRUCTURED SYSTEM PROMPTS
-# ============================================
-
-SYSTEM_PROMPT = """You are Musa, the EduNexus AI Tutor.
-
-CORE RULES:
-- Be helpful, encouraging, and accurate.
-- Answer directly without preambles.
-- No reasoning or wrapper markers (<thought>, <response>, <speak>, etc.).
-- NEVER repeat your own previous answers or sentences within the same response.
-- Use provided context where relevant.
-"""
-
-CHAT_PROMPT_TEMPLATE = """{system_prompt}
-
-[KNOWLEDGE CONTEXT]
-{context}
-
-[STUDENT PROFILE]
-Topics: {topics_covered} | Mastery: {mastery_level} | Style: {learning_style}
-
-[SESSION HISTORY]
-{conversation_history}
-
-[CURRENT STUDENT QUERY]
-{user_input}
-
-[MUSA RESPONSE]
-"""
-
-INTERACTIVE_PROMPT_TEMPLATE = """{system_prompt}
-
-[TUTOR STATE: {tutor_state}]
-[TOPIC: {topic_title}]
-
-[KNOWLEDGE CONTEXT]
-{context}
-
-[STUDENT PROFILE]
-Mastery: {mastery}% | Hints: {hints_used}
-Learning Style: {learning_style}
-Common Mistakes: {common_mistakes}
-
-[CURRENT STUDENT INPUT]
-{user_input}
-
-[PEDAGOGICAL INSTRUCTIONS]
-{state_instructions}
-
-[MUSA RESPONSE]
-"""
-
-STATE_INSTRUCTIONS = {
-    "INTRODUCE": "Provide a warm introduction to this topic. Explain what they will learn and why it matters.",
-    "EXPLAIN": "Explain the concept clearly. Use analogies and examples. Break down complex ideas step by step.",
-    "CHECK_UNDERSTANDING": "Ask a probing question to assess comprehension. Don't give away the answer.",
-    "ASSESS": "Present an exercise or question to evaluate understanding. This affects their grade.",
-    "UPDATE_MASTERY": "Provide encouraging feedback about their progress based on their performance.",
-    "ADVANCE": "Congratulate them and prepare to introduce the next concept.",
-    "REMEDIATE": "Provide additional examples and simpler explanations. Be patient and supportive."
-}
+from app.core.rag.embedder import embedder
+from app.core.rag.chunker import chunker
+from app.core.rag.semantic_cache import semantic_cache
+from app.core.analytics.metrics import analytics_collector
+from app.shared.completion_cache import completion_cache, completion_key
+from app.shared.http_client import remote_engine
+from app.shared.single_flight import single_flight
+from app.shared.rate_limiter import Priority
+from app.shared.prompt_builder import SYSTEM_PROMPT, chat_prompt, interactive_prompt
+from app.shared.provider_pool import (
+    provider_pool, ProviderError, OpenAIProvider, AnthropicProvider, GeminiProvider, RemoteEngineProvider
+)
 
 # API Provider clients are handled on demand or via environment detection
 
 class ModelService:
     def __init__(self):
-        self.llm = None
-        self.openai_client = None
-        self.openai_model = "gpt-4o"
-        self.gemini_model = None
-        self.anthropic_client = None
+        self.llm = None  # "POOL" once backends are registered, "MOCK" when none are available
+        self.pool = provider_pool
+        self.temperature = 0.3
         self.is_loading = False
         self.lock = Lock()
         print("Model service initialized (API-Only Mode).")
@@ -98,73 +45,26 @@ class ModelService:
     
             self.is_loading = True
         try:
-            # Check for Mock Mode
+            self.pool.clear()
+
+            # Check for Mock Mode (the self-hosted engine is still used when configured)
             if os.environ.get("USE_MOCK_LLM", "false").lower() == "true":
                 print("[SYSTEM] Running in MOCK AI Mode")
+            else:
+                self._register_api_providers()
+
+            # 5. Self-hosted engine (MUSA_API_URL)
+            if remote_engine.configured():
+                self.pool.add(RemoteEngineProvider())
+                print(f"[SYSTEM] Registered remote engine: {remote_engine.base_url}")
+
+            if self.pool.providers:
+                self.llm = "POOL"
+                print(f"[SYSTEM] LLM provider pool: {', '.join(p.name for p in self.pool.providers)}")
+            else:
+                # If no API key found, default to MOCK to prevent crash
+                print("[WARNING] No API keys found. Switching to MOCK mode.")
                 self.llm = "MOCK"
-                self.is_loading = False
-                return True
-
-            # 1. DeepSeek API (OpenAI Compatible)
-            deepseek_key = os.environ.get("DEEPSEEK_API_KEY")
-            if deepseek_key:
-                try:
-                    from openai import OpenAI
-                    self.openai_client = OpenAI(api_key=deepseek_key, base_url="https://api.deepseek.com")
-                    self.openai_model = "deepseek-chat"
-                    self.llm = "OPENAI"
-                    print(f"[SYSTEM] Connected to DeepSeek API")
-                    self.is_loading = False
-                    return True
-                except Exception as e:
-                    print(f"[ERROR] Failed to initialize DeepSeek client: {e}")
-
-            # 2. Google Gemini API
-            gemini_key = os.environ.get("GEMINI_API_KEY")
-            if gemini_key:
-                try:
-                    import google.generativeai as genai
-                    genai.configure(api_key=gemini_key)
-                    self.gemini_model = genai.GenerativeModel('gemini-pro')
-                    self.llm = "GEMINI"
-                    print(f"[SYSTEM] Connected to Google Gemini API")
-                    self.is_loading = False
-                    return True
-                except Exception as e:
-                    print(f"[ERROR] Failed to initialize Gemini client: {e}")
-
-            # 3. Anthropic (Claude) API
-            anthropic_key = os.environ.get("ANTHROPIC_API_KEY")
-            if anthropic_key:
-                try:
-                    import anthropic
-                    self.anthropic_client = anthropic.Anthropic(api_key=anthropic_key)
-                    self.anthropic_model = "claude-3-opus-20240229"
-                    self.llm = "ANTHROPIC"
-                    print(f"[SYSTEM] Connected to Anthropic Claude API")
-                    self.is_loading = False
-                    return True
-                except Exception as e:
-                    print(f"[ERROR] Failed to initialize Anthropic client: {e}")
-
-            # 4. Standard/Generic OpenAI API
-            openai_key = os.environ.get("OPENAI_API_KEY")
-            if openai_key:
-                try:
-                    from openai import OpenAI
-                    base_url = os.environ.get("OPENAI_BASE_URL", "https://api.openai.com/v1")
-                    self.openai_client = OpenAI(api_key=openai_key, base_url=base_url)
-                    self.openai_model = os.environ.get("OPENAI_MODEL", "gpt-4o")
-                    self.llm = "OPENAI"
-                    print(f"[SYSTEM] Connected to OpenAI API (Model: {self.openai_model})")
-                    self.is_loading = False
-                    return True
-                except Exception as e:
-                    print(f"[ERROR] Failed to initialize OpenAI client: {e}")
-
-            # If no API key found, default to MOCK to prevent crash
-            print("[WARNING] No API keys found. Switching to MOCK mode.")
-            self.llm = "MOCK"
             self.is_loading = False
             return True
         except Exception as e:
@@ -173,6 +73,46 @@ class ModelService:
             self.is_loading = False
             return False
 
+    def _register_api_providers(self):
+        """Register every backend whose API key is set (listed in preference order)."""
+        # 1. DeepSeek API (OpenAI Compatible)
+        deepseek_key = os.environ.get("DEEPSEEK_API_KEY")
+        if deepseek_key:
+            try:
+                self.pool.add(OpenAIProvider("deepseek", deepseek_key, "https://api.deepseek.com", "deepseek-chat"))
+                print(f"[SYSTEM] Connected to DeepSeek API")
+            except Exception as e:
+                print(f"[ERROR] Failed to initialize DeepSeek client: {e}")
+
+        # 2. Google Gemini API
+        gemini_key = os.environ.get("GEMINI_API_KEY")
+        if gemini_key:
+            try:
+                self.pool.add(GeminiProvider(gemini_key, "gemini-pro"))
+                print(f"[SYSTEM] Connected to Google Gemini API")
+            except Exception as e:
+                print(f"[ERROR] Failed to initialize Gemini client: {e}")
+
+        # 3. Anthropic (Claude) API
+        anthropic_key = os.environ.get("ANTHROPIC_API_KEY")
+        if anthropic_key:
+            try:
+                self.pool.add(AnthropicProvider(anthropic_key, "claude-3-opus-20240229"))
+                print(f"[SYSTEM] Connected to Anthropic Claude API")
+            except Exception as e:
+                print(f"[ERROR] Failed to initialize Anthropic client: {e}")
+
+        # 4. Standard/Generic OpenAI API
+        openai_key = os.environ.get("OPENAI_API_KEY")
+        if openai_key:
+            try:
+                base_url = os.environ.get("OPENAI_BASE_URL", "https://api.openai.com/v1")
+                openai_model = os.environ.get("OPENAI_MODEL", "gpt-4o")
+                self.pool.add(OpenAIProvider("openai", openai_key, base_url, openai_model))
+                print(f"[SYSTEM] Connected to OpenAI API (Model: {openai_model})")
+            except Exception as e:
+                print(f"[ERROR] Failed to initialize OpenAI client: {e}")
+
     def unload_model(self):
         """No-op for API-only mode."""
         self.llm = None
@@ -188,30 +128,86 @@ class ModelService:
                           max_tokens: int = 500) -> Dict[str, Any]:
         """
         Generate response with RAG context injection.
-        """
-        # Retrieve minimal relevant context for speed
-        context = retriever.retrieve_context(query, course_id, max_tokens=500)
-        retrieved_chunks = retriever.retrieve(query, course_id)
         
-        # Build user memory string
-        memory = user_memory or {}
-        topics_str = ", ".join(memory.get("topics_covered", [])[:5]) or "None yet"
-        mastery_str = f"{memory.get('overall_mastery', 0) * 100:.0f}%"
-        learning_style = memory.get("learning_style", "balanced")
+        First questions (no conversation history) go through the semantic
+        response cache: students across a cohort ask the same things, so a
+        cacheable answer is generated without the student's profile.
+        """
+        lookup = self._rag_cache_lookup(query, course_id, conversation_history)
+        if lookup["hit"]:
+            return {**lookup["hit"]["payload"], "cached": True}
         
-        # Build prompt
-        prompt = CHAT_PROMPT_TEMPLATE.format(
-            system_prompt=SYSTEM_PROMPT,
-            context=context or "[No retrieved context available]",
-            topics_covered=topics_str,
-            mastery_level=mastery_str,
-            learning_style=learning_style,
-            conversation_history=conversation_history or "[No prior conversation]",
-            user_input=query
-        )
+        prompt, bundle = self._rag_prompt(query, course_id, self._rag_memory(lookup, user_memory), conversation_history)
         
         # Generate response
-        response = self._generate(prompt, max_tokens)
+        response = self._generate(prompt, max_tokens, use_cache=False)
+        
+        result = self._rag_result(response, bundle)
+        self._rag_cache_store(lookup, query, course_id, prompt, result)
+        return result
+
+    def stream_with_rag(self, query: str, course_id: str = None,
+                        user_memory: Dict[str, Any] = None,
+                        conversation_history: str = "",
+                        max_tokens: int = 500) -> Iterator[Dict[str, Any]]:
+        """
+        Streaming variant of generate_with_rag.
+        
+        Yields {"type": "token", "text"} events as the answer arrives, then a
+        final {"type": "done", ...} carrying the generate_with_rag result.
+        """
+        lookup = self._rag_cache_lookup(query, course_id, conversation_history)
+        if lookup["hit"]:
+            yield {"type": "token", "text": lookup["hit"]["payload"]["response"]}
+            yield {"type": "done", **lookup["hit"]["payload"], "cached": True}
+            return
+        
+        prompt, bundle = self._rag_prompt(query, course_id, self._rag_memory(lookup, user_memory), conversation_history)
+        
+        parts = []
+        for text in self.stream_generate(prompt, max_tokens, use_cache=False):
+            parts.append(text)
+            yield {"type": "token", "text": text}
+        response = "".join(parts).strip()
+        
+        result = self._rag_result(response, bundle)
+        self._rag_cache_store(lookup, query, course_id, prompt, result)
+        yield {"type": "done", **result}
+
+    def _rag_cache_lookup(self, query: str, course_id: str = None, conversation_history: str = "") -> Dict[str, Any]:
+        """Semantic cache check. Returns {"enabled", "embedding", "hit"}."""
+        # Follow-ups depend on the conversation, so only stand-alone questions are cached
+        if not (semantic_cache.enabled and not conversation_history and embedder.semantic_available()):
+            return {"enabled": False, "embedding": None, "hit": None}
+        query_embedding = embedder.embed(query)[0]  # reused by retrieval via the query embedding cache
+        hit = semantic_cache.lookup(course_id, embedder.active_model, query_embedding)
+        analytics_collector.log_semantic_cache(hit is not None, hit["tokens"] if hit else 0, course_id)
+        return {"enabled": True, "embedding": query_embedding, "hit": hit}
+
+    @staticmethod
+    def _rag_memory(lookup: Dict[str, Any], user_memory: Dict[str, Any] = None) -> Optional[Dict[str, Any]]:
+        """Profile to personalise with: none when the answer may be served to other students."""
+        return None if lookup["enabled"] else user_memory
+
+    def _rag_cache_store(self, lookup: Dict[str, Any], query: str, course_id: str,
+                         prompt: str, result: Dict[str, Any]):
+        if lookup["enabled"] and not self._is_fallback_response(result["response"]):
+            tokens = chunker.count_tokens(prompt) + chunker.count_tokens(result["response"])
+            semantic_cache.put(course_id, embedder.active_model, query, lookup["embedding"], result, tokens)
+
+    def _rag_prompt(self, query: str, course_id: str = None,
+                    user_memory: Dict[str, Any] = None,
+                    conversation_history: str = "") -> tuple:
+        """Retrieve context and build the chat prompt. Returns (prompt, retrieval bundle)."""
+        # Retrieve minimal relevant context for speed (single embed + vector query)
+        bundle = retriever.retrieve_bundle(query, course_id, max_tokens=500)
+        
+        # Build prompt (system prompt is sent separately as the system message)
+        prompt = chat_prompt(query, bundle["context"], user_memory, conversation_history)
+        return prompt, bundle
+
+    def _rag_result(self, response: str, bundle: Dict[str, Any]) -> Dict[str, Any]:
+        retrieved_chunks = bundle["chunks"]
         
         # Calculate confidence based on retrieval
         confidence = self._calculate_confidence(retrieved_chunks, response)
@@ -219,7 +215,7 @@ class ModelService:
         return {
             "response": response,
             "retrieved_context": [c["text"][:200] + "..." for c in retrieved_chunks[:3]],
-            "sources": [c.get("metadata", {}).get("topic_title", "Unknown") for c in retrieved_chunks[:3]],
+            "sources": bundle["sources"][:3],
             "confidence": confidence,
             "rag_enabled": True
         }
@@ -232,33 +228,8 @@ class ModelService:
         """
         Generate response for interactive tutoring mode.
         """
-        course_data = course_data or {}
-        course_id = course_data.get("course_id")
-        
-        # Retrieve context
-        context = retriever.retrieve_context(query, course_id, max_tokens=600)
-        
-        # Build user memory context
-        memory = user_memory or {}
-        mistakes_str = ", ".join(memory.get("common_mistakes", [])) or "No persistent patterns detected."
-        style = memory.get("learning_style", "balanced")
-
-        # Build prompt
-        prompt = INTERACTIVE_PROMPT_TEMPLATE.format(
-            system_prompt=SYSTEM_PROMPT,
-            tutor_state=tutor_state,
-            context=context or "[No retrieved context]",
-            course_title=course_data.get("course_title", "Unknown Course"),
-            topic_title=course_data.get("topic_title", "Unknown Topic"),
-            mastery=int(mastery * 100),
-            hints_used=hints_used,
-            learning_style=style,
-            common_mistakes=mistakes_str,
-            user_input=query,
-            state_instructions=STATE_INSTRUCTIONS.get(tutor_state, "Respond helpfully.")
-        )
-        
-        response = self._generate(prompt, max_tokens)
+        prompt = self._interactive_prompt(query, tutor_state, course_data, user_memory, mastery, hints_used)
+        response = self._generate(prompt, max_tokens, use_cache=False, priority=Priority.INTERACTIVE)
         
         return {
             "response": response,
@@ -266,6 +237,27 @@ class ModelService:
             "rag_enabled": True
         }
 
+    def stream_interactive(self, query: str, tutor_state: str,
+                           course_data: Dict[str, Any] = None,
+                           user_memory: Dict[str, Any] = None,
+                           mastery: float = 0.0, hints_used: int = 0,
+                           max_tokens: int = 400) -> Iterator[str]:
+        """Streaming variant of generate_interactive (yields text deltas)."""
+        prompt = self._interactive_prompt(query, tutor_state, course_data, user_memory, mastery, hints_used)
+        return self.stream_generate(prompt, max_tokens, use_cache=False, priority=Priority.INTERACTIVE)
+
+    def _interactive_prompt(self, query: str, tutor_state: str,
+                            course_data: Dict[str, Any] = None,
+                            user_memory: Dict[str, Any] = None,
+                            mastery: float = 0.0, hints_used: int = 0) -> str:
+        course_id = (course_data or {}).get("course_id")
+        
+        # Retrieve context
+        context = retriever.retrieve_context(query, course_id, max_tokens=600)
+
+        # Build prompt (system prompt is sent separately as the system message)
+        return interactive_prompt(query, tutor_state, context, course_data, user_memory, mastery, hints_used)
+
     # ============================================
     # TWO-PASS REASONING LOOP
     # ============================================
@@ -277,21 +269,26 @@ class ModelService:
         """
         # Pass 1: Generate answer
         context = retriever.retrieve_context(query, course_id, max_tokens=1500)
+        first_answer = self._generate(self._reasoning_prompt(query, context), max_tokens, use_cache=False)
         
-        first_prompt = f"""{SYSTEM_PROMPT}
+        # Pass 2: Validate and refine
+        validation = self._generate(self._validation_prompt(query, context, first_answer),
+                                    max_tokens=300, use_cache=False)
+        
+        return self._reasoning_result(first_answer, validation)
 
-[CONTEXT]
+    def _reasoning_prompt(self, query: str, context: str) -> str:
+        # System prompt is sent separately as the system message
+        return f"""[CONTEXT]
 {context}
 
 [QUESTION]
 {query}
 
 Think step by step and provide a clear, accurate answer:"""
-        
-        first_answer = self._generate(first_prompt, max_tokens)
-        
-        # Pass 2: Validate and refine
-        validation_prompt = f"""Review this answer for accuracy and completeness:
+
+    def _validation_prompt(self, query: str, context: str, first_answer: str) -> str:
+        return f"""Review this answer for accuracy and completeness:
 
 Question: {query}
 Answer: {first_answer}
@@ -305,9 +302,8 @@ Validation checklist:
 4. Is the explanation clear and complete?
 
 If issues found, provide a corrected answer. If accurate, confirm:"""
-        
-        validation = self._generate(validation_prompt, max_tokens=300)
-        
+
+    def _reasoning_result(self, first_answer: str, validation: str) -> Dict[str, Any]:
         # Determine if refinement was needed
         needs_refinement = any(word in validation.lower() for word in 
             ["incorrect", "missing", "fabricated", "inaccurate", "should be"])
@@ -326,77 +322,144 @@ If issues found, provide a corrected answer. If accurate, confirm:"""
     # CORE GENERATION
     # ============================================
 
-    def generate_response(self, prompt: str, max_tokens: int = 500) -> str:
+    def generate_response(self, prompt: str, max_tokens: int = 500, use_cache: bool = False,
+                          priority: Priority = Priority.CHAT, validate: Callable[[str], Any] = None) -> str:
         """Public wrapper for content generation."""
-        return self._generate(prompt, max_tokens)
+        return self._generate(prompt, max_tokens, use_cache=use_cache, priority=priority, validate=validate)
 
-    def _generate(self, prompt: str, max_tokens: int = 500) -> str:
-        """Internal generation method using APIs."""
+    def _active_model(self) -> tuple:
+        """(provider, model) identity of the configured backends, used in cache keys."""
+        if self.llm == "POOL":
+            return "POOL", self.pool.signature()
+        return "MOCK", "mock"
+
+    def _generate(self, prompt: str, max_tokens: int = 500, use_cache: bool = False,
+                  priority: Priority = Priority.CHAT, validate: Callable[[str], Any] = None) -> str:
+        """
+        Internal generation method using APIs.
+        
+        With use_cache=True identical requests are served from the completion
+        cache (and concurrent identical misses share one upstream call). Only
+        deterministic generators (quizzes, assessments, textbook content)
+        opt in; conversational turns always stay fresh. validate is the
+        caller's parser: a reply is only cached if it returns without raising,
+        so an unparseable reply is retried next time instead of stored.
+        priority orders the request in the providers' rate-limit queues.
+        """
         if not self.llm:
             success = self.load_model()
             if not success:
                 return "I'm having trouble loading my AI brain. Please try again."
 
-        # 1. OpenAI / DeepSeek / Generic API
-        if self.llm == "OPENAI":
+        provider, model = self._active_model()
+        key = completion_key(provider, model, prompt, max_tokens, self.temperature)
+        if not use_cache:
+            return self._call_llm(prompt, max_tokens, priority)
+
+        cached = completion_cache.get(key)
+        if cached is not None:
+            return cached
+        return single_flight.do(key, self._fill_cache, key, prompt, max_tokens, provider, model, priority, validate)
+
+    def _fill_cache(self, key: str, prompt: str, max_tokens: int, provider: str, model: str,
+                    priority: Priority = Priority.CHAT, validate: Callable[[str], Any] = None) -> str:
+        """Generate a cache miss and store it (run once per key by single_flight)."""
+        response = self._call_llm(prompt, max_tokens, priority)
+        if self._cacheable(response, validate):
+            completion_cache.put(key, response, provider, model)
+        return response
+
+    def _call_llm(self, prompt: str, max_tokens: int, priority: Priority = Priority.CHAT) -> str:
+        """Single uncached request, routed by the provider pool (with failover)."""
+        if self.llm == "POOL":
             try:
-                response = self.openai_client.chat.completions.create(
-                    model=self.openai_model,
-                    messages=[
-                        {"role": "system", "content": SYSTEM_PROMPT},
-                        {"role": "user", "content": prompt}
-                    ],
-                    max_tokens=max_tokens,
-                    temperature=0.3
-                )
-                return response.choices[0].message.content.strip()
-            except Exception as e:
-                print(f"[AI] OpenAI Error: {e}")
+                text, _ = self.pool.generate(SYSTEM_PROMPT, prompt, max_tokens, self.temperature, priority)
+                return text
+            except ProviderError as e:
+                print(f"[AI] All LLM providers failed: {e}")
                 return "I'm having trouble connecting to the AI cloud."
 
-        # 2. Google Gemini
-        if self.llm == "GEMINI":
-            try:
-                full_prompt = f"{SYSTEM_PROMPT}\n\nUser Question: {prompt}"
-                response = self.gemini_model.generate_content(
-                    full_prompt,
-                    generation_config={"max_output_tokens": max_tokens, "temperature": 0.3}
-                )
-                return response.text.strip()
-            except Exception as e:
-                print(f"[AI] Gemini Error: {e}")
-                return "I'm having trouble connecting to Google Gemini."
+        # Fallback to Mock
+        return f"This is a simulated response (API not configured). Request: {prompt[:30]}..."
 
-        # 3. Anthropic Claude
-        if self.llm == "ANTHROPIC":
-            try:
-                message = self.anthropic_client.messages.create(
-                    model=self.anthropic_model,
-                    max_tokens=max_tokens,
-                    temperature=0.3,
-                    system=SYSTEM_PROMPT,
-                    messages=[{"role": "user", "content": prompt}]
-                )
-                return message.content[0].text.strip()
-            except Exception as e:
-                print(f"[AI] Claude Error: {e}")
-                return "I'm having trouble connecting to Anthropic Claude."
+    # ============================================
+    # STREAMING GENERATION
+    # ============================================
 
-        # 4. Remote Engine
-        remote_url = os.environ.get("MUSA_API_URL")
-        if remote_url and remote_url.startswith("http"):
+    def stream_generate(self, prompt: str, max_tokens: int = 500, use_cache: bool = False,
+                        priority: Priority = Priority.CHAT) -> Iterator[str]:
+        """
+        Generate a response incrementally.
+        
+        Yields text deltas as the provider produces them, so the first words
+        reach the client after time-to-first-token rather than after the
+        whole completion. Cache semantics match _generate.
+        """
+        if not self.llm:
+            success = self.load_model()
+            if not success:
+                yield "I'm having trouble loading my AI brain. Please try again."
+                return
+
+        provider, model = self._active_model()
+        key = completion_key(provider, model, prompt, max_tokens, self.temperature)
+        if use_cache:
+            cached = completion_cache.get(key)
+            if cached is not None:
+                yield cached
+                return
+
+        parts = []
+        for text in self._stream_llm(prompt, max_tokens, priority):
+            parts.append(text)
+            yield text
+
+        response = "".join(parts).strip()
+        if use_cache and response and not self._is_fallback_response(response):
+            completion_cache.put(key, response, provider, model)
+
+    def _stream_llm(self, prompt: str, max_tokens: int, priority: Priority = Priority.CHAT) -> Iterator[str]:
+        """Single uncached streaming request (fails over until the first token)."""
+        if self.llm == "POOL":
             try:
-                import requests
-                response = requests.post(f"{remote_url}/generate", json={
-                    "prompt": prompt, "max_tokens": max_tokens, "temperature": 0.3
-                }, timeout=30)
-                if response.status_code == 200:
-                    return response.json().get("text", "").strip()
-            except:
-                pass
+                yield from self.pool.stream(SYSTEM_PROMPT, prompt, max_tokens, self.temperature, priority)
+            except ProviderError as e:
+                print(f"[AI] All LLM providers failed: {e}")
+                yield "I'm having trouble connecting to the AI cloud."
+            return
 
         # Fallback to Mock
-        return f"This is a simulated response (API not configured). Request: {prompt[:30]}..."
+        yield f"This is a simulated response (API not configured). Request: {prompt[:30]}..."
+
+    def _is_fallback_response(self, response: str) -> bool:
+        """Canned error/mock text from _generate (never cache it)."""
+        return response.startswith(("I'm having trouble", "This is a simulated response"))
+
+    def _cacheable(self, response: str, validate: Callable[[str], Any] = None) -> bool:
+        """Real reply that the caller's parser (if any) accepts."""
+        if self._is_fallback_response(response):
+            return False
+        if validate is None:
+            return True
+        try:
+            validate(response)
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _json_object(raw: str) -> Dict[str, Any]:
+        return json.loads(raw[raw.find('{'):raw.rfind('}')+1])
+
+    @staticmethod
+    def _json_array(raw: str) -> List[Any]:
+        return json.loads(raw[raw.find('['):raw.rfind(']')+1])
+
+    def _parse_grade(self, raw: str) -> Dict[str, Any]:
+        data = self._json_object(raw)
+        r = data["rubric"]
+        data["score"] = round((r["correctness"] * 0.4 + r["reasoning"] * 0.3 + r["completeness"] * 0.2 + r["clarity"] * 0.1), 2)
+        return data
 
     def _calculate_confidence(self, retrieved_chunks: List[Dict], response: str) -> float:
         if not retrieved_chunks: return 0.3
@@ -409,12 +472,9 @@ If issues found, provide a corrected answer. If accurate, confirm:"""
         context = reference or (retriever.retrieve_context(question, max_tokens=1000) if topic_id else "")
         prompt = f"Grade this student response based on reference material.\nQuestion: {question}\nReference: {context}\nAnswer: {answer}\nReturn JSON: {{'rubric': {{'correctness': 0-100, 'reasoning': 0-100, 'completeness': 0-100, 'clarity': 0-100}}, 'feedback': '...'}}"
         try:
-            raw = self._generate(prompt, max_tokens=512)
-            clean = raw[raw.find('{'):raw.rfind('}')+1]
-            data = json.loads(clean)
-            r = data["rubric"]
-            data["score"] = round((r["correctness"] * 0.4 + r["reasoning"] * 0.3 + r["completeness"] * 0.2 + r["clarity"] * 0.1), 2)
-            return data
+            raw = self._generate(prompt, max_tokens=512, use_cache=True, priority=Priority.INTERACTIVE,
+                                 validate=self._parse_grade)
+            return self._parse_grade(raw)
         except:
             return {"score": 70, "rubric": {"correctness": 70, "reasoning": 70, "completeness": 70, "clarity": 70}, "feedback": "Evaluation processed with baseline scores."}
 
@@ -423,24 +483,27 @@ If issues found, provide a corrected answer. If accurate, confirm:"""
         if not self.llm: self.load_model()
         prompt = f"Create a {difficulty} level {assessment_type} for: {topic}. Return JSON format."
         try:
-            raw = self._generate(prompt, max_tokens=1024)
-            return json.loads(raw[raw.find('['):raw.rfind(']')+1])
+            raw = self._generate(prompt, max_tokens=1024, use_cache=True, priority=Priority.BACKGROUND,
+                                 validate=self._json_array)
+            return self._json_array(raw)
         except: return []
 
     def generate_coding_task(self, topic: str) -> Any:
         if not self.llm: self.load_model()
         prompt = f"Create a coding task for: {topic}. Return JSON."
         try:
-            raw = self._generate(prompt, max_tokens=512)
-            return json.loads(raw[raw.find('{'):raw.rfind('}')+1])
+            raw = self._generate(prompt, max_tokens=512, use_cache=True, priority=Priority.BACKGROUND,
+                                 validate=self._json_object)
+            return self._json_object(raw)
         except: return {"question": f"Write code for {topic}"}
 
     def grade_code(self, prompt: str, code: str) -> Any:
         if not self.llm: self.load_model()
         p = f"Grade this code: {code}\nTask: {prompt}\nJSON: {{'score': 0-100, 'feedback': '...'}}"
         try:
-            raw = self._generate(p, max_tokens=256)
-            return json.loads(raw[raw.find('{'):raw.rfind('}')+1])
+            raw = self._generate(p, max_tokens=256, use_cache=True, priority=Priority.INTERACTIVE,
+                                 validate=self._json_object)
+            return self._json_object(raw)
         except: return {"score": 50, "feedback": "Auto-graded."}
 
 model_service = ModelService()
@@ -0,0 +1,182 @@
+"""
+Prompt Builder
+Assembles tutor prompts as a stable, cacheable prefix plus a per-request suffix.
+
+The system prompt travels once, as the provider's system message, instead
+of being repeated inside every template. Parts that change slowly (student
+profile, session history, topic and pedagogy, textbook section) come first
+and per-question parts (retrieved context, the question itself) come last,
+so provider-side prompt caches (automatic prefix caching on OpenAI and
+DeepSeek, cache_control breakpoints on Anthropic) can reuse the prefix.
+"""
+from typing import Dict, Any, List, Tuple
+
+# ============================================
+# STRUCTURED SYSTEM PROMPTS
+# ============================================
+
+SYSTEM_PROMPT = """You are Musa, the EduNexus AI Tutor.
+
+CORE RULES:
+- Be helpful, encouraging, and accurate.
+- Answer directly without preambles.
+- No reasoning or wrapper markers (<thought>, <response>, <speak>, etc.).
+- NEVER repeat your own previous answers or sentences within the same response.
+- Use provided context where relevant.
+"""
+
+CHAT_PREFIX_TEMPLATE = """[STUDENT PROFILE]
+Topics: {topics_covered} | Mastery: {mastery_level} | Style: {learning_style}
+
+[SESSION HISTORY]
+{conversation_history}
+
+"""
+
+CHAT_SUFFIX_TEMPLATE = """[KNOWLEDGE CONTEXT]
+{context}
+
+[CURRENT STUDENT QUERY]
+{user_input}
+
+[MUSA RESPONSE]
+"""
+
+INTERACTIVE_PREFIX_TEMPLATE = """[TUTOR STATE: {tutor_state}]
+[TOPIC: {topic_title}]
+
+[PEDAGOGICAL INSTRUCTIONS]
+{state_instructions}
+
+"""
+
+INTERACTIVE_SUFFIX_TEMPLATE = """[KNOWLEDGE CONTEXT]
+{context}
+
+[STUDENT PROFILE]
+Mastery: {mastery}% | Hints: {hints_used}
+Learning Style: {learning_style}
+Common Mistakes: {common_mistakes}
+
+[CURRENT STUDENT INPUT]
+{user_input}
+
+[MUSA RESPONSE]
+"""
+
+SECTION_PREFIX_TEMPLATE = """You are helping a student who is currently reading the following section of their Electronic Textbook:
+Context: {section_text}
+
+"""
+
+SECTION_SUFFIX_TEMPLATE = """Student: {user_input}
+
+Provide a deep, insightful, and supportive response based on the textbook content. Track their progress and encourage further inquiry."""
+
+STATE_INSTRUCTIONS = {
+    "INTRODUCE": "Provide a warm introduction to this topic. Explain what they will learn and why it matters.",
+    "EXPLAIN": "Explain the concept clearly. Use analogies and examples. Break down complex ideas step by step.",
+    "CHECK_UNDERSTANDING": "Ask a probing question to assess comprehension. Don't give away the answer.",
+    "ASSESS": "Present an exercise or question to evaluate understanding. This affects their grade.",
+    "UPDATE_MASTERY": "Provide encouraging feedback about their progress based on their performance.",
+    "ADVANCE": "Congratulate them and prepare to introduce the next concept.",
+    "REMEDIATE": "Provide additional examples and simpler explanations. Be patient and supportive."
+}
+
+
+class Prompt(str):
+    """
+    Prompt text that remembers where its stable prefix ends.
+
+    Behaves as the full string everywhere else (cache keys, token counts,
+    logging); providers with prompt caching send the two parts separately.
+    """
+
+    def __new__(cls, prefix: str, suffix: str = ""):
+        prompt = super().__new__(cls, prefix + suffix)
+        prompt.prefix = prefix
+        prompt.suffix = suffix
+        return prompt
+
+
+def split_prompt(prompt: str) -> Tuple[str, str]:
+    """(cacheable prefix, variable suffix); plain strings have no prefix."""
+    if isinstance(prompt, Prompt):
+        return prompt.prefix, prompt.suffix
+    return "", str(prompt)
+
+
+# ============================================
+# TUTOR PROMPTS
+# ============================================
+
+def chat_prompt(query: str, context: str, user_memory: Dict[str, Any] = None,
+                conversation_history: str = "") -> Prompt:
+    """RAG chat turn: profile and history are the prefix, retrieval and question the suffix."""
+    memory = user_memory or {}
+    prefix = CHAT_PREFIX_TEMPLATE.format(
+        topics_covered=", ".join(memory.get("topics_covered", [])[:5]) or "None yet",
+        mastery_level=f"{memory.get('overall_mastery', 0) * 100:.0f}%",
+        learning_style=memory.get("learning_style", "balanced"),
+        conversation_history=conversation_history or "[No prior conversation]"
+    )
+    suffix = CHAT_SUFFIX_TEMPLATE.format(
+        context=context or "[No retrieved context available]",
+        user_input=query
+    )
+    return Prompt(prefix, suffix)
+
+
+def interactive_prompt(query: str, tutor_state: str, context: str, course_data: Dict[str, Any] = None,
+                       user_memory: Dict[str, Any] = None, mastery: float = 0.0, hints_used: int = 0) -> Prompt:
+    """Interactive turn: topic and pedagogy are the prefix, the rest varies per turn."""
+    course_data = course_data or {}
+    memory = user_memory or {}
+    prefix = INTERACTIVE_PREFIX_TEMPLATE.format(
+        tutor_state=tutor_state,
+        topic_title=course_data.get("topic_title", "Unknown Topic"),
+        state_instructions=STATE_INSTRUCTIONS.get(tutor_state, "Respond helpfully.")
+    )
+    suffix = INTERACTIVE_SUFFIX_TEMPLATE.format(
+        context=context or "[No retrieved context]",
+        mastery=int(mastery * 100),
+        hints_used=hints_used,
+        learning_style=memory.get("learning_style", "balanced"),
+        common_mistakes=", ".join(memory.get("common_mistakes", [])) or "No persistent patterns detected.",
+        user_input=query
+    )
+    return Prompt(prefix, suffix)
+
+
+def section_prompt(query: str, section_text: str) -> Prompt:
+    """Textbook side-chat: the section being read is the prefix."""
+    return Prompt(
+        SECTION_PREFIX_TEMPLATE.format(section_text=section_text[:3000]),
+        SECTION_SUFFIX_TEMPLATE.format(user_input=query)
+    )
+
+
+# ============================================
+# PROVIDER MESSAGE FORMATS
+# ============================================
+
+def chat_messages(system: str, prompt: str) -> List[Dict[str, Any]]:
+    """OpenAI-compatible messages. Prefix caching there is automatic for identical leading tokens."""
+    return [{"role": "system", "content": system}, {"role": "user", "content": str(prompt)}]
+
+
+def anthropic_blocks(system: str, prompt: str) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """(system blocks, user content blocks) with cache breakpoints after the system prompt and the prefix."""
+    prefix, suffix = split_prompt(prompt)
+    system_blocks = [{"type": "text", "text": system, "cache_control": {"type": "ephemeral"}}]
+    content = []
+    if prefix:
+        content.append({"type": "text", "text": prefix, "cache_control": {"type": "ephemeral"}})
+    if suffix or not prefix:
+        content.append({"type": "text", "text": suffix})
+    return system_blocks, content
+
+
+def flat_prompt(system: str, prompt: str) -> str:
+    """Single-string form for backends without a system role (Gemini)."""
+    return f"{system}\n\nUser Question: {prompt}"
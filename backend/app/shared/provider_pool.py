@@ -0,0 +1,624 @@
+"""
+LLM Provider Pool
+Routes each completion to the fastest healthy backend, fails over
+automatically and can hedge slow requests with a duplicate. Each backend
+also has its own rate limiter, so bursts queue by priority rather than
+tripping upstream 429s.
+
+Every configured backend (DeepSeek, OpenAI, Anthropic, Gemini, remote
+engine) keeps rolling latency and error statistics; a backend that fails
+repeatedly is benched for a cooldown period and only retried as a last
+resort until it recovers. A remote engine whose health probe failed is
+skipped entirely until a background probe sees it again.
+"""
+import os
+import json
+import time
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from threading import Lock
+from typing import Dict, Any, List, Optional, Iterator, Tuple
+
+from app.shared.http_client import remote_engine
+from app.shared.rate_limiter import Priority, limiter_for, estimate_tokens
+from app.shared.prompt_builder import chat_messages, anthropic_blocks, flat_prompt
+
+
+class ProviderError(Exception):
+    """Raised when no backend could produce a completion."""
+
+
+class ProviderStats:
+    """Rolling latency/error window for one backend."""
+
+    def __init__(self, window: int = 100, failure_threshold: int = 3, cooldown_seconds: float = 30.0):
+        self.latencies = deque(maxlen=window)  # ms of recent successful calls
+        self.outcomes = deque(maxlen=window)   # 1 = success, 0 = failure
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.ewma_ms: Optional[float] = None
+        self.consecutive_failures = 0
+        self.benched_until = 0.0
+        self.last_used = 0.0
+        self.counters = {"calls": 0, "failures": 0, "hedges_sent": 0, "hedges_won": 0}
+        self.usage = {"input_tokens": 0, "cached_input_tokens": 0, "output_tokens": 0, "metered_calls": 0}
+        self.lock = Lock()
+
+    def success(self, ms: float):
+        with self.lock:
+            self.latencies.append(ms)
+            self.outcomes.append(1)
+            self.ewma_ms = ms if self.ewma_ms is None else 0.8 * self.ewma_ms + 0.2 * ms
+            self.consecutive_failures = 0
+            self.benched_until = 0.0
+            self.last_used = time.time()
+            self.counters["calls"] += 1
+
+    def failure(self):
+        with self.lock:
+            self.outcomes.append(0)
+            self.consecutive_failures += 1
+            self.last_used = time.time()
+            self.counters["calls"] += 1
+            self.counters["failures"] += 1
+            if self.consecutive_failures >= self.failure_threshold:
+                self.benched_until = time.time() + self.cooldown_seconds
+
+    def record_usage(self, input_tokens: int, cached_tokens: int = 0, output_tokens: int = 0):
+        """Token counts of one call (as reported by the provider, or estimated)."""
+        with self.lock:
+            self.usage["input_tokens"] += int(input_tokens or 0)
+            self.usage["cached_input_tokens"] += int(cached_tokens or 0)
+            self.usage["output_tokens"] += int(output_tokens or 0)
+            self.usage["metered_calls"] += 1
+
+    def benched(self) -> bool:
+        return time.time() < self.benched_until
+
+    def error_rate(self) -> float:
+        return 1.0 - sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+
+    def p95(self) -> Optional[float]:
+        if len(self.latencies) < 5:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+    def snapshot(self) -> Dict[str, Any]:
+        p95 = self.p95()
+        metered = self.usage["metered_calls"]
+        return {
+            **self.counters,
+            **self.usage,
+            "avg_input_tokens": round(self.usage["input_tokens"] / metered, 1) if metered else 0.0,
+            "cached_input_ratio": round(self.usage["cached_input_tokens"] / self.usage["input_tokens"], 3)
+            if self.usage["input_tokens"] else 0.0,
+            "ewma_ms": round(self.ewma_ms, 1) if self.ewma_ms is not None else None,
+            "p95_ms": round(p95, 1) if p95 is not None else None,
+            "error_rate": round(self.error_rate(), 3),
+            "benched": self.benched()
+        }
+
+
+# ============================================
+# BACKENDS
+# ============================================
+
+class Provider:
+    """One LLM backend. complete/stream raise on failure; the pool handles fallback."""
+    has_async = False
+
+    def __init__(self, name: str, model: str):
+        self.name = name
+        self.model = model
+        self.stats = ProviderStats(
+            failure_threshold=int(os.environ.get("LLM_FAILURE_THRESHOLD", "3")),
+            cooldown_seconds=float(os.environ.get("LLM_COOLDOWN_SECONDS", "30"))
+        )
+        self.limiter = limiter_for(name)
+
+    def reachable(self) -> bool:
+        """False when the backend is known to be down (excluded from routing)."""
+        return True
+
+    def available(self) -> bool:
+        return not self.stats.benched()
+
+    def complete(self, system: str, prompt: str, max_tokens: int, temperature: float) -> str:
+        raise NotImplementedError
+
+    async def acomplete(self, system: str, prompt: str, max_tokens: int, temperature: float) -> str:
+        raise NotImplementedError
+
+    def stream(self, system: str, prompt: str, max_tokens: int, temperature: float) -> Iterator[str]:
+        yield self.complete(system, prompt, max_tokens, temperature)
+
+
+class OpenAIProvider(Provider):
+    """OpenAI-compatible chat completions (OpenAI, DeepSeek, generic base_url)."""
+    has_async = True
+
+    def __init__(self, name: str, api_key: str, base_url: str, model: str):
+        super().__init__(name, model)
+        from openai import OpenAI, AsyncOpenAI
+        self.client = OpenAI(api_key=api_key, base_url=base_url)
+        self.async_client = AsyncOpenAI(api_key=api_key, base_url=base_url)
+
+    def _request(self, system, prompt, max_tokens, temperature) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "messages": chat_messages(system, prompt),
+            "max_tokens": max_tokens,
+            "temperature": temperature
+        }
+
+    def _record(self, usage):
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None) or getattr(usage, "prompt_cache_hit_tokens", 0)  # DeepSeek
+        self.stats.record_usage(usage.prompt_tokens, cached, usage.completion_tokens)
+
+    def complete(self, system, prompt, max_tokens, temperature):
+        response = self.client.chat.completions.create(**self._request(system, prompt, max_tokens, temperature))
+        self._record(response.usage)
+        return response.choices[0].message.content.strip()
+
+    async def acomplete(self, system, prompt, max_tokens, temperature):
+        response = await self.async_client.chat.completions.create(
+            **self._request(system, prompt, max_tokens, temperature)
+        )
+        self._record(response.usage)
+        return response.choices[0].message.content.strip()
+
+    def stream(self, system, prompt, max_tokens, temperature):
+        stream = self.client.chat.completions.create(
+            **self._request(system, prompt, max_tokens, temperature), stream=True
+        )
+        for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                yield delta
+        self.stats.record_usage(estimate_tokens(system + prompt, 0))
+
+
+class AnthropicProvider(Provider):
+    has_async = True
+
+    def __init__(self, api_key: str, model: str):
+        super().__init__("anthropic", model)
+        import anthropic
+        self.client = anthropic.Anthropic(api_key=api_key)
+        self.async_client = anthropic.AsyncAnthropic(api_key=api_key)
+
+    def _request(self, system, prompt, max_tokens, temperature) -> Dict[str, Any]:
+        system_blocks, content = anthropic_blocks(system, prompt)
+        return {
+            "model": self.model,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "system": system_blocks,
+            "messages": [{"role": "user", "content": content}]
+        }
+
+    def _record(self, usage):
+        # input_tokens excludes cache reads/writes; report the full prompt size
+        cached = getattr(usage, "cache_read_input_tokens", 0) or 0
+        written = getattr(usage, "cache_creation_input_tokens", 0) or 0
+        self.stats.record_usage(usage.input_tokens + cached + written, cached, usage.output_tokens)
+
+    def complete(self, system, prompt, max_tokens, temperature):
+        message = self.client.messages.create(**self._request(system, prompt, max_tokens, temperature))
+        self._record(message.usage)
+        return message.content[0].text.strip()
+
+    async def acomplete(self, system, prompt, max_tokens, temperature):
+        message = await self.async_client.messages.create(**self._request(system, prompt, max_tokens, temperature))
+        self._record(message.usage)
+        return message.content[0].text.strip()
+
+    def stream(self, system, prompt, max_tokens, temperature):
+        with self.client.messages.stream(**self._request(system, prompt, max_tokens, temperature)) as stream:
+            for text in stream.text_stream:
+                if text:
+                    yield text
+            self._record(stream.get_final_message().usage)
+
+
+class GeminiProvider(Provider):
+    has_async = True
+
+    def __init__(self, api_key: str, model: str = "gemini-pro"):
+        super().__init__("gemini", model)
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self.client = genai.GenerativeModel(model)
+
+    def _record(self, response):
+        try:
+            usage = response.usage_metadata
+            self.stats.record_usage(usage.prompt_token_count, getattr(usage, "cached_content_token_count", 0),
+                                    getattr(usage, "candidates_token_count", 0))
+        except Exception:
+            pass  # older SDKs do not report usage
+
+    def complete(self, system, prompt, max_tokens, temperature):
+        response = self.client.generate_content(
+            flat_prompt(system, prompt),
+            generation_config={"max_output_tokens": max_tokens, "temperature": temperature}
+        )
+        self._record(response)
+        return response.text.strip()
+
+    async def acomplete(self, system, prompt, max_tokens, temperature):
+        response = await self.client.generate_content_async(
+            flat_prompt(system, prompt),
+            generation_config={"max_output_tokens": max_tokens, "temperature": temperature}
+        )
+        self._record(response)
+        return response.text.strip()
+
+    def stream(self, system, prompt, max_tokens, temperature):
+        stream = self.client.generate_content(
+            flat_prompt(system, prompt),
+            generation_config={"max_output_tokens": max_tokens, "temperature": temperature},
+            stream=True
+        )
+        for chunk in stream:
+            if chunk.text:
+                yield chunk.text
+        self._record(stream)
+
+
+class RemoteEngineProvider(Provider):
+    """Self-hosted MUSA_API_URL engine (single prompt string, system prompt first)."""
+    has_async = True
+
+    def __init__(self):
+        super().__init__("remote", remote_engine.base_url)
+
+    def reachable(self) -> bool:
+        # Cached /health result; stale results are refreshed off the request path
+        return remote_engine.is_healthy()
+
+    def _payload(self, system, prompt, max_tokens, temperature) -> Dict[str, Any]:
+        # Stable leading text lets engines with prefix caching reuse the system prompt
+        text = f"{system}\n\n{prompt}"
+        self.stats.record_usage(estimate_tokens(text, 0))
+        return {"prompt": text, "max_tokens": max_tokens, "temperature": temperature}
+
+    def complete(self, system, prompt, max_tokens, temperature):
+        response = remote_engine.post("/generate", json=self._payload(system, prompt, max_tokens, temperature))
+        response.raise_for_status()
+        return response.json().get("text", "").strip()
+
+    async def acomplete(self, system, prompt, max_tokens, temperature):
+        response = await remote_engine.apost("/generate", json=self._payload(system, prompt, max_tokens, temperature))
+        response.raise_for_status()
+        return response.json().get("text", "").strip()
+
+    def stream(self, system, prompt, max_tokens, temperature):
+        """SSE / NDJSON lines when the engine streams, plain JSON otherwise."""
+        payload = {**self._payload(system, prompt, max_tokens, temperature), "stream": True}
+        with remote_engine.stream("/generate", json=payload) as response:
+            response.raise_for_status()
+            if "application/json" in response.headers.get("content-type", ""):
+                response.read()
+                yield response.json().get("text", "").strip()
+                return
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                if line.startswith("data:"):
+                    line = line[5:].strip()
+                if line == "[DONE]":
+                    break
+                try:
+                    text = json.loads(line).get("text", "")
+                except ValueError:
+                    text = line
+                if text:
+                    yield text
+
+
+# ============================================
+# POOL
+# ============================================
+
+class ProviderPool:
+    def __init__(self, hedge: bool = False, hedge_min_ms: float = 300.0, hedge_default_ms: float = 5000.0,
+                 stale_seconds: float = 300.0, executor_workers: int = 16):
+        """
+        Initialize provider pool.
+
+        Args:
+            hedge: Send a duplicate request to the next backend when the first is slow
+            hedge_min_ms: Lower bound on the hedge delay
+            hedge_default_ms: Hedge delay before a backend has enough samples for a p95
+            stale_seconds: Backends unused for this long are re-sampled
+            executor_workers: Threads for hedged sync calls and sync-only backends
+        """
+        self.providers: List[Provider] = []
+        self.hedge = hedge
+        self.hedge_min_ms = hedge_min_ms
+        self.hedge_default_ms = hedge_default_ms
+        self.stale_seconds = stale_seconds
+        self.executor = ThreadPoolExecutor(max_workers=executor_workers, thread_name_prefix="llm-hedge")
+        self.counters = {"requests": 0, "failovers": 0, "hedged": 0, "exhausted": 0}
+
+    def add(self, provider: Provider):
+        self.providers.append(provider)
+
+    def clear(self):
+        self.providers = []
+
+    def signature(self) -> str:
+        """Stable identity of the configured backends (for cache keys)."""
+        return ",".join(f"{p.name}:{p.model}" for p in self.providers)
+
+    # ============================================
+    # SELECTION
+    # ============================================
+
+    def _score(self, provider: Provider) -> float:
+        stats = provider.stats
+        if stats.ewma_ms is None or time.time() - stats.last_used > self.stale_seconds:
+            return 0.0  # unsampled or stale: try it so its numbers stay current
+        return stats.ewma_ms * (1.0 + 4.0 * stats.error_rate())
+
+    def ranked(self) -> List[Provider]:
+        """Healthy backends with spare rate budget fastest-first, then benched ones as a last resort."""
+        order = {id(p): i for i, p in enumerate(self.providers)}
+        reachable = [p for p in self.providers if p.reachable()]
+        healthy = [p for p in reachable if p.available()]
+        benched = [p for p in reachable if p not in healthy]
+        healthy.sort(key=lambda p: (p.limiter.backlogged(), self._score(p), order[id(p)]))
+        benched.sort(key=lambda p: p.stats.benched_until)
+        return healthy + benched
+
+    def _candidates(self) -> List[Provider]:
+        candidates = self.ranked()
+        if not candidates:
+            raise ProviderError("No reachable LLM providers" if self.providers else "No LLM providers configured")
+        return candidates
+
+    @staticmethod
+    def _note_rate_limit(provider: Provider, error: Exception):
+        """Pause a backend's limiter when it answered 429 (honouring Retry-After)."""
+        response = getattr(error, "response", None)
+        status = getattr(error, "status_code", None) or getattr(response, "status_code", None)
+        if status != 429:
+            return
+        retry_after = None
+        try:
+            retry_after = float(response.headers.get("retry-after"))
+        except (AttributeError, TypeError, ValueError):
+            pass
+        provider.limiter.throttle(retry_after or 5.0)
+
+    def _hedge_delay(self, provider: Provider) -> float:
+        p95 = provider.stats.p95()
+        return max(self.hedge_min_ms, p95 if p95 is not None else self.hedge_default_ms) / 1000
+
+    # ============================================
+    # BLOCKING
+    # ============================================
+
+    def _timed(self, provider: Provider, system, prompt, max_tokens, temperature, priority) -> str:
+        with provider.limiter.slot(estimate_tokens(system + prompt, max_tokens), priority):
+            start = time.perf_counter()
+            try:
+                text = provider.complete(system, prompt, max_tokens, temperature)
+            except Exception as e:
+                provider.stats.failure()
+                self._note_rate_limit(provider, e)
+                raise
+        provider.stats.success((time.perf_counter() - start) * 1000)
+        return text
+
+    def generate(self, system: str, prompt: str, max_tokens: int, temperature: float,
+                 priority: Priority = Priority.CHAT) -> Tuple[str, str]:
+        """
+        Complete a prompt on the best available backend.
+
+        Args:
+            priority: Queue position when a backend's rate budget is exhausted
+
+        Returns:
+            (text, backend name)
+
+        Raises:
+            ProviderError: every backend failed (or none is configured)
+        """
+        candidates = self._candidates()
+        self.counters["requests"] += 1
+        if self.hedge and len(candidates) > 1:
+            return self._generate_hedged(candidates, system, prompt, max_tokens, temperature, priority)
+
+        errors = []
+        for i, provider in enumerate(candidates):
+            if i:
+                self.counters["failovers"] += 1
+            try:
+                return self._timed(provider, system, prompt, max_tokens, temperature, priority), provider.name
+            except Exception as e:
+                print(f"[AI] {provider.name} failed: {e}")
+                errors.append(f"{provider.name}: {e}")
+        self.counters["exhausted"] += 1
+        raise ProviderError("; ".join(errors))
+
+    def _generate_hedged(self, candidates, system, prompt, max_tokens, temperature, priority) -> Tuple[str, str]:
+        queue = list(candidates)
+        in_flight = {}
+        hedges = set()
+        errors = []
+
+        def launch():
+            provider = queue.pop(0)
+            future = self.executor.submit(self._timed, provider, system, prompt, max_tokens, temperature, priority)
+            in_flight[future] = provider
+            return provider
+
+        delay = self._hedge_delay(launch())
+        while in_flight:
+            done, _ = wait(list(in_flight), timeout=delay if queue else None, return_when=FIRST_COMPLETED)
+            if not done:
+                # Slower than its p95: race a duplicate on the next backend
+                hedge = launch()
+                hedges.add(hedge.name)
+                hedge.stats.counters["hedges_sent"] += 1
+                self.counters["hedged"] += 1
+                delay = self._hedge_delay(hedge)
+                continue
+            for future in done:
+                provider = in_flight.pop(future)
+                try:
+                    text = future.result()
+                except Exception as e:
+                    print(f"[AI] {provider.name} failed: {e}")
+                    errors.append(f"{provider.name}: {e}")
+                    continue
+                if provider.name in hedges:
+                    provider.stats.counters["hedges_won"] += 1
+                return text, provider.name  # losers finish in the background and still update stats
+            if queue and not in_flight:
+                self.counters["failovers"] += 1
+                delay = self._hedge_delay(launch())
+        self.counters["exhausted"] += 1
+        raise ProviderError("; ".join(errors))
+
+    # ============================================
+    # ASYNC
+    # ============================================
+
+    async def _atimed(self, provider: Provider, system, prompt, max_tokens, temperature, priority) -> str:
+        async with provider.limiter.aslot(estimate_tokens(system + prompt, max_tokens), priority):
+            start = time.perf_counter()
+            try:
+                if provider.has_async:
+                    text = await provider.acomplete(system, prompt, max_tokens, temperature)
+                else:
+                    loop = asyncio.get_running_loop()
+                    text = await loop.run_in_executor(
+                        self.executor, provider.complete, system, prompt, max_tokens, temperature
+                    )
+            except asyncio.CancelledError:
+                raise  # lost a hedge race: not a failure
+            except Exception as e:
+                provider.stats.failure()
+                self._note_rate_limit(provider, e)
+                raise
+        provider.stats.success((time.perf_counter() - start) * 1000)
+        return text
+
+    async def agenerate(self, system: str, prompt: str, max_tokens: int, temperature: float,
+                        priority: Priority = Priority.CHAT) -> Tuple[str, str]:
+        """Awaitable generate(); losing hedged requests are cancelled."""
+        candidates = self._candidates()
+        self.counters["requests"] += 1
+        hedge = self.hedge and len(candidates) > 1
+
+        queue = list(candidates)
+        in_flight: Dict[asyncio.Task, Provider] = {}
+        hedges = set()
+        errors = []
+
+        def launch():
+            provider = queue.pop(0)
+            task = asyncio.ensure_future(self._atimed(provider, system, prompt, max_tokens, temperature, priority))
+            in_flight[task] = provider
+            return provider
+
+        delay = self._hedge_delay(launch())
+        try:
+            while in_flight:
+                timeout = delay if hedge and queue else None
+                done, _ = await asyncio.wait(list(in_flight), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    provider = launch()
+                    hedges.add(provider.name)
+                    provider.stats.counters["hedges_sent"] += 1
+                    self.counters["hedged"] += 1
+                    delay = self._hedge_delay(provider)
+                    continue
+                for task in done:
+                    provider = in_flight.pop(task)
+                    try:
+                        text = task.result()
+                    except Exception as e:
+                        print(f"[AI] {provider.name} failed: {e}")
+                        errors.append(f"{provider.name}: {e}")
+                        continue
+                    if provider.name in hedges:
+                        provider.stats.counters["hedges_won"] += 1
+                    return text, provider.name
+                if queue and not in_flight:
+                    self.counters["failovers"] += 1
+                    delay = self._hedge_delay(launch())
+        finally:
+            for task in in_flight:
+                task.cancel()
+        self.counters["exhausted"] += 1
+        raise ProviderError("; ".join(errors))
+
+    # ============================================
+    # STREAMING
+    # ============================================
+
+    def stream(self, system: str, prompt: str, max_tokens: int, temperature: float,
+               priority: Priority = Priority.CHAT) -> Iterator[str]:
+        """
+        Stream from the best available backend.
+
+        Fails over only before the first token; an error after that ends the
+        stream (the client already shows partial text).
+        """
+        candidates = self._candidates()
+        self.counters["requests"] += 1
+
+        errors = []
+        for i, provider in enumerate(candidates):
+            if i:
+                self.counters["failovers"] += 1
+            started = False
+            try:
+                with provider.limiter.slot(estimate_tokens(system + prompt, max_tokens), priority):
+                    start = time.perf_counter()
+                    try:
+                        for text in provider.stream(system, prompt, max_tokens, temperature):
+                            started = True
+                            yield text
+                    except Exception as e:
+                        provider.stats.failure()
+                        self._note_rate_limit(provider, e)
+                        raise
+            except Exception as e:
+                print(f"[AI] {provider.name} stream failed: {e}")
+                if started:
+                    return
+                errors.append(f"{provider.name}: {e}")
+                continue
+            provider.stats.success((time.perf_counter() - start) * 1000)
+            return
+        self.counters["exhausted"] += 1
+        raise ProviderError("; ".join(errors))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hedge": self.hedge,
+            **self.counters,
+            "ranking": [p.name for p in self.ranked()],
+            "providers": {
+                p.name: {"model": p.model, **p.stats.snapshot(), "rate_limit": p.limiter.stats()}
+                for p in self.providers
+            }
+        }
+
+
+# Singleton instance (backends are registered by ModelService.load_model)
+provider_pool = ProviderPool(
+    hedge=os.environ.get("LLM_HEDGE", "false").lower() == "true",
+    hedge_min_ms=float(os.environ.get("LLM_HEDGE_MIN_MS", "300")),
+    hedge_default_ms=float(os.environ.get("LLM_HEDGE_DEFAULT_MS", "5000"))
+)
@@ -0,0 +1,288 @@
+"""
+LLM Rate Limiter
+Per-provider request/token budgets with a priority wait queue.
+
+Each backend gets a requests-per-minute and a tokens-per-minute bucket plus
+a concurrency cap. Callers that cannot be served immediately wait in a
+queue ordered by priority (interactive graded turns, then chat, then
+background generation) and FIFO within a priority, so bursts queue up
+instead of turning into provider 429s.
+"""
+import os
+import time
+import heapq
+import asyncio
+import itertools
+from contextlib import contextmanager, asynccontextmanager
+from enum import IntEnum
+from threading import Lock, Event
+from typing import Dict, Any, List
+
+from app.shared.http_client import LatencyHistogram
+
+LATENCY_BUCKETS_MS = (1, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0  # graded tutor turns, essay grading
+    CHAT = 1         # free-form tutor chat
+    BACKGROUND = 2   # textbook / assessment generation
+
+
+class RateLimitTimeout(Exception):
+    """Raised when a request waited longer than the queue timeout."""
+
+
+def estimate_tokens(text: str, max_tokens: int) -> int:
+    """Rough token cost of a request: ~4 characters per prompt token plus the completion budget."""
+    return len(text) // 4 + int(max_tokens)
+
+
+class TokenBucket:
+    """Continuous-refill bucket; rate_per_minute <= 0 means unlimited."""
+
+    def __init__(self, rate_per_minute: float, burst: float = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = burst if burst is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.rate <= 0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def cost(self, amount: float) -> float:
+        return min(amount, self.capacity)  # oversized requests wait for a full bucket
+
+    def ready_in(self, amount: float, now: float) -> float:
+        """Seconds until amount can be taken (0 = now)."""
+        if self.unlimited:
+            return 0.0
+        self._refill(now)
+        missing = self.cost(amount) - self.tokens
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount: float):
+        if not self.unlimited:
+            self.tokens -= self.cost(amount)
+
+
+class _Waiter:
+    def __init__(self, priority: int, tokens: int):
+        self.priority = priority
+        self.tokens = tokens
+        self.granted = False
+        self.cancelled = False
+        self.event = Event()
+        self.wake = self.event.set
+
+    def grant(self):
+        self.granted = True
+        self.wake()
+
+
+class ProviderLimiter:
+    def __init__(self, name: str, requests_per_minute: float = 0, tokens_per_minute: float = 0,
+                 max_concurrency: int = 0, queue_timeout: float = 60.0):
+        """
+        Initialize provider limiter.
+
+        Args:
+            name: Backend name (for logs and stats)
+            requests_per_minute: Request budget (0 = unlimited)
+            tokens_per_minute: Prompt + completion token budget (0 = unlimited)
+            max_concurrency: In-flight request cap (0 = unlimited)
+            queue_timeout: Longest a request may wait before RateLimitTimeout
+        """
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+
+        self.lock = Lock()
+        self.queue: List[tuple] = []  # heap of (priority, seq, waiter)
+        self.sequence = itertools.count()
+        self.depth = {p: 0 for p in Priority}
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.waits = {p: LatencyHistogram(LATENCY_BUCKETS_MS) for p in Priority}
+        self.counters = {"granted": 0, "queued": 0, "timeouts": 0, "throttled": 0}
+
+    # ============================================
+    # SCHEDULING
+    # ============================================
+
+    def _ready_in_locked(self, waiter: _Waiter, now: float) -> float:
+        return max(self.paused_until - time.time(),
+                   self.requests.ready_in(1, now),
+                   self.tokens.ready_in(waiter.tokens, now))
+
+    def _grant_locked(self):
+        """Admit queued requests in priority order while budget and slots allow."""
+        now = time.monotonic()
+        while self.queue:
+            _, _, waiter = self.queue[0]
+            if waiter.cancelled:
+                heapq.heappop(self.queue)
+                continue
+            if self.max_concurrency and self.in_flight >= self.max_concurrency:
+                return
+            if self._ready_in_locked(waiter, now) > 0:
+                return
+            heapq.heappop(self.queue)
+            self.requests.take(1)
+            self.tokens.take(waiter.tokens)
+            self.in_flight += 1
+            self.depth[waiter.priority] -= 1
+            self.counters["granted"] += 1
+            waiter.grant()
+
+    def _retry_in_locked(self) -> float:
+        """How long a waiter should sleep before re-checking the budget itself."""
+        while self.queue and self.queue[0][2].cancelled:
+            heapq.heappop(self.queue)
+        if not self.queue:
+            return 0.05
+        return min(1.0, max(0.01, self._ready_in_locked(self.queue[0][2], time.monotonic())))
+
+    def _enqueue(self, waiter: _Waiter):
+        with self.lock:
+            heapq.heappush(self.queue, (waiter.priority, next(self.sequence), waiter))
+            self.depth[waiter.priority] += 1
+            self._grant_locked()
+            if not waiter.granted:
+                self.counters["queued"] += 1
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """Withdraw a waiter; returns True if it had already been granted a slot."""
+        with self.lock:
+            if waiter.granted:
+                return True
+            waiter.cancelled = True
+            self.depth[waiter.priority] -= 1
+            return False
+
+    def _timed_out(self, waiter: _Waiter):
+        if self._abandon(waiter):
+            self.release()
+        self.counters["timeouts"] += 1
+        raise RateLimitTimeout(f"{self.name}: waited more than {self.queue_timeout:g}s for rate limit")
+
+    # ============================================
+    # ACQUIRE / RELEASE
+    # ============================================
+
+    def acquire(self, tokens: int, priority: Priority = Priority.CHAT):
+        """Block until the request may be sent (raises RateLimitTimeout)."""
+        waiter = _Waiter(priority, tokens)
+        start = time.perf_counter()
+        deadline = start + self.queue_timeout
+        self._enqueue(waiter)
+        while not waiter.granted:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                self._timed_out(waiter)
+            with self.lock:
+                retry = self._retry_in_locked()
+            waiter.event.wait(min(remaining, retry))
+            if not waiter.granted:
+                with self.lock:
+                    self._grant_locked()
+        self.waits[priority].record((time.perf_counter() - start) * 1000)
+
+    async def aacquire(self, tokens: int, priority: Priority = Priority.CHAT):
+        """Awaitable acquire(); waiting does not block the event loop."""
+        loop = asyncio.get_running_loop()
+        woken = loop.create_future()
+        waiter = _Waiter(priority, tokens)
+        waiter.wake = lambda: loop.call_soon_threadsafe(lambda: woken.done() or woken.set_result(True))
+        start = time.perf_counter()
+        deadline = start + self.queue_timeout
+        try:
+            self._enqueue(waiter)
+            while not waiter.granted:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    self._timed_out(waiter)
+                with self.lock:
+                    retry = self._retry_in_locked()
+                try:
+                    await asyncio.wait_for(asyncio.shield(woken), timeout=min(remaining, retry))
+                except asyncio.TimeoutError:
+                    with self.lock:
+                        self._grant_locked()
+        except asyncio.CancelledError:
+            if self._abandon(waiter):
+                self.release()
+            raise
+        self.waits[priority].record((time.perf_counter() - start) * 1000)
+
+    def release(self):
+        with self.lock:
+            self.in_flight -= 1
+            self._grant_locked()
+
+    @contextmanager
+    def slot(self, tokens: int, priority: Priority = Priority.CHAT):
+        self.acquire(tokens, priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def aslot(self, tokens: int, priority: Priority = Priority.CHAT):
+        await self.aacquire(tokens, priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def throttle(self, seconds: float):
+        """Pause admissions after the provider answered 429."""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.time() + seconds)
+            self.counters["throttled"] += 1
+        print(f"[LIMIT] {self.name} rate limited upstream; pausing {seconds:.1f}s")
+
+    def backlogged(self) -> bool:
+        """True when a new request would have to wait."""
+        with self.lock:
+            if any(self.depth.values()):
+                return True
+            if self.max_concurrency and self.in_flight >= self.max_concurrency:
+                return True
+            return self._ready_in_locked(_Waiter(Priority.CHAT, 0), time.monotonic()) > 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            "in_flight": self.in_flight,
+            "queue_depth": {p.name.lower(): self.depth[p] for p in Priority},
+            "wait": {p.name.lower(): self.waits[p].snapshot() for p in Priority if self.waits[p].total},
+            "limits": {
+                "requests_per_minute": self.requests.rate * 60,
+                "tokens_per_minute": self.tokens.rate * 60,
+                "max_concurrency": self.max_concurrency
+            },
+            "paused": time.time() < self.paused_until
+        }
+
+
+def limiter_for(name: str) -> ProviderLimiter:
+    """Limiter configured from LLM_RPM / LLM_TPM / LLM_PROVIDER_CONCURRENCY (or their _<NAME> overrides)."""
+    def setting(key: str, default: str) -> str:
+        return os.environ.get(f"{key}_{name.upper()}", os.environ.get(key, default))
+
+    return ProviderLimiter(
+        name,
+        requests_per_minute=float(setting("LLM_RPM", "300")),
+        tokens_per_minute=float(setting("LLM_TPM", "200000")),
+        max_concurrency=int(setting("LLM_PROVIDER_CONCURRENCY", "32")),
+        queue_timeout=float(setting("LLM_QUEUE_TIMEOUT", "60"))
+    )
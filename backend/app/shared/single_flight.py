@@ -0,0 +1,136 @@
+"""
+Single-Flight Request Coalescing
+Concurrent callers asking for the same key share one in-flight call.
+
+The first caller (the leader) runs the work; everyone who arrives with the
+same key while it is running waits and receives the leader's result (or
+its exception). Nothing is remembered once the call finishes, so this
+complements the completion cache rather than replacing it.
+"""
+import os
+import asyncio
+import hashlib
+from threading import Lock, Event
+from typing import Dict, Any, Callable, Awaitable
+
+
+def flight_key(*parts: Any) -> str:
+    """Compact key for arbitrary (possibly long) string parts."""
+    raw = "\x1f".join(str(p) for p in parts)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _Call:
+    """One in-flight blocking call."""
+
+    def __init__(self):
+        self.done = Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self, enabled: bool = True):
+        """
+        Initialize single-flight group.
+
+        Args:
+            enabled: Master switch (disabled = every caller runs its own call)
+        """
+        self.enabled = enabled
+        self.lock = Lock()
+        self.calls: Dict[str, _Call] = {}
+        self.tasks: Dict[tuple, asyncio.Future] = {}  # (loop id, key) -> leader future
+        self.counters = {"leaders": 0, "shared": 0, "errors": 0}
+
+    # ============================================
+    # BLOCKING
+    # ============================================
+
+    def do(self, key: str, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Run fn(*args, **kwargs) once per key across concurrent threads.
+
+        Args:
+            key: Identity of the work (callers with equal keys share the result)
+            fn: Callable producing the result
+
+        Returns:
+            The leader's return value (exceptions are re-raised to every caller)
+        """
+        if not self.enabled:
+            return fn(*args, **kwargs)
+
+        with self.lock:
+            call = self.calls.get(key)
+            if call is None:
+                call = self.calls[key] = _Call()
+                leader = True
+                self.counters["leaders"] += 1
+            else:
+                call.waiters += 1
+                leader = False
+                self.counters["shared"] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            self.counters["errors"] += 1
+            raise
+        finally:
+            with self.lock:
+                self.calls.pop(key, None)
+            call.done.set()
+
+    # ============================================
+    # ASYNC
+    # ============================================
+
+    async def ado(self, key: str, fn: Callable[..., Awaitable], *args, **kwargs) -> Any:
+        """
+        Awaitable do(): fn is a coroutine function run once per key per event loop.
+
+        Waiters are shielded, so a cancelled request does not cancel the shared
+        call for everyone else.
+        """
+        if not self.enabled:
+            return await fn(*args, **kwargs)
+
+        loop = asyncio.get_running_loop()
+        task_key = (id(loop), key)
+        task = self.tasks.get(task_key)
+        if task is None:
+            task = loop.create_task(fn(*args, **kwargs))
+            self.tasks[task_key] = task
+            self.counters["leaders"] += 1
+
+            def _release(finished):
+                if self.tasks.get(task_key) is finished:
+                    del self.tasks[task_key]
+                if not finished.cancelled() and finished.exception() is not None:
+                    self.counters["errors"] += 1
+
+            task.add_done_callback(_release)
+        else:
+            self.counters["shared"] += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            **self.counters,
+            "in_flight": len(self.calls) + len(self.tasks)
+        }
+
+
+# Singleton instance
+single_flight = SingleFlight(enabled=os.environ.get("SINGLE_FLIGHT", "true").lower() == "true")
@@ -0,0 +1,81 @@
+
+import sys
+import os
+import time
+import random
+import argparse
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.rag.chunker import Chunker
+
+WORDS = (
+    "algorithm data structure memory process thread network packet variable function "
+    "recursion iteration compiler interpreter database index query transaction schema "
+    "gradient matrix vector probability distribution hypothesis experiment evidence "
+    "the a of and to in is that for it as with was on be by this are from or an which"
+).split()
+
+
+def synthetic_textbook(chars: int, seed: int = 0) -> str:
+    """Deterministic textbook-like prose: sentences of 8-30 words, paragraphs of 3-8 sentences."""
+    rng = random.Random(seed)
+    paragraphs, size = [], 0
+    while size < chars:
+        sentences = []
+        for _ in range(rng.randint(3, 8)):
+            words = [rng.choice(WORDS) for _ in range(rng.randint(8, 30))]
+            sentences.append(" ".join(words).capitalize() + rng.choice(".!?"))
+        paragraph = " ".join(sentences)
+        paragraphs.append(paragraph)
+        size += len(paragraph) + 2
+    return "\n\n".join(paragraphs)
+
+
+def run(engine: str, text: str, repeats: int, calibration: str):
+    chunker = Chunker(engine=engine)
+    if engine == "estimate":
+        chunker.calibrate([calibration])
+    if engine == "fast" and chunker.tokenizer:
+        chunker._token_byte_lengths()  # one-off vocabulary table, not per document
+
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        chunks = chunker.chunk_text(text)
+        best = min(best, time.perf_counter() - start)
+    return chunker, chunks, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark chunker engines on a large textbook.")
+    parser.add_argument("--file", help="Text file to chunk (default: synthetic textbook)")
+    parser.add_argument("--chars", type=int, default=2_000_000, help="Synthetic textbook size")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, 'r', encoding='utf-8') as f:
+            text = f.read()
+    else:
+        text = synthetic_textbook(args.chars)
+
+    print(f"--- Chunker Benchmark ({len(text):,} chars) ---")
+    results = {}
+    for engine in ("exact", "fast", "estimate"):
+        chunker, chunks, seconds = run(engine, text, args.repeats, text[:50_000])
+        results[engine] = seconds
+        tokens = sum(c["tokens"] for c in chunks)
+        line = f"{engine:>8}: {seconds * 1000:9.1f} ms  {len(chunks):6d} chunks  {tokens:9d} tokens"
+        if engine != "exact":
+            line += f"  speedup x{results['exact'] / seconds:.1f}"
+        if engine == "estimate" and chunker.tokenizer:
+            actual = sum(chunker.count_tokens(c["text"]) for c in chunks)
+            line += f"  token error {abs(tokens - actual) / max(actual, 1):.1%} (ratio {chunker.chars_per_token:.2f})"
+        print(line)
+
+    if not Chunker().tokenizer:
+        print("[WARN] tiktoken encoding unavailable: exact/fast engines fell back to estimates.")
+
+
+if __name__ == "__main__":
+    main()
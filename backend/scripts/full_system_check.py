@@ -5,7 +5,7 @@ import asyncio
 import json
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from app.core.database import SessionLocal, User, Course, Enrollment, AISession, ResearchResult, GeneratedContent, Base, engine
+from app.core.database import SessionLocal, User, Course, Enrollment, AISession, AIMessage, ResearchResult, GeneratedContent, Base, engine
 from app.features.courses.service import course_service
 from app.features.ai_tutor.session_service import ai_session_service
 from app.features.research.service import research_service
@@ -74,7 +74,7 @@ async def run_full_check():
         db_session = db.query(AISession).filter_by(session_id=session_id).first()
         if db_session:
             print_pass(f"AI Session persisted (ID: {session_id})")
-            msgs = json.loads(db_session.messages_json)
+            msgs = db.query(AIMessage).filter_by(session_id=session_id).all()
             if len(msgs) == 2:
                 print_pass(f"Message history persisted correctly ({len(msgs)} messages).")
             else:
@@ -0,0 +1,89 @@
+import sys
+import os
+import json
+import datetime
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import inspect, text
+from app.core.database import engine, SessionLocal, AISession, AIMessage
+
+# Copies AISession.messages_json blobs into one ai_messages row per message.
+# The legacy blob is kept. Run this before deploying the ai_messages code;
+# if it runs later, blob messages are merged ahead of rows written since
+# (those rows are renumbered after them). Re-running is a no-op.
+
+def _timestamp(value):
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return datetime.datetime.utcnow()
+
+def _already_migrated(rows, messages):
+    """True when the first rows are exactly the blob messages."""
+    if len(rows) < len(messages):
+        return False
+    return all(
+        row.role == msg.get("role") and row.content == msg.get("content", "")
+        for row, msg in zip(rows, messages)
+    )
+
+def migrate():
+    print(f"Migrating ai_sessions on {engine.url.get_backend_name()}...")
+    AIMessage.__table__.create(bind=engine, checkfirst=True)
+
+    existing = {c["name"] for c in inspect(engine).get_columns("ai_sessions")}
+    with engine.begin() as conn:
+        if "message_count" in existing:
+            print("'message_count' column already exists.")
+        else:
+            print("Adding 'message_count' column to 'ai_sessions' table...")
+            conn.execute(text("ALTER TABLE ai_sessions ADD COLUMN message_count INTEGER DEFAULT 0"))
+            print("Migration successful: message_count added.")
+
+    db = SessionLocal()
+    try:
+        moved_sessions = moved_messages = merged_sessions = 0
+        sessions = db.query(AISession).filter(AISession.messages_json.isnot(None)).all()
+        for session in sessions:
+            messages = json.loads(session.messages_json or "[]")
+            rows = db.query(AIMessage).filter_by(session_id=session.session_id).order_by(AIMessage.seq).all()
+            if not messages or _already_migrated(rows, messages):
+                continue
+
+            if rows:
+                # Written after deploy: shift them behind the blob history (highest seq first
+                # so the unique (session_id, seq) index never sees a collision)
+                for row in reversed(rows):
+                    row.seq += len(messages)
+                    db.flush()
+                if session.summarized_messages:
+                    # The summary covered the old leading rows; let the compactor rebuild it
+                    session.history_summary = None
+                    session.summarized_messages = 0
+                merged_sessions += 1
+
+            for seq, msg in enumerate(messages):
+                db.add(AIMessage(
+                    session_id=session.session_id,
+                    seq=seq,
+                    role=msg.get("role"),
+                    content=msg.get("content", ""),
+                    web_scraped=bool(msg.get("web_scraped", False)),
+                    timestamp=_timestamp(msg.get("timestamp"))
+                ))
+            session.message_count = len(messages) + len(rows)
+            db.commit()
+            moved_sessions += 1
+            moved_messages += len(messages)
+
+        db.query(AISession).filter(AISession.message_count.is_(None)).update(
+            {"message_count": 0}, synchronize_session=False
+        )
+        db.commit()
+        print(f"Migration successful: {moved_messages} messages from {moved_sessions} sessions copied to ai_messages "
+              f"({merged_sessions} merged ahead of newer rows).")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    migrate()
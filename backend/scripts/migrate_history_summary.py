@@ -0,0 +1,30 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import inspect, text
+from app.core.database import engine
+
+# Rolling conversation summaries on ai_sessions (history compaction)
+COLUMNS = {
+    "history_summary": "TEXT",
+    "summarized_messages": "INTEGER DEFAULT 0"
+}
+
+def migrate():
+    print(f"Migrating ai_sessions on {engine.url.get_backend_name()}...")
+    existing = {c["name"] for c in inspect(engine).get_columns("ai_sessions")}
+
+    with engine.begin() as conn:
+        for column, definition in COLUMNS.items():
+            if column in existing:
+                print(f"'{column}' column already exists.")
+                continue
+            print(f"Adding '{column}' column to 'ai_sessions' table...")
+            conn.execute(text(f"ALTER TABLE ai_sessions ADD COLUMN {column} {definition}"))
+            print(f"Migration successful: {column} added.")
+
+        conn.execute(text("UPDATE ai_sessions SET summarized_messages = 0 WHERE summarized_messages IS NULL"))
+
+if __name__ == "__main__":
+    migrate()
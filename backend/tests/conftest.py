@@ -0,0 +1,15 @@
+"""
+Test Configuration
+Points the app at a throwaway SQLite database before anything imports it.
+"""
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# Empty DB_* vars keep a developer .env from pointing the tests at MySQL
+for var in ("DB_USER", "DB_PASSWORD", "DB_HOST"):
+    os.environ[var] = ""
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='msu-tests-'), 'test.db')}"
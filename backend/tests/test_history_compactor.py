@@ -0,0 +1,62 @@
+"""
+History Compactor Tests
+window_start() must let storage-backed callers reproduce render() exactly.
+"""
+import pytest
+
+from app.shared.history_compactor import HistoryCompactor
+
+
+@pytest.fixture
+def compactor():
+    compactor = HistoryCompactor(keep_messages=4, batch_messages=3, max_pending=3, pending_chars=10, workers=1)
+    yield compactor
+    compactor.executor.shutdown(wait=False)
+
+
+def _messages(count):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": f"message number {i}"} for i in range(count)]
+
+
+def test_short_history_is_verbatim(compactor):
+    assert compactor.window_start(3, 0) == 0
+    assert compactor.render(_messages(3)) == (
+        "[STUDENT] message number 0\n[MUSA] message number 1\n[STUDENT] message number 2\n"
+    )
+
+
+def test_unsummarised_messages_are_truncated_and_bounded(compactor):
+    # 10 messages, none summarised: tail is 6..9, pending is capped at 3 (3..5)
+    assert compactor.window_start(10, 0) == 3
+    lines = compactor.render(_messages(10)).splitlines()
+    assert lines[0] == "[MUSA] message nu..."
+    assert len(lines) == 3 + 4
+    assert lines[-1] == "[MUSA] message number 9"
+
+
+def test_summary_replaces_covered_messages(compactor):
+    assert compactor.window_start(10, 5) == 5
+    lines = compactor.render(_messages(10), "Talked about loops.", 5).splitlines()
+    assert lines[0] == "[EARLIER IN THIS SESSION] Talked about loops."
+    assert lines[1] == "[MUSA] message nu..."  # message 5: aged out, not yet summarised
+    assert len(lines) == 1 + 1 + 4
+
+
+def test_summary_never_hides_the_verbatim_tail(compactor):
+    # A summary that ran ahead of the tail still leaves the last keep_messages verbatim
+    assert compactor.window_start(10, 9) == 6
+
+
+@pytest.mark.parametrize("total,summarized", [(0, 0), (5, 0), (10, 0), (10, 4), (10, 6), (20, 7), (20, 16)])
+def test_window_slice_renders_like_full_history(compactor, total, summarized):
+    messages = _messages(total)
+    start = compactor.window_start(total, summarized)
+    assert compactor.render(messages[start:], "S", max(0, summarized - start)) == \
+        compactor.render(messages, "S", summarized)
+
+
+def test_due_after_a_full_batch_ages_out(compactor):
+    assert not compactor.due(6, 0)
+    assert compactor.due(7, 0)
+    assert not compactor.due(9, 3)
+    assert compactor.due(10, 3)
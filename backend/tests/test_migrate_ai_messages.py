@@ -0,0 +1,140 @@
+"""
+Migration Tests
+scripts/migrate_ai_messages.py: blob copy, merge ahead of post-deploy rows, re-runs.
+"""
+import os
+import json
+import importlib.util
+
+import pytest
+
+from app.core.database import SessionLocal, AISession, AIMessage, User
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts", "migrate_ai_messages.py")
+
+
+def _load_script():
+    spec = importlib.util.spec_from_file_location("migrate_ai_messages", SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+migration = _load_script()
+
+
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    db.query(AIMessage).delete()
+    db.query(AISession).delete()
+    db.commit()
+    yield db
+    db.close()
+
+
+def _blob(*contents):
+    return json.dumps([
+        {"role": "user" if i % 2 == 0 else "assistant", "content": c, "timestamp": "2024-01-01T10:00:00"}
+        for i, c in enumerate(contents)
+    ])
+
+
+def _user_id(db):
+    user = db.query(User).filter_by(username="migration").first()
+    if user is None:
+        user = User(username="migration", first_name="Mig", last_name="Ration", full_name="Mig Ration",
+                    email="migration@example.com", hashed_password="x", role="student")
+        db.add(user)
+        db.commit()
+    return user.id
+
+
+def _session(db, session_id, blob, **fields):
+    session = AISession(session_id=session_id, user_id=_user_id(db), mode="chat", messages_json=blob, **fields)
+    db.add(session)
+    db.commit()
+    return session
+
+
+def _rows(session_id):
+    db = SessionLocal()
+    try:
+        return [(m.seq, m.content) for m in db.query(AIMessage).filter_by(session_id=session_id).order_by(AIMessage.seq)]
+    finally:
+        db.close()
+
+
+def _state(session_id):
+    db = SessionLocal()
+    try:
+        s = db.query(AISession).filter_by(session_id=session_id).one()
+        return s.message_count, s.summarized_messages, s.history_summary, s.messages_json
+    finally:
+        db.close()
+
+
+def test_copies_blob_into_rows(db):
+    blob = _blob("hi", "hello", "what is a loop?")
+    _session(db, "s-copy", blob)
+
+    migration.migrate()
+
+    assert _rows("s-copy") == [(0, "hi"), (1, "hello"), (2, "what is a loop?")]
+    count, _, _, kept = _state("s-copy")
+    assert count == 3
+    assert kept == blob  # legacy blob stays for rollback
+
+
+def test_merges_blob_ahead_of_rows_written_after_deploy(db):
+    _session(db, "s-merge", _blob("old 1", "old 2", "old 3"),
+             message_count=2, summarized_messages=2, history_summary="summary of new 1-2")
+    db.add_all([
+        AIMessage(session_id="s-merge", seq=0, role="user", content="new 1"),
+        AIMessage(session_id="s-merge", seq=1, role="assistant", content="new 2"),
+    ])
+    db.commit()
+
+    migration.migrate()
+
+    assert _rows("s-merge") == [(0, "old 1"), (1, "old 2"), (2, "old 3"), (3, "new 1"), (4, "new 2")]
+    count, summarized, summary, _ = _state("s-merge")
+    assert count == 5
+    # The summary described the rows that are no longer leading; the compactor rebuilds it
+    assert (summarized, summary) == (0, None)
+
+
+def test_rerun_is_a_no_op(db):
+    _session(db, "s-rerun", _blob("a", "b"))
+    migration.migrate()
+    db.add(AIMessage(session_id="s-rerun", seq=2, role="user", content="c"))
+    db.query(AISession).filter_by(session_id="s-rerun").update({"message_count": 3})
+    db.commit()
+
+    migration.migrate()
+
+    assert _rows("s-rerun") == [(0, "a"), (1, "b"), (2, "c")]
+    assert _state("s-rerun")[0] == 3
+
+
+def test_shift_never_collides_on_the_unique_seq_index(db):
+    # Shifting by fewer positions than there are rows must go highest seq first
+    _session(db, "s-shift", _blob("old"), message_count=3)
+    db.add_all([AIMessage(session_id="s-shift", seq=i, role="user", content=f"new {i}") for i in range(3)])
+    db.commit()
+
+    migration.migrate()
+
+    assert _rows("s-shift") == [(0, "old"), (1, "new 0"), (2, "new 1"), (3, "new 2")]
+    assert _state("s-shift")[0] == 4
+
+
+def test_already_migrated_compares_leading_rows():
+    class Row:
+        def __init__(self, role, content):
+            self.role, self.content = role, content
+
+    messages = [{"role": "user", "content": "a"}, {"role": "assistant", "content": "b"}]
+    assert migration._already_migrated([Row("user", "a"), Row("assistant", "b"), Row("user", "c")], messages)
+    assert not migration._already_migrated([Row("user", "a")], messages)
+    assert not migration._already_migrated([Row("user", "x"), Row("assistant", "b")], messages)
@@ -0,0 +1,116 @@
+"""
+Rate Limiter Tests
+Priority grants, concurrency slots, timeouts and cancelled waiters.
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.shared.rate_limiter import ProviderLimiter, Priority, RateLimitTimeout
+
+
+def _wait_until(predicate, timeout=2.0):
+    deadline = time.time() + timeout
+    while not predicate():
+        assert time.time() < deadline, "condition not reached"
+        time.sleep(0.005)
+
+
+def test_grants_immediately_within_budget():
+    limiter = ProviderLimiter("test", requests_per_minute=60, max_concurrency=2)
+    with limiter.slot(10):
+        assert limiter.in_flight == 1
+        assert not limiter.backlogged()
+    assert limiter.in_flight == 0
+    assert limiter.counters["granted"] == 1
+    assert limiter.counters["queued"] == 0
+
+
+def test_released_slot_goes_to_highest_priority_waiter():
+    limiter = ProviderLimiter("test", max_concurrency=1)
+    limiter.acquire(1)
+    order = []
+
+    def worker(priority):
+        limiter.acquire(1, priority)
+        order.append(priority)
+        limiter.release()
+
+    background = threading.Thread(target=worker, args=(Priority.BACKGROUND,))
+    background.start()
+    _wait_until(lambda: limiter.depth[Priority.BACKGROUND] == 1)
+    interactive = threading.Thread(target=worker, args=(Priority.INTERACTIVE,))
+    interactive.start()
+    _wait_until(lambda: limiter.depth[Priority.INTERACTIVE] == 1)
+
+    limiter.release()
+    background.join(2)
+    interactive.join(2)
+
+    assert order == [Priority.INTERACTIVE, Priority.BACKGROUND]
+    assert limiter.in_flight == 0
+    assert limiter.counters["queued"] == 2
+
+
+def test_timeout_withdraws_waiter():
+    limiter = ProviderLimiter("test", max_concurrency=1, queue_timeout=0.05)
+    limiter.acquire(1)
+
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire(1)
+
+    assert limiter.counters["timeouts"] == 1
+    assert limiter.depth[Priority.CHAT] == 0
+    limiter.release()
+    assert limiter.in_flight == 0
+    assert not limiter.backlogged()
+
+
+def test_request_budget_queues_until_refill():
+    limiter = ProviderLimiter("test", requests_per_minute=60, queue_timeout=0.01)
+    limiter.requests.tokens = 0  # bucket drained; next token in ~1s
+
+    assert limiter.backlogged()
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire(1)
+
+
+def test_cancelled_async_waiter_frees_its_place():
+    async def scenario():
+        limiter = ProviderLimiter("test", max_concurrency=1)
+        await limiter.aacquire(1)
+
+        waiter = asyncio.ensure_future(limiter.aacquire(1))
+        await asyncio.sleep(0.02)
+        assert limiter.depth[Priority.CHAT] == 1
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+        assert limiter.depth[Priority.CHAT] == 0
+        limiter.release()
+        assert limiter.in_flight == 0
+        # The cancelled waiter is skipped, not granted a slot nobody will release
+        await asyncio.wait_for(limiter.aacquire(1), 1)
+        assert limiter.in_flight == 1
+
+    asyncio.run(scenario())
+
+
+def test_cancel_after_grant_returns_the_slot():
+    async def scenario():
+        limiter = ProviderLimiter("test", max_concurrency=1)
+        await limiter.aacquire(1)
+
+        waiter = asyncio.ensure_future(limiter.aacquire(1))
+        await asyncio.sleep(0.02)
+        limiter.release()  # grants the queued waiter from this thread...
+        waiter.cancel()    # ...which is cancelled before it resumes
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+        assert limiter.in_flight == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,93 @@
+"""
+Segment Store Tests
+Tombstones, tier merges and compaction of the memory-mapped vector fallback.
+"""
+import numpy as np
+
+from app.core.rag.segment_store import SegmentStore
+
+
+def _docs(start, count):
+    return [{"id": f"d{i}", "text": f"text {i}", "metadata": {"n": i}} for i in range(start, start + count)]
+
+
+def _vectors(start, count, dim=4):
+    return np.arange(start * dim, (start + count) * dim, dtype=np.float32).reshape(count, dim)
+
+
+def _store(tmp_path, **kwargs):
+    kwargs.setdefault("max_deleted_ratio", 1.0)  # compaction only when a test asks for it
+    return SegmentStore(str(tmp_path), **kwargs)
+
+
+def test_delete_tombstones_rows_without_renumbering(tmp_path):
+    store = _store(tmp_path)
+    store.append(_docs(0, 3), _vectors(0, 3))
+    store.append(_docs(3, 3), _vectors(3, 3))
+
+    assert store.delete(["d1", "d4", "missing"]) == 2
+    assert store.deleted == {1, 4}
+    assert (store.count(), store.live_count()) == (6, 4)
+    assert not store.has_id("d1")
+    assert store.read_record(5)["id"] == "d5"
+    assert store.generation == 0
+
+    # Deleting again is a no-op
+    assert store.delete(["d1"]) == 0
+
+
+def test_tombstones_survive_reload(tmp_path):
+    store = _store(tmp_path)
+    store.append(_docs(0, 3), _vectors(0, 3))
+    store.append(_docs(3, 3), _vectors(3, 3))
+    store.delete(["d0", "d5"])
+
+    reopened = _store(tmp_path)
+    assert reopened.deleted == {0, 5}
+    assert reopened._segment_deleted() == [[0], [2]]
+    assert reopened.documents[3]["id"] == "d3"
+    assert not reopened.has_id("d5")
+
+
+def test_tier_merge_keeps_tombstones_and_row_ids(tmp_path):
+    store = _store(tmp_path, merge_factor=2)
+    store.append(_docs(0, 2), _vectors(0, 2))
+    store.delete(["d1"])
+    store.append(_docs(2, 2), _vectors(2, 2))  # second same-tier segment triggers a merge
+
+    assert len(store.segments) == 1
+    assert store.deleted == {1}
+    assert store._segment_deleted() == [[1]]
+    assert [store.read_record(r)["id"] for r in range(4)] == ["d0", "d1", "d2", "d3"]
+    np.testing.assert_array_equal(store.gather(np.array([3])), _vectors(3, 1))
+    assert store.generation == 0
+
+
+def test_compact_drops_tombstones_and_bumps_generation(tmp_path):
+    store = _store(tmp_path, merge_factor=8)
+    store.append(_docs(0, 3), _vectors(0, 3))
+    store.append(_docs(3, 3), _vectors(3, 3))
+    store.delete(["d1", "d3"])
+
+    store.compact()
+
+    assert len(store.segments) == 1
+    assert store.deleted == set()
+    assert store.generation == 1
+    assert [doc["id"] for doc in store.documents] == ["d0", "d2", "d4", "d5"]
+    np.testing.assert_array_equal(store.vectors(), _vectors(0, 6)[[0, 2, 4, 5]])
+    assert store.id_rows["d4"] == [2]
+
+    reopened = _store(tmp_path)
+    assert (reopened.generation, reopened.count(), reopened.deleted) == (1, 4, set())
+
+
+def test_delete_past_ratio_compacts(tmp_path):
+    store = _store(tmp_path, max_deleted_ratio=0.25)
+    store.append(_docs(0, 4), _vectors(0, 4))
+
+    store.delete(["d0"])
+    assert store.count() == 4  # exactly at the ratio: tombstoned only
+    store.delete(["d1"])
+    assert (store.count(), store.generation) == (2, 1)
+    assert [doc["id"] for doc in store.documents] == ["d2", "d3"]
@@ -0,0 +1,123 @@
+"""
+Single-Flight Tests
+Concurrent callers with one key share a single call, its result and its error.
+"""
+import asyncio
+import threading
+
+import pytest
+
+from app.shared.single_flight import SingleFlight, flight_key
+
+
+def test_concurrent_threads_share_one_call():
+    group = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        started.set()
+        release.wait(2)
+        return "result"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(group.do("k", work)))
+    leader.start()
+    started.wait(2)
+    followers = [threading.Thread(target=lambda: results.append(group.do("k", work))) for _ in range(3)]
+    for t in followers:
+        t.start()
+    while group.counters["shared"] < 3:
+        pass
+    release.set()
+    for t in [leader] + followers:
+        t.join(2)
+
+    assert calls == [1]
+    assert results == ["result"] * 4
+    assert group.counters == {"leaders": 1, "shared": 3, "errors": 0}
+    assert group.stats()["in_flight"] == 0
+
+
+def test_error_reaches_every_caller_and_is_not_remembered():
+    group = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def fail():
+        started.set()
+        release.wait(2)
+        raise ValueError("boom")
+
+    errors = []
+
+    def call():
+        try:
+            group.do("k", fail)
+        except ValueError as e:
+            errors.append(str(e))
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(2)
+    follower = threading.Thread(target=call)
+    follower.start()
+    while group.counters["shared"] < 1:
+        pass
+    release.set()
+    leader.join(2)
+    follower.join(2)
+
+    assert errors == ["boom", "boom"]
+    assert group.counters["errors"] == 1
+    assert group.do("k", lambda: "fresh") == "fresh"
+
+
+def test_async_callers_share_one_task():
+    group = SingleFlight()
+    calls = []
+
+    async def work(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return value * 2
+
+    async def scenario():
+        return await asyncio.gather(*(group.ado("k", work, 21) for _ in range(5)))
+
+    assert asyncio.run(scenario()) == [42] * 5
+    assert calls == [21]
+    assert group.counters["shared"] == 4
+    assert group.stats()["in_flight"] == 0
+
+
+def test_cancelled_async_waiter_does_not_cancel_the_call():
+    group = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def scenario():
+        first = asyncio.ensure_future(group.ado("k", work))
+        second = asyncio.ensure_future(group.ado("k", work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(scenario()) == "done"
+
+
+def test_disabled_runs_every_call():
+    group = SingleFlight(enabled=False)
+    calls = []
+    group.do("k", calls.append, 1)
+    group.do("k", calls.append, 2)
+    assert calls == [1, 2]
+
+
+def test_flight_key_separates_parts():
+    assert flight_key("ab", "c") != flight_key("a", "bc")
+    assert flight_key("a", 1) == flight_key("a", "1")